@@ -0,0 +1,491 @@
+"""Background delivery of emergency alerts
+
+AlertDispatcher queues alerts and delivers them from a small pool of worker
+threads, so the frame loop never waits for a mail server or SMS gateway.
+Each channel ("email", "sms", "http") has its own transport and timeout,
+failed deliveries are retried with exponential backoff, and the same alert
+is not sent twice within the deduplication window.
+
+Transports keep their connections open between alerts. The fake servers at
+the bottom of this module accept SMTP and HTTP on localhost and record what
+they receive, so delivery can be exercised without real accounts.
+"""
+import collections
+import http.client
+import http.server
+import json
+import os
+import queue
+import smtplib
+import socketserver
+import threading
+import time
+import urllib.parse
+from email.mime.text import MIMEText
+
+from instrumentation import LatencyHistogram
+
+Alert = collections.namedtuple("Alert", "channel recipient subject body")
+
+# Errors that mean a pooled connection was closed by the server while idle
+STALE_CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, http.client.RemoteDisconnected,
+                           http.client.CannotSendRequest, ConnectionError)
+
+
+class ConnectionPool:
+    """Idle connections kept open for reuse, at most `size` of them"""
+
+    def __init__(self, connect, close, size=2):
+        self.connect = connect
+        self.close_connection = close
+        self.idle = queue.LifoQueue(maxsize=size)
+
+    def acquire(self, timeout):
+        """Return (connection, reused), opening a new one if none is idle"""
+        try:
+            return self.idle.get_nowait(), True
+        except queue.Empty:
+            return self.connect(timeout), False
+
+    def release(self, connection):
+        try:
+            self.idle.put_nowait(connection)
+        except queue.Full:
+            self.discard(connection)
+
+    def discard(self, connection):
+        try:
+            self.close_connection(connection)
+        except Exception:
+            pass
+
+    def close(self):
+        while True:
+            try:
+                self.discard(self.idle.get_nowait())
+            except queue.Empty:
+                return
+
+
+class PooledTransport:
+    """Base class for transports that deliver over a pooled connection
+
+    Subclasses implement connect(timeout), close_connection(connection),
+    set_timeout(connection, timeout) and deliver(connection, alert). A
+    reused connection that turns out to be closed is replaced once before
+    the error is reported.
+    """
+
+    def __init__(self, pool_size=2):
+        self.pool = ConnectionPool(self.connect, self.close_connection, pool_size)
+
+    def send(self, alert, timeout):
+        connection, reused = self.pool.acquire(timeout)
+        while True:
+            try:
+                self.set_timeout(connection, timeout)
+                self.deliver(connection, alert)
+            except STALE_CONNECTION_ERRORS:
+                self.pool.discard(connection)
+                if not reused:
+                    raise
+                connection, reused = self.connect(timeout), False
+                continue
+            except Exception:
+                self.pool.discard(connection)
+                raise
+            self.pool.release(connection)
+            return
+
+    def close(self):
+        self.pool.close()
+
+
+class SMTPTransport(PooledTransport):
+    """Send alerts as plain text email over SMTP"""
+
+    def __init__(self, host, port=587, sender="drowsiness-detector@localhost",
+                 username=None, password=None, use_tls=False, pool_size=2):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        super().__init__(pool_size)
+
+    def connect(self, timeout):
+        connection = smtplib.SMTP(self.host, self.port, timeout=timeout)
+        if self.use_tls:
+            connection.starttls()
+        if self.username:
+            connection.login(self.username, self.password)
+        return connection
+
+    def close_connection(self, connection):
+        connection.quit()
+
+    def set_timeout(self, connection, timeout):
+        if connection.sock is not None:
+            connection.sock.settimeout(timeout)
+
+    def deliver(self, connection, alert):
+        message = MIMEText(alert.body)
+        message["Subject"] = alert.subject
+        message["From"] = self.sender
+        message["To"] = alert.recipient
+        connection.send_message(message)
+
+
+class HTTPTransport(PooledTransport):
+    """POST alerts as JSON to a webhook over keep-alive connections"""
+
+    def __init__(self, url, headers=None, pool_size=2):
+        parts = urllib.parse.urlsplit(url)
+        self.https = parts.scheme == "https"
+        self.host = parts.hostname
+        self.port = parts.port
+        self.path = parts.path or "/"
+        self.headers = {"Content-Type": "application/json", **(headers or {})}
+        super().__init__(pool_size)
+
+    def connect(self, timeout):
+        connection_class = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        return connection_class(self.host, self.port, timeout=timeout)
+
+    def close_connection(self, connection):
+        connection.close()
+
+    def set_timeout(self, connection, timeout):
+        connection.timeout = timeout
+        if connection.sock is not None:
+            connection.sock.settimeout(timeout)
+
+    def deliver(self, connection, alert):
+        body = json.dumps(alert._asdict()).encode("utf-8")
+        connection.request("POST", self.path, body=body, headers=self.headers)
+        response = connection.getresponse()
+        response.read()
+        if response.status >= 300:
+            raise RuntimeError(f"HTTP {response.status} from {self.host}")
+
+
+class TwilioTransport:
+    """Send alerts as SMS through Twilio, reusing one HTTP session"""
+
+    def __init__(self, account_sid, auth_token, from_number):
+        self.account_sid = account_sid
+        self.auth_token = auth_token
+        self.from_number = from_number
+        self.client = None
+
+    def send(self, alert, timeout):
+        if self.client is None:
+            from twilio.http.http_client import TwilioHttpClient
+            from twilio.rest import Client
+            self.client = Client(self.account_sid, self.auth_token,
+                                 http_client=TwilioHttpClient(pool_connections=True))
+        self.client.http_client.timeout = timeout
+        self.client.messages.create(body=alert.body, from_=self.from_number, to=alert.recipient)
+
+    def close(self):
+        pass
+
+
+class ConsoleTransport:
+    """Print alerts instead of sending them, for demonstration"""
+
+    def send(self, alert, timeout):
+        print(f"Simulating sending {alert.channel} to {alert.recipient}")
+        if alert.subject:
+            print(f"Subject: {alert.subject}")
+        print(f"Message: {alert.body}")
+
+    def close(self):
+        pass
+
+
+def default_transports():
+    """Real transports where configured through the environment, else console
+
+    SMTP is used when DROWSINESS_SMTP_HOST is set (with optional
+    DROWSINESS_SMTP_PORT, _USER, _PASSWORD, _SENDER and _TLS), Twilio when
+    TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN and TWILIO_FROM_NUMBER are set.
+    """
+    env = os.environ
+    transports = {"email": ConsoleTransport(), "sms": ConsoleTransport()}
+    if env.get("DROWSINESS_SMTP_HOST"):
+        transports["email"] = SMTPTransport(
+            env["DROWSINESS_SMTP_HOST"], int(env.get("DROWSINESS_SMTP_PORT", 587)),
+            sender=env.get("DROWSINESS_SMTP_SENDER", "drowsiness-detector@localhost"),
+            username=env.get("DROWSINESS_SMTP_USER"), password=env.get("DROWSINESS_SMTP_PASSWORD"),
+            use_tls=env.get("DROWSINESS_SMTP_TLS", "1") == "1")
+    if env.get("TWILIO_ACCOUNT_SID") and env.get("TWILIO_AUTH_TOKEN") and env.get("TWILIO_FROM_NUMBER"):
+        transports["sms"] = TwilioTransport(env["TWILIO_ACCOUNT_SID"], env["TWILIO_AUTH_TOKEN"],
+                                            env["TWILIO_FROM_NUMBER"])
+    return transports
+
+
+class ChannelStats:
+    """Delivery counters and latency of one channel"""
+
+    def __init__(self):
+        self.submitted = 0
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.dropped = 0
+        self.deduplicated = 0
+        self.latency = LatencyHistogram(window=200)
+
+    def summary(self):
+        p50 = self.latency.percentile(50)
+        p95 = self.latency.percentile(95)
+        return {
+            "submitted": self.submitted,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retries": self.retries,
+            "dropped": self.dropped,
+            "deduplicated": self.deduplicated,
+            "latency_p50_ms": None if p50 is None else round(p50 * 1000, 1),
+            "latency_p95_ms": None if p95 is None else round(p95 * 1000, 1),
+        }
+
+
+class AlertDispatcher:
+    """Deliver alerts from a bounded queue with a pool of worker threads
+
+    submit() never blocks: when the queue is full the alert is dropped and
+    counted. Workers try each alert up to 1 + retries times, waiting
+    backoff * 2**attempt seconds (capped at max_backoff) between attempts.
+    Alerts with the same channel, recipient and subject are sent at most
+    once per dedup_window seconds. Latency is measured from submit() to
+    successful delivery.
+    """
+
+    def __init__(self, transports, workers=2, queue_size=100, timeouts=None,
+                 retries=3, backoff=1.0, max_backoff=30.0, dedup_window=60.0):
+        self.transports = dict(transports)
+        self.worker_count = workers
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.timeouts = {"email": 10.0, "sms": 10.0, "http": 5.0, **(timeouts or {})}
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.dedup_window = dedup_window
+        self.lock = threading.Lock()
+        self.last_sent = {}
+        self.stats = collections.defaultdict(ChannelStats)
+        self.stop_event = threading.Event()
+        self.threads = []
+
+    def start(self):
+        self.stop_event.clear()
+        self.threads = [threading.Thread(target=self._worker, daemon=True) for _ in range(self.worker_count)]
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        """Deliver what is already queued for up to timeout seconds, then stop"""
+        deadline = time.monotonic() + timeout
+        for _ in self.threads:
+            try:
+                self.queue.put(None, timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Full:
+                break
+        for thread in self.threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        # Abort backoff waits of anything still in flight
+        self.stop_event.set()
+        self.threads = []
+        for transport in self.transports.values():
+            transport.close()
+
+    def submit(self, channel, recipient, subject, body, dedup=True):
+        """Queue an alert, returning False if it was deduplicated or dropped"""
+        if channel not in self.transports:
+            raise ValueError(f"No transport for channel {channel!r}")
+
+        now = time.monotonic()
+        key = (channel, recipient, subject)
+        with self.lock:
+            stats = self.stats[channel]
+            if dedup and now - self.last_sent.get(key, -self.dedup_window) < self.dedup_window:
+                stats.deduplicated += 1
+                return False
+            try:
+                self.queue.put_nowait((Alert(channel, recipient, subject, body), now))
+            except queue.Full:
+                stats.dropped += 1
+                print(f"Alert queue full, dropped {channel} alert to {recipient}")
+                return False
+            stats.submitted += 1
+            if dedup:
+                self.last_sent[key] = now
+        return True
+
+    def pending(self):
+        return self.queue.qsize()
+
+    def metrics(self):
+        """Per channel delivery counts and latency"""
+        with self.lock:
+            return {channel: stats.summary() for channel, stats in self.stats.items()}
+
+    def _worker(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            self._deliver(*item)
+
+    def _deliver(self, alert, submitted):
+        transport = self.transports[alert.channel]
+        timeout = self.timeouts.get(alert.channel, 10.0)
+        for attempt in range(self.retries + 1):
+            try:
+                transport.send(alert, timeout)
+            except Exception as e:
+                print(f"Failed to send {alert.channel} alert to {alert.recipient} "
+                      f"(attempt {attempt + 1}): {e}")
+                if attempt == self.retries:
+                    break
+                with self.lock:
+                    self.stats[alert.channel].retries += 1
+                if self.stop_event.wait(min(self.max_backoff, self.backoff * 2 ** attempt)):
+                    break
+                continue
+            with self.lock:
+                stats = self.stats[alert.channel]
+                stats.sent += 1
+                stats.latency.record(time.monotonic() - submitted)
+            return
+
+        with self.lock:
+            self.stats[alert.channel].failed += 1
+
+
+# Local stand-ins for an SMTP server and an HTTP webhook
+
+class _FakeServer:
+    """Threaded localhost server recording what it receives
+
+    Set fail_next to make that many of the next requests fail.
+    """
+
+    def __init__(self):
+        self.received = []
+        self.fail_next = 0
+        self.connections = 0
+        self.lock = threading.Lock()
+        self.server = None
+
+    def should_fail(self):
+        with self.lock:
+            if self.fail_next:
+                self.fail_next -= 1
+                return True
+            return False
+
+    def record(self, item):
+        with self.lock:
+            self.received.append(item)
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def start(self):
+        self.server.owner = self
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode("ascii") + b"\r\n")
+
+    def handle(self):
+        owner = self.server.owner
+        with owner.lock:
+            owner.connections += 1
+        self.reply("220 localhost fake SMTP")
+        sender, recipients = None, []
+        for raw in self.rfile:
+            command = raw.decode("utf-8", "replace").strip()
+            verb = command[:4].upper()
+            if verb in ("EHLO", "HELO"):
+                self.reply("250 localhost")
+            elif verb == "MAIL":
+                sender, recipients = command[10:].strip("<> "), []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                recipients.append(command[8:].strip("<> "))
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                for line in self.rfile:
+                    if line in (b".\r\n", b".\n"):
+                        break
+                    lines.append(line.decode("utf-8", "replace"))
+                if owner.should_fail():
+                    self.reply("451 Temporary failure")
+                else:
+                    owner.record({"from": sender, "to": recipients, "data": "".join(lines)})
+                    self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("250 OK")
+
+
+class FakeSMTPServer(_FakeServer):
+    """SMTP server on localhost that stores messages in .received"""
+
+    def __init__(self, port=0):
+        super().__init__()
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", port), _SMTPHandler)
+        self.server.daemon_threads = True
+
+
+class _HTTPHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        owner = self.server.owner
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        status = 503 if owner.should_fail() else 200
+        if status == 200:
+            owner.record(json.loads(body or b"null"))
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def setup(self):
+        super().setup()
+        with self.server.owner.lock:
+            self.server.owner.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeHTTPServer(_FakeServer):
+    """Webhook on localhost that stores posted JSON alerts in .received"""
+
+    def __init__(self, port=0):
+        super().__init__()
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", port), _HTTPHandler)
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}/alerts"
@@ -0,0 +1,37 @@
+class AlarmSound:
+    """Looping alarm sound that is loaded in the background
+
+    pygame is imported by load(), not at module import, so importing this
+    module stays cheap. Until loading has finished, or if it failed,
+    play() and stop() do nothing.
+    """
+
+    def __init__(self, path="alarm.wav"):
+        self.path = path
+        self.mixer = None
+        self.error = None
+
+    @property
+    def ready(self):
+        return self.mixer is not None
+
+    def load(self):
+        """Initialise the mixer and load the sound file, returning success"""
+        try:
+            import pygame
+            pygame.mixer.init()
+            pygame.mixer.music.load(self.path)  # Create an alarm.wav file or use any sound file
+        except Exception as e:
+            self.error = e
+            print(f"Could not load alarm sound {self.path}: {e}")
+            return False
+        self.mixer = pygame.mixer
+        return True
+
+    def play(self):
+        if self.mixer is not None:
+            self.mixer.music.play(-1)  # -1 loops the sound
+
+    def stop(self):
+        if self.mixer is not None:
+            self.mixer.music.stop()
@@ -0,0 +1,209 @@
+"""Analyse a recorded video in parallel worker processes
+
+The video is split into frame ranges that workers measure independently
+(face detection, landmarks, EAR and mouth distance). The parent then replays
+the per-frame metrics in order through a single FramePipeline, so the
+consecutive-frame counters carry across chunk boundaries and the episodes
+match a sequential run exactly.
+
+Face tracking does not carry across chunks: every chunk starts with a full
+detection, and the tracked face selection starts over from the largest face.
+With --detect-every above 1 or --face-selection tracked the measured faces,
+and so the episodes, can therefore differ slightly from a sequential run.
+
+Example:
+    python batch_analysis.py recordings/shift.mp4 --workers 4 --output shift_episodes.json
+"""
+import json
+import multiprocessing
+import os
+import time
+
+import cv2
+
+import models
+from detectors import HOG
+from headless import build_parser, configure_pipeline
+from pipeline import (FramePipeline, FrameResult, FaceResult, DROWSY_ALARM_START, DROWSY_ALARM_STOP,
+                      YAWN_ALARM_START, YAWN_ALARM_STOP, FATIGUE_ALARM_START, FATIGUE_ALARM_STOP, EMERGENCY,
+                      TRACKED)
+
+# Pipeline owned by each worker process, created once by init_worker
+_worker_pipeline = None
+
+
+def init_worker(args):
+    global _worker_pipeline
+    _worker_pipeline = configure_pipeline(FramePipeline(args.predictor, load=False), args)
+
+
+def open_at(path, start):
+    """Open a video positioned at frame start"""
+    cap = cv2.VideoCapture(path)
+    if start:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        if int(cap.get(cv2.CAP_PROP_POS_FRAMES)) != start:
+            # Seeking is unreliable for some codecs, skip frames instead
+            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            for _ in range(start):
+                if not cap.grab():
+                    break
+    return cap
+
+
+def measure_chunk(task):
+    """Return (ear, mouth_distance) pairs of every face for a range of frames"""
+    path, start, end = task
+    pipeline = _worker_pipeline
+    # Trackers never carry over between chunks
+    pipeline.reset_tracking()
+
+    cap = open_at(path, start)
+    metrics = []
+    index = start
+    while end is None or index < end:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        result = pipeline.measure(frame, 0.0)
+        metrics.append([(face.ear, face.mouth_distance) for face in result.faces])
+        index += 1
+    cap.release()
+    return metrics
+
+
+def split_frames(frame_count, chunk_frames):
+    """Split a video into (start, end) ranges; the last range reads to the end"""
+    starts = list(range(0, max(frame_count, 1), chunk_frames))
+    return [(start, starts[i + 1] if i + 1 < len(starts) else None)
+            for i, start in enumerate(starts)]
+
+
+class EpisodeCollector:
+    """Turn alarm events from replayed frames into episode records"""
+
+    def __init__(self, fps):
+        self.fps = fps
+        self.episodes = []
+        self.open = {}
+
+    def add(self, index, events):
+        for event in events:
+            if event == DROWSY_ALARM_START:
+                self.start("drowsy", index)
+            elif event == YAWN_ALARM_START:
+                self.start("yawn", index)
+            elif event == DROWSY_ALARM_STOP:
+                self.finish("drowsy", index)
+            elif event == YAWN_ALARM_STOP:
+                self.finish("yawn", index)
+            elif event == FATIGUE_ALARM_START:
+                self.start("fatigue", index)
+            elif event == FATIGUE_ALARM_STOP:
+                self.finish("fatigue", index)
+            elif event == EMERGENCY and "drowsy" in self.open:
+                self.open["drowsy"]["emergency"] = True
+
+    def start(self, kind, index):
+        episode = {"type": kind, "start_frame": index, "end_frame": None,
+                   "start_time": round(index / self.fps, 3), "end_time": None}
+        if kind == "drowsy":
+            episode["emergency"] = False
+        self.open[kind] = episode
+        self.episodes.append(episode)
+
+    def finish(self, kind, index):
+        episode = self.open.pop(kind, None)
+        if episode:
+            episode["end_frame"] = index
+            episode["end_time"] = round(index / self.fps, 3)
+
+    def close(self, index):
+        for kind in list(self.open):
+            self.finish(kind, index)
+
+
+def analyse(path, args, workers, chunk_frames):
+    """Measure a video in parallel and replay the metrics in frame order"""
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise SystemExit(f"Could not open video: {path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+
+    tasks = [(path, start, end) for start, end in split_frames(frame_count, chunk_frames)]
+
+    # Models are only needed in the workers; the parent just replays metrics.
+    # Forked workers inherit models loaded here instead of each reading the file.
+    models.preload_for_workers(args.predictor, args.detector == HOG)
+    replay = configure_pipeline(FramePipeline(predictor_path=None), args)
+    collector = EpisodeCollector(fps)
+    index = 0
+
+    with multiprocessing.Pool(workers, initializer=init_worker, initargs=(args,)) as pool:
+        # imap yields chunks in order, so replay can start while later chunks run
+        for metrics in pool.imap(measure_chunk, tasks):
+            for faces in metrics:
+                result = FrameResult(index / fps)
+                result.faces = [FaceResult(None, None, ear, mouth_distance)
+                                for ear, mouth_distance in faces]
+                replay.update(result)
+                collector.add(index, result.events)
+                index += 1
+
+    collector.close(index)
+    return {
+        "video": path,
+        "fps": fps,
+        "frames": index,
+        "drowsy_episodes": replay.drowsy_episodes,
+        "yawn_episodes": replay.yawn_episodes,
+        "fatigue_episodes": replay.fatigue_episodes,
+        "fatigue": replay.fatigue.summary(),
+        "episodes": collector.episodes,
+    }
+
+
+def main(argv=None):
+    parser = build_parser()
+    parser.description = "Parallel offline drowsiness analysis of a recorded video"
+    parser.add_argument("video", help="video file to analyse")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-frames", type=int, default=900,
+                        help="frames per work unit (default: 900)")
+    parser.add_argument("--output", default=None, help="write the episodes as JSON to this file")
+    args = parser.parse_args(argv)
+    if args.multi_face:
+        # Face IDs are local to each chunk, so per-face state cannot be replayed
+        parser.error("--multi-face is not supported for batch analysis")
+    if args.adaptive_min_fps:
+        # Every frame is measured, and the scheduler would need each result
+        # before deciding on the next frame, which the chunks cannot wait for
+        parser.error("--adaptive-min-fps is not supported for batch analysis")
+    if args.detect_every > 1 or args.face_selection == TRACKED:
+        # Each chunk starts without trackers or a previously monitored face
+        print("Warning: face tracking restarts at every chunk, so with --detect-every above 1 or "
+              "--face-selection tracked the episodes can differ from a sequential run")
+
+    start = time.perf_counter()
+    report = analyse(args.video, args, max(1, args.workers), max(1, args.chunk_frames))
+    elapsed = time.perf_counter() - start
+
+    for episode in report["episodes"]:
+        print(f"{episode['type'].upper():>7}: {episode['start_time']:.1f}s - {episode['end_time']:.1f}s")
+    print(f"Frames analysed: {report['frames']} in {elapsed:.1f}s "
+          f"({report['frames'] / elapsed if elapsed else 0:.1f} fps)")
+    print(f"Drowsy Episodes: {report['drowsy_episodes']}")
+    print(f"Yawn Episodes: {report['yawn_episodes']}")
+    if args.perclos_alarm is not None or args.yawn_rate_alarm is not None:
+        print(f"Fatigue Alerts: {report['fatigue_episodes']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+        print(f"Episodes written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
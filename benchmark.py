@@ -0,0 +1,440 @@
+"""Reproducible throughput benchmark of the detection pipeline
+
+Runs FramePipeline on a fixed set of frames for several resolutions and face
+counts and reports frames/sec, per-stage latency and peak memory. No camera
+is needed: frames are synthesised from a seeded random generator, or built
+by tiling a face photo given with --face-image.
+
+Drawn synthetic faces are not reliably found by the HOG detector, so in
+synthetic mode the detector still runs on every frame (its cost is real) but
+its output is replaced by the known face positions. That keeps the landmark
+and metric stages proportional to the face count.
+
+--allocations checks the steady state of the frame loop instead: frames are
+read into pooled buffers (--reuse-buffers) and processed and annotated
+after a warm-up, and tracemalloc must show no net memory growth per frame.
+The same loop without the pool is measured for comparison.
+
+--cold-start measures startup instead, each in a fresh interpreter: how long
+the headless modules take to import (and that they pull in no GUI or audio
+modules), how long until the models are loaded, and how long until the GUI
+window is shown and ready. The window must appear within the target.
+
+Examples:
+    python benchmark.py --output bench.json
+    python benchmark.py --output new.json --compare bench.json --threshold 10
+    python benchmark.py --allocations --resolutions 640x480 --faces 1
+    python benchmark.py --cold-start --cold-start-target 1.0
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import cv2
+import dlib
+import numpy as np
+
+from buffers import BufferPool
+from fatigue import FatigueMetrics
+from instrumentation import StageTimings
+from pipeline import FramePipeline
+
+RESOLUTIONS = [(640, 480), (1280, 720), (1920, 1080)]
+FACE_COUNTS = [0, 1, 3]
+
+# Seconds from interpreter start until the GUI window is shown
+COLD_START_TARGET = 1.0
+
+# Modules the headless tools must never import
+GUI_MODULES = ("tkinter", "PIL.ImageTk", "pygame")
+
+HEADLESS_STARTUP = """
+import json, sys, time
+start = time.perf_counter()
+import headless, batch_analysis, multistream
+imported = time.perf_counter() - start
+import models
+models.face_detector()
+models.shape_predictor(sys.argv[1])
+print(json.dumps({"import_s": imported, "models_s": time.perf_counter() - start,
+                  "gui_modules": [m for m in %r if m in sys.modules]}))
+""" % (GUI_MODULES,)
+
+GUI_STARTUP = """
+import json, time
+start = time.perf_counter()
+import tkinter as tk
+try:
+    root = tk.Tk()
+except tk.TclError as e:
+    print(json.dumps({"error": str(e)}))
+    raise SystemExit
+import main
+app = main.DrowsinessDetector(root)
+root.update()
+window = time.perf_counter() - start
+while not app.loading_done:
+    root.update()
+    time.sleep(0.01)
+print(json.dumps({"window_s": window, "ready_s": time.perf_counter() - start,
+                  "error": str(app.loading_error) if app.loading_error else None}))
+app.alerts.stop(0)
+root.destroy()
+"""
+
+
+class KnownFacesDetector:
+    """Run a real detector for its cost but report known face rectangles"""
+
+    def __init__(self, detector, rects, frame_width):
+        self.detector = detector
+        self.rects = rects
+        self.frame_width = frame_width
+
+    def __call__(self, image, upsample=0):
+        self.detector(image, upsample)
+        # Detection may run on a downscaled copy; scale the known boxes to match
+        scale = image.shape[1] / self.frame_width
+        return [dlib.rectangle(int(r.left() * scale), int(r.top() * scale),
+                               int(r.right() * scale), int(r.bottom() * scale))
+                for r in self.rects]
+
+
+def face_slots(width, height, count):
+    """Evenly spaced square face boxes across the middle of the frame"""
+    size = min(height // 2, width // (count + 1)) if count else 0
+    top = (height - size) // 2
+    step = width // (count + 1) if count else 0
+    return [(step * (i + 1) - size // 2, top, size) for i in range(count)]
+
+
+def draw_face(frame, x, y, size):
+    """Draw a simple face with eyes and mouth into a square box"""
+    center = (x + size // 2, y + size // 2)
+    cv2.ellipse(frame, center, (size * 2 // 5, size // 2), 0, 0, 360, (140, 170, 220), -1)
+    for dx in (-size // 6, size // 6):
+        eye = (center[0] + dx, center[1] - size // 8)
+        cv2.ellipse(frame, eye, (size // 14, size // 28), 0, 0, 360, (255, 255, 255), -1)
+        cv2.circle(frame, eye, size // 40 + 1, (40, 30, 20), -1)
+    cv2.ellipse(frame, (center[0], center[1] + size // 5), (size // 8, size // 24), 0, 0, 360, (60, 60, 160), -1)
+
+
+def synthetic_frames(width, height, faces, count, seed):
+    rng = np.random.default_rng(seed)
+    slots = face_slots(width, height, faces)
+    frames = []
+    for _ in range(count):
+        frame = rng.integers(0, 80, size=(height, width, 3), dtype=np.uint8)
+        for x, y, size in slots:
+            # Small per-frame jitter so frames are not identical
+            jx, jy = rng.integers(-3, 4, size=2)
+            draw_face(frame, x + int(jx), y + int(jy), size)
+        frames.append(frame)
+    rects = [dlib.rectangle(x, y, x + size, y + size) for x, y, size in slots]
+    return frames, rects
+
+
+def photo_frames(image, width, height, faces, count, seed):
+    """Tile a face photo into the face slots of a plain frame"""
+    rng = np.random.default_rng(seed)
+    frames = []
+    for _ in range(count):
+        frame = rng.integers(0, 80, size=(height, width, 3), dtype=np.uint8)
+        for x, y, size in face_slots(width, height, faces):
+            frame[y:y + size, x:x + size] = cv2.resize(image, (size, size))
+        frames.append(frame)
+    return frames
+
+
+def run_case(pipeline, frames, memory_frames):
+    """Time the pipeline over frames, then measure peak memory on a subset"""
+    pipeline.reset_session()
+    # Warm up caches and lazy allocations
+    for frame in frames[:3]:
+        pipeline.annotate(frame.copy(), pipeline.process(frame))
+    pipeline.reset_session()
+
+    work = [frame.copy() for frame in frames]
+    start = time.perf_counter()
+    for frame in work:
+        pipeline.annotate(frame, pipeline.process(frame))
+    elapsed = time.perf_counter() - start
+    summary = pipeline.timings.summary()
+
+    tracemalloc.start()
+    for frame in frames[:memory_frames]:
+        pipeline.annotate(frame.copy(), pipeline.process(frame))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "fps": round(len(frames) / elapsed, 2),
+        "frame_ms": round(elapsed / len(frames) * 1000, 3),
+        "stages": summary["stages"],
+        "peak_memory_kb": round(peak / 1024, 1),
+    }
+
+
+def allocation_case(pipeline, frames, warmup, measured, buffers=None):
+    """Net traced memory growth and peak transient memory of the frame loop
+
+    Frames are copied into a pool buffer the way FrameGrabber reads them
+    (or into a new array without a pool), then processed and annotated.
+    After the warm-up, traced memory is compared over two stretches of
+    measured frames each. A leak grows memory in both, while objects that
+    merely replace others of a different size (e.g. counters outgrowing
+    the small int cache) show up in one only, so the smaller growth counts.
+    A warm-up of a few hundred frames gets such counters past that point.
+    """
+    pipeline.buffers = buffers
+    # Latency and fatigue windows no longer than the warm-up (at 30 fps),
+    # so they are full when measuring
+    pipeline.timings = StageTimings(window=min(1000, warmup))
+    seconds = max(1, warmup // 60)
+    pipeline.fatigue = FatigueMetrics(seconds, seconds, seconds)
+    pipeline.reset_session()
+
+    def run(first, count):
+        for index in range(first, first + count):
+            source = frames[index % len(frames)]
+            if buffers is None:
+                frame = source.copy()
+            else:
+                frame = buffers.take("frame", source.shape)
+                np.copyto(frame, source)
+            pipeline.annotate(frame, pipeline.process(frame, index / 30.0))
+
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    tracemalloc.start()
+    run(0, warmup)
+    first = tracemalloc.take_snapshot().filter_traces(ignore)
+    baseline = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    run(warmup, measured)
+    second = tracemalloc.take_snapshot().filter_traces(ignore)
+    run(warmup + measured, measured)
+    third = tracemalloc.take_snapshot().filter_traces(ignore)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    stats = third.compare_to(second, "lineno")
+    growth = min(sum(stat.size_diff for stat in second.compare_to(first, "lineno")),
+                 sum(stat.size_diff for stat in stats))
+    return {
+        "growth_bytes_per_frame": round(growth / measured, 1),
+        "transient_peak_kb": round((peak - baseline) / 1024, 1),
+        "top_growth": [f"{stat.traceback}: {stat.size_diff:+d} B" for stat in stats[:5] if stat.size_diff > 0],
+    }
+
+
+def allocation_check(args):
+    """Run allocation_case with and without a BufferPool per case, returning (results, failures)"""
+    predictor = dlib.shape_predictor(args.predictor)
+    detector = dlib.get_frontal_face_detector()
+    cases = []
+    failures = []
+    for width, height in args.resolutions:
+        for faces in args.faces:
+            frames, rects = synthetic_frames(width, height, faces, min(args.frames, 30), args.seed)
+            name = f"{width}x{height}_{faces}faces"
+            for pooled in (False, True):
+                pipeline = FramePipeline(detector=KnownFacesDetector(detector, rects, width), predictor=predictor)
+                pipeline.detection_scale = args.detection_scale
+                result = allocation_case(pipeline, frames, args.warmup_frames, args.frames,
+                                         BufferPool() if pooled else None)
+                result.update({"name": name, "pooled": pooled})
+                cases.append(result)
+                print(f"{name:>20} {'pooled' if pooled else 'fresh':>7}: "
+                      f"{result['growth_bytes_per_frame']:+8.1f} B/frame net growth, "
+                      f"{result['transient_peak_kb']:8.1f} KB transient peak")
+                if pooled and result["growth_bytes_per_frame"] > args.growth_threshold:
+                    failures.append(f"{name}: memory grows by {result['growth_bytes_per_frame']} B/frame")
+                    for line in result["top_growth"]:
+                        print(f"    {line}")
+    return {"warmup_frames": args.warmup_frames, "frames": args.frames, "cases": cases}, failures
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def run_benchmark(args):
+    predictor = dlib.shape_predictor(args.predictor)
+    detector = dlib.get_frontal_face_detector()
+    face_image = cv2.imread(args.face_image) if args.face_image else None
+    if args.face_image and face_image is None:
+        raise SystemExit(f"Could not read face image: {args.face_image}")
+
+    cases = []
+    for width, height in args.resolutions:
+        for faces in args.faces:
+            if face_image is not None:
+                frames = photo_frames(face_image, width, height, faces, args.frames, args.seed)
+                case_detector = detector
+            else:
+                frames, rects = synthetic_frames(width, height, faces, args.frames, args.seed)
+                case_detector = KnownFacesDetector(detector, rects, width)
+
+            pipeline = FramePipeline(detector=case_detector, predictor=predictor)
+            pipeline.detection_scale = args.detection_scale
+            result = run_case(pipeline, frames, args.memory_frames)
+            result.update({"name": f"{width}x{height}_{faces}faces",
+                           "resolution": [width, height], "faces": faces})
+            cases.append(result)
+            print(f"{result['name']:>20}: {result['fps']:8.1f} fps  {result['frame_ms']:8.2f} ms/frame  "
+                  f"peak {result['peak_memory_kb']:.0f} KB")
+
+    return {
+        "revision": git_revision(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "opencv": cv2.__version__,
+        "dlib": dlib.__version__,
+        "frames": args.frames,
+        "seed": args.seed,
+        "synthetic": face_image is None,
+        "detection_scale": args.detection_scale,
+        "cases": cases,
+    }
+
+
+def compare(current, baseline, threshold):
+    """Return messages for cases that got slower than threshold percent"""
+    previous = {case["name"]: case for case in baseline["cases"]}
+    regressions = []
+    for case in current["cases"]:
+        old = previous.get(case["name"])
+        if old is None:
+            continue
+        change = (old["fps"] - case["fps"]) / old["fps"] * 100 if old["fps"] else 0.0
+        print(f"{case['name']:>20}: {old['fps']:8.1f} -> {case['fps']:8.1f} fps ({-change:+.1f}%)")
+        if change > threshold:
+            regressions.append(f"{case['name']}: fps dropped {change:.1f}% "
+                               f"({old['fps']} -> {case['fps']})")
+    return regressions
+
+
+def run_startup_script(code, *args):
+    """Run a snippet in a fresh interpreter and return the JSON it prints"""
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, "-c", code, *args], env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def cold_start(args):
+    """Measure startup and return (results, failure messages)"""
+    failures = []
+    headless = run_startup_script(HEADLESS_STARTUP, args.predictor)
+    print(f"Headless import: {headless['import_s'] * 1000:.0f} ms, "
+          f"models loaded after {headless['models_s'] * 1000:.0f} ms")
+    if headless["gui_modules"]:
+        failures.append(f"headless modules import {', '.join(headless['gui_modules'])}")
+
+    # The GUI loads the predictor from its default path in the working directory
+    gui = run_startup_script(GUI_STARTUP)
+    if "window_s" in gui:
+        print(f"GUI window shown after {gui['window_s'] * 1000:.0f} ms, "
+              f"ready after {gui['ready_s'] * 1000:.0f} ms")
+        if gui["error"]:
+            print(f"GUI failed to load its models: {gui['error']}")
+        if gui["window_s"] > args.cold_start_target:
+            failures.append(f"GUI window took {gui['window_s']:.2f} s "
+                            f"(target {args.cold_start_target:.2f} s)")
+    else:
+        print(f"GUI not measured: {gui['error']}")
+
+    return {"headless": headless, "gui": gui, "target_s": args.cold_start_target}, failures
+
+
+def parse_resolution(value):
+    width, height = value.lower().split("x")
+    return int(width), int(height)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the drowsiness detection pipeline")
+    parser.add_argument("--predictor", default="shape_predictor_68_face_landmarks.dat")
+    parser.add_argument("--face-image", default=None, help="tile this face photo instead of drawing faces")
+    parser.add_argument("--resolutions", type=parse_resolution, nargs="+", default=RESOLUTIONS,
+                        help="e.g. 640x480 1280x720")
+    parser.add_argument("--faces", type=int, nargs="+", default=FACE_COUNTS)
+    parser.add_argument("--frames", type=int, default=60, help="frames per case (default: 60)")
+    parser.add_argument("--memory-frames", type=int, default=10,
+                        help="frames measured with tracemalloc per case (default: 10)")
+    parser.add_argument("--detection-scale", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", default=None, help="write results as JSON to this file")
+    parser.add_argument("--compare", default=None, help="baseline JSON file to compare against")
+    parser.add_argument("--threshold", type=float, default=10.0,
+                        help="fps drop in percent that counts as a regression (default: 10)")
+    parser.add_argument("--allocations", action="store_true",
+                        help="check that the pooled frame loop does not grow memory per frame")
+    parser.add_argument("--warmup-frames", type=int, default=300,
+                        help="frames processed before memory is compared with --allocations (default: 300)")
+    parser.add_argument("--growth-threshold", type=float, default=0.0,
+                        help="net bytes per frame the pooled loop may grow by with --allocations (default: 0)")
+    parser.add_argument("--cold-start", action="store_true",
+                        help="measure startup time instead of throughput")
+    parser.add_argument("--cold-start-target", type=float, default=COLD_START_TARGET,
+                        help=f"seconds within which the GUI window must appear (default: {COLD_START_TARGET})")
+    args = parser.parse_args(argv)
+
+    if args.cold_start:
+        results, failures = cold_start(args)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=4)
+            print(f"Results written to {args.output}")
+        if failures:
+            print("COLD START FAILURES:")
+            for message in failures:
+                print(f"- {message}")
+            sys.exit(1)
+        print("Cold start within target.")
+        return
+
+    if args.allocations:
+        results, failures = allocation_check(args)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=4)
+            print(f"Results written to {args.output}")
+        if failures:
+            print("ALLOCATION FAILURES:")
+            for message in failures:
+                print(f"- {message}")
+            sys.exit(1)
+        print("No net allocation growth per frame.")
+        return
+
+    results = run_benchmark(args)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+        print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print("REGRESSIONS:")
+            for message in regressions:
+                print(f"- {message}")
+            sys.exit(1)
+        print("No regressions beyond threshold.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+import threading
+
+import numpy as np
+
+
+class BufferPool:
+    """Preallocated arrays handed out in turn, so the frame loop does not allocate
+
+    Every key has a ring of `slots` arrays of one shape and dtype. take()
+    returns the next array of the ring, which is then only handed out
+    again after `slots` more takes. slots must therefore exceed the number
+    of frames in use at once (buffered by the grabber, queued, being
+    processed and shown), or an array is overwritten while it is still
+    read. A ring is reallocated only when the requested shape changes, e.g.
+    when the camera resolution does.
+
+    Arrays are overwritten as soon as their slot comes round again, so
+    anything that keeps frames or landmarks longer has to copy them.
+    """
+
+    def __init__(self, slots=8):
+        self.slots = slots
+        self.lock = threading.Lock()
+        self.rings = {}  # key -> [arrays, next index]
+        self.allocations = 0
+
+    def take(self, key, shape, dtype=np.uint8):
+        """Return the next array of the ring for key"""
+        with self.lock:
+            ring = self.rings.get(key)
+            if ring is None or ring[0][0].shape != shape or ring[0][0].dtype != dtype:
+                ring = self.rings[key] = [[np.empty(shape, dtype) for _ in range(self.slots)], 0]
+                self.allocations += 1
+            arrays, index = ring
+            ring[1] = (index + 1) % self.slots
+            return arrays[index]
+
+    @property
+    def nbytes(self):
+        with self.lock:
+            return sum(arrays[0].nbytes * len(arrays) for arrays, _ in self.rings.values())
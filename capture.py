@@ -0,0 +1,146 @@
+import collections
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from buffers import BufferPool
+from instrumentation import CAPTURE
+
+
+class FrameGrabber:
+    """Read frames from a camera or video on a dedicated thread
+
+    Frames go into a bounded buffer. With drop_frames enabled (the default,
+    meant for live cameras) the newest frame always wins: when the buffer is
+    full the oldest frame is discarded, and read() skips straight to the
+    newest frame, so detection never runs on stale images. With drop_frames
+    disabled the capture thread waits for room instead, which is what video
+    files need to be analysed completely.
+
+    When timings (a StageTimings) is given, the duration of every camera
+    read is recorded as the capture stage.
+
+    Frames are timestamped with the wall clock when they are read. With
+    media_time enabled (meant for video files) the position in the video is
+    used instead, offset by the time capture started, so time-based logic
+    follows the recording rather than the processing speed.
+
+    With buffers (a BufferPool) frames are read into its arrays instead of
+    new ones once the frame size is known. When frames are dropped the
+    camera is read into a few arrays of the grabber's own and read() copies
+    the frame it returns into the pool, so only frames that are actually
+    processed use up pool slots.
+    """
+
+    def __init__(self, source, buffer_size=2, drop_frames=True, timings=None, media_time=False, buffers=None):
+        self.source = source
+        self.frame_shape = None
+        self.media_time = media_time
+        self.start_time = None
+        self.timings = timings
+        self.drop_frames = drop_frames
+        self.buffer = collections.deque(maxlen=max(1, buffer_size))
+        self.buffers = buffers
+        # One array per buffered frame plus the one being read
+        self.scratch = BufferPool(self.buffer.maxlen + 1) if buffers is not None and drop_frames else None
+        self.condition = threading.Condition()
+        self.cap = None
+        self.thread = None
+        self.running = False
+        self.finished = False
+
+        # Counters
+        self.frames_captured = 0
+        self.frames_processed = 0
+        self.frames_dropped = 0
+
+    def start(self):
+        """Open the source and start capturing, returning False on failure"""
+        self.cap = cv2.VideoCapture(self.source)
+        if not self.cap.isOpened():
+            self.cap.release()
+            return False
+
+        self.running = True
+        self.start_time = time.time()
+        self.thread = threading.Thread(target=self._capture_loop, daemon=True)
+        self.thread.start()
+        return True
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout=2)
+        if self.cap is not None:
+            self.cap.release()
+
+    def _capture_loop(self):
+        while self.running:
+            start = time.perf_counter()
+            frame = None
+            pool = self.buffers if self.scratch is None else self.scratch
+            if pool is not None and self.frame_shape is not None:
+                frame = pool.take("frame", self.frame_shape)
+            ret, frame = self.cap.read(frame)
+            if self.media_time:
+                timestamp = self.start_time + self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+            else:
+                timestamp = time.time()
+            if ret and self.timings is not None:
+                self.timings.record(CAPTURE, time.perf_counter() - start)
+            with self.condition:
+                if not ret:
+                    break
+                self.frame_shape = frame.shape
+                if not self.drop_frames:
+                    while self.running and len(self.buffer) == self.buffer.maxlen:
+                        self.condition.wait()
+                elif len(self.buffer) == self.buffer.maxlen:
+                    self.frames_dropped += 1
+                self.buffer.append((frame, timestamp))
+                self.frames_captured += 1
+                self.condition.notify_all()
+
+        with self.condition:
+            self.finished = True
+            self.condition.notify_all()
+
+    def read(self, timeout=None):
+        """Return the next (frame, timestamp) to process, or None at the end
+
+        Waits up to timeout seconds for a frame when the buffer is empty.
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.buffer or self.finished or not self.running, timeout):
+                return None
+            if not self.buffer:
+                return None
+
+            if self.drop_frames:
+                # Latest frame wins, anything older is stale
+                self.frames_dropped += len(self.buffer) - 1
+                frame, timestamp = self.buffer.pop()
+                self.buffer.clear()
+                if self.scratch is not None:
+                    # Copied while the capture thread cannot reuse the array
+                    pooled = self.buffers.take("frame", frame.shape)
+                    np.copyto(pooled, frame)
+                    frame = pooled
+            else:
+                frame, timestamp = self.buffer.popleft()
+                self.condition.notify_all()
+
+            self.frames_processed += 1
+            return frame, timestamp
+
+    def stats(self):
+        """Captured, processed and dropped frame counts as a dict"""
+        return {
+            "frames_captured": self.frames_captured,
+            "frames_processed": self.frames_processed,
+            "frames_dropped": self.frames_dropped,
+        }
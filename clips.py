@@ -0,0 +1,235 @@
+"""Alert evidence clips from a compressed pre-event frame buffer
+
+Frames are JPEG-compressed into a ring buffer covering the last few
+seconds. When an alert starts, the buffered frames plus the frames of the
+following seconds are handed to a background thread that writes them as a
+Motion-JPEG .avi clip, so the frame loop never waits for encoding or disk.
+"""
+import collections
+import datetime
+import os
+import queue
+import threading
+
+import cv2
+import numpy as np
+
+
+class FrameRingBuffer:
+    """JPEG-compressed frames of the last `seconds` seconds
+
+    Memory stays flat: frames older than the window are evicted, and the
+    oldest frames are also evicted while the buffer holds more than
+    max_bytes.
+    """
+
+    def __init__(self, seconds=5.0, quality=80, max_bytes=32 * 1024 * 1024):
+        self.seconds = seconds
+        self.quality = quality
+        self.max_bytes = max_bytes
+        self.frames = collections.deque()  # (timestamp, jpeg bytes)
+        self.nbytes = 0
+
+    def __len__(self):
+        return len(self.frames)
+
+    def clear(self):
+        self.frames.clear()
+        self.nbytes = 0
+
+    def encode(self, frame):
+        ok, data = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        return data.tobytes() if ok else None
+
+    def add(self, timestamp, jpeg):
+        frames = self.frames
+        frames.append((timestamp, jpeg))
+        self.nbytes += len(jpeg)
+        while frames and (frames[0][0] < timestamp - self.seconds or self.nbytes > self.max_bytes):
+            self.nbytes -= len(frames.popleft()[1])
+
+    def snapshot(self):
+        """The buffered frames, oldest first; the JPEG data is shared, not copied"""
+        return list(self.frames)
+
+
+class Clip:
+    """Frames of one alert clip, collected until end_time"""
+
+    def __init__(self, path, frames, end_time):
+        self.path = path
+        self.frames = frames
+        self.end_time = end_time
+        self.nbytes = sum(len(jpeg) for _, jpeg in frames)
+
+    def add(self, timestamp, jpeg):
+        self.frames.append((timestamp, jpeg))
+        self.nbytes += len(jpeg)
+
+
+class ClipRecorder:
+    """Keep a pre-event buffer and write a clip around every alert
+
+    Call feed() with every captured frame and trigger() when an alert
+    starts; both run on the frame loop and only compress frames and queue
+    work. A clip covers pre_seconds before and post_seconds after the
+    alert. An alert while a clip is still being collected extends that clip
+    (up to max_seconds) instead of starting another one. Frames are kept at
+    no more than fps per second to bound the compression cost.
+
+    Finished clips wait in a queue of at most queue_size for the writer
+    thread. When it is full the clip is dropped and counted rather than
+    holding up the frame loop.
+    """
+
+    def __init__(self, output_dir="clips", pre_seconds=5.0, post_seconds=5.0, fps=15.0,
+                 quality=80, max_seconds=60.0, queue_size=4):
+        self.output_dir = output_dir
+        self.post_seconds = post_seconds
+        self.max_seconds = max_seconds
+        self.fps = fps
+        self.buffer = FrameRingBuffer(pre_seconds, quality)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        self.queued_bytes = 0
+        self.clip = None
+        self.last_frame_time = None
+        self.thread = None
+
+        # Counters
+        self.clips_written = 0
+        self.clips_dropped = 0
+        self.clips_failed = 0
+
+    def start(self):
+        self.thread = threading.Thread(target=self._writer, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self, timeout=10.0):
+        """Queue the clip being collected, write what is queued and stop"""
+        self.finish_clip()
+        if self.thread is not None:
+            try:
+                self.queue.put(None, timeout=timeout)
+            except queue.Full:
+                pass
+            self.thread.join(timeout)
+            self.thread = None
+        self.buffer.clear()
+        self.last_frame_time = None
+
+    @property
+    def memory_bytes(self):
+        """Compressed frame data held in the buffer, the open clip and the queue"""
+        clip = self.clip
+        with self.lock:
+            queued = self.queued_bytes
+        return self.buffer.nbytes + (clip.nbytes if clip is not None else 0) + queued
+
+    def pending(self):
+        return self.queue.qsize()
+
+    def metrics(self):
+        return {
+            "memory_bytes": self.memory_bytes,
+            "buffered_frames": len(self.buffer),
+            "queue_depth": self.pending(),
+            "clips_written": self.clips_written,
+            "clips_dropped": self.clips_dropped,
+            "clips_failed": self.clips_failed,
+        }
+
+    def feed(self, frame, timestamp):
+        """Add a captured BGR frame"""
+        # Frames up to a quarter interval early are kept, so a 30 fps camera
+        # still gives 15 fps rather than every third frame
+        if self.last_frame_time is not None and timestamp - self.last_frame_time < 0.75 / self.fps:
+            return
+        jpeg = self.buffer.encode(frame)
+        if jpeg is None:
+            return
+        self.last_frame_time = timestamp
+        self.buffer.add(timestamp, jpeg)
+
+        clip = self.clip
+        if clip is not None:
+            clip.add(timestamp, jpeg)
+            if timestamp >= clip.end_time:
+                self.finish_clip()
+
+    def trigger(self, kind, timestamp):
+        """Start (or extend) a clip for an alert, returning the clip path
+
+        Returns None when the writer is too far behind to take another clip.
+        """
+        clip = self.clip
+        if clip is not None:
+            start = clip.frames[0][0] if clip.frames else timestamp
+            clip.end_time = min(timestamp + self.post_seconds, start + self.max_seconds)
+            return clip.path
+
+        if self.queue.full():
+            self.clips_dropped += 1
+            print(f"Clip queue full, dropped {kind} clip")
+            return None
+
+        stamp = datetime.datetime.fromtimestamp(timestamp).strftime("%Y%m%d_%H%M%S_%f")[:-3]
+        path = os.path.join(self.output_dir, f"{kind}_{stamp}.avi")
+        self.clip = Clip(path, self.buffer.snapshot(), timestamp + self.post_seconds)
+        return path
+
+    def finish_clip(self):
+        clip, self.clip = self.clip, None
+        if clip is None or not clip.frames:
+            return
+        with self.lock:
+            self.queued_bytes += clip.nbytes
+        try:
+            self.queue.put_nowait(clip)
+        except queue.Full:
+            with self.lock:
+                self.queued_bytes -= clip.nbytes
+            self.clips_dropped += 1
+            print(f"Clip queue full, dropped {clip.path}")
+
+    def _writer(self):
+        while True:
+            clip = self.queue.get()
+            if clip is None:
+                return
+            try:
+                write_clip(clip.path, clip.frames, self.fps)
+                self.clips_written += 1
+            except Exception as e:
+                self.clips_failed += 1
+                print(f"Error writing clip {clip.path}: {e}")
+            finally:
+                with self.lock:
+                    self.queued_bytes -= clip.nbytes
+
+
+def write_clip(path, frames, max_fps):
+    """Decode (timestamp, jpeg) frames and write them as a Motion-JPEG .avi"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    # Play back at the rate the frames were kept at
+    duration = frames[-1][0] - frames[0][0]
+    fps = (len(frames) - 1) / duration if duration > 0 else max_fps
+    fps = min(max(fps, 1.0), max_fps)
+
+    writer = None
+    try:
+        for _, jpeg in frames:
+            image = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+            if writer is None:
+                height, width = image.shape[:2]
+                writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), fps, (width, height))
+                if not writer.isOpened():
+                    raise RuntimeError("could not open video writer")
+            writer.write(image)
+    finally:
+        if writer is not None:
+            writer.release()
@@ -0,0 +1,74 @@
+"""Face detector backends
+
+A detector is called as detector(gray, upsample) with a grayscale frame and
+returns a list of dlib.rectangle face boxes, which is how FramePipeline uses
+it. Backends are created by name with create_detector().
+"""
+import os
+
+import cv2
+import dlib
+
+import models
+
+HOG = "hog"
+HAAR = "haar"
+DETECTOR_BACKENDS = (HOG, HAAR)
+
+
+class HogDetector:
+    """dlib's HOG frontal face detector, accurate but CPU heavy"""
+
+    name = HOG
+
+    def __init__(self):
+        self.detector = models.face_detector()
+
+    def __call__(self, gray, upsample=0):
+        return list(self.detector(gray, upsample))
+
+
+class HaarDetector:
+    """OpenCV Haar cascade detector, cheaper than HOG on low-end CPUs
+
+    Faces smaller than min_face_fraction of the shorter image side are
+    ignored, which is what keeps the cascade fast on a driver camera where
+    the face fills a large part of the frame. Haar boxes sit higher on the
+    face than the HOG boxes the shape predictor was trained on, so they are
+    moved down by box_offset of their height.
+    """
+
+    name = HAAR
+
+    def __init__(self, cascade_path=None, scale_factor=1.2, min_neighbors=5,
+                 min_face_fraction=0.2, box_offset=0.14):
+        if not hasattr(cv2, "CascadeClassifier"):
+            raise RuntimeError(f"OpenCV {cv2.__version__} has no Haar cascade support, use opencv-python 4.x")
+        if cascade_path is None:
+            cascade_path = os.path.join(cv2.data.haarcascades, "haarcascade_frontalface_default.xml")
+        self.cascade = cv2.CascadeClassifier(cascade_path)
+        if self.cascade.empty():
+            raise RuntimeError(f"Could not load Haar cascade: {cascade_path}")
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.min_face_fraction = min_face_fraction
+        self.box_offset = box_offset
+
+    def __call__(self, gray, upsample=0):
+        min_side = max(1, int(min(gray.shape[:2]) * self.min_face_fraction))
+        faces = self.cascade.detectMultiScale(gray, self.scale_factor, self.min_neighbors,
+                                              minSize=(min_side, min_side))
+        rects = []
+        for x, y, w, h in faces:
+            y += int(h * self.box_offset)
+            rects.append(dlib.rectangle(int(x), int(y), int(x + w), int(y + h)))
+        return rects
+
+
+def create_detector(backend=HOG, cascade_path=None):
+    """Create the detector backend with the given name"""
+    if backend == HOG:
+        return HogDetector()
+    if backend == HAAR:
+        return HaarDetector(cascade_path)
+    raise ValueError(f"Unknown face detector backend: {backend}")
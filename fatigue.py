@@ -0,0 +1,202 @@
+"""Streaming fatigue metrics: PERCLOS, blink rate and duration, yawn frequency
+
+Every metric is kept in a RollingSum, a fixed ring of time bins with a
+running total, so updating and reading them costs O(1) per frame however
+long the session runs and no history is re-scanned.
+"""
+
+# Samples further apart than this are treated as a gap in the video (no face,
+# paused capture) rather than as time the eyes spent open or closed
+MAX_SAMPLE_GAP = 1.0  # seconds
+
+
+class RollingSum:
+    """Sum of the values added during the last `window` seconds
+
+    The window is split into `bins` equal time slots held in a ring buffer.
+    Slots that fall out of the window are subtracted from the running total
+    and cleared as time advances, so the window moves in steps of one slot
+    (window / bins seconds). Values are expected to be integers, which keeps
+    the running total exact however many slots have expired.
+    """
+
+    def __init__(self, window, bins=60):
+        self.window = window
+        self.slot_width = window / bins
+        self.slots = [0] * bins
+        self.total = 0
+        self.current = None  # absolute index of the newest slot
+
+    def reset(self):
+        self.slots = [0] * len(self.slots)
+        self.total = 0
+        self.current = None
+
+    def advance(self, timestamp):
+        """Expire the slots that are older than the window at `timestamp`"""
+        index = int(timestamp // self.slot_width)
+        if self.current is None:
+            self.current = index
+            return
+        if index <= self.current:
+            return
+        # A gap longer than the window clears each slot once
+        slots = self.slots
+        for step in range(1, min(index - self.current, len(slots)) + 1):
+            slot = (self.current + step) % len(slots)
+            self.total -= slots[slot]
+            slots[slot] = 0
+        self.current = index
+
+    def add(self, timestamp, value=1):
+        self.advance(timestamp)
+        self.slots[self.current % len(self.slots)] += value
+        self.total += value
+
+    def value(self, timestamp):
+        """Sum over the window ending at `timestamp`"""
+        self.advance(timestamp)
+        return self.total
+
+
+class FatigueMetrics:
+    """PERCLOS, blink rate and duration, and yawns per 10 minutes
+
+    Feed one analysed frame at a time with update(). PERCLOS is the share
+    of time the eyes were closed (EAR below the threshold) over the last
+    perclos_window seconds. Each sample counts for the time until the next
+    one, so it stays correct when the frame rate varies or frames are
+    skipped. A closed run shorter than max_blink_ms is counted as a blink;
+    longer closures only count towards PERCLOS. Blinks last 100-400 ms, so
+    the blink figures need every frame to be analysed: with the adaptive
+    analysis rate short blinks are missed.
+    """
+
+    def __init__(self, perclos_window=60, blink_window=60, yawn_window=600, max_blink_ms=500):
+        self.perclos_window = perclos_window
+        self.yawn_window = yawn_window
+        self.max_blink_ms = max_blink_ms
+        # Milliseconds observed and milliseconds with the eyes closed
+        self.observed_ms = RollingSum(perclos_window)
+        self.closed_ms = RollingSum(perclos_window)
+        self.blink_observed_ms = RollingSum(blink_window)
+        self.blinks = RollingSum(blink_window)
+        self.blink_ms = RollingSum(blink_window)
+        self.yawns = RollingSum(yawn_window)
+        self.reset()
+
+    def reset(self):
+        for window in (self.observed_ms, self.closed_ms, self.blink_observed_ms,
+                       self.blinks, self.blink_ms, self.yawns):
+            window.reset()
+        self.started = None
+        self.timestamp = None
+        self.last_sample = None  # (timestamp, eyes closed) of the last frame with a face
+        self.closed_since = None
+
+    def update(self, timestamp, ear, ear_threshold, yawns=0):
+        """Add one analysed frame
+
+        ear is None when no face was found. yawns is the number of yawn
+        episodes that started on this frame.
+        """
+        if self.started is None:
+            self.started = timestamp
+        self.timestamp = timestamp
+        if yawns:
+            self.yawns.add(timestamp, yawns)
+
+        if ear is None:
+            # The eyes cannot be seen, so the closed run (if any) is not a blink
+            self.last_sample = None
+            self.closed_since = None
+            return
+
+        closed = ear < ear_threshold
+        if self.last_sample is not None:
+            last_time, last_closed = self.last_sample
+            elapsed = timestamp - last_time
+            if 0 < elapsed <= MAX_SAMPLE_GAP:
+                # The previous state lasted until this frame
+                elapsed_ms = int(elapsed * 1000)
+                self.observed_ms.add(timestamp, elapsed_ms)
+                self.blink_observed_ms.add(timestamp, elapsed_ms)
+                if last_closed:
+                    self.closed_ms.add(timestamp, elapsed_ms)
+            elif elapsed > MAX_SAMPLE_GAP:
+                self.closed_since = None
+
+        if closed:
+            if self.closed_since is None:
+                self.closed_since = timestamp
+        elif self.closed_since is not None:
+            duration_ms = int((timestamp - self.closed_since) * 1000)
+            if duration_ms < self.max_blink_ms:
+                self.blinks.add(timestamp)
+                self.blink_ms.add(timestamp, duration_ms)
+            self.closed_since = None
+        self.last_sample = (timestamp, closed)
+
+    @property
+    def warmed_up(self):
+        """Whether a full PERCLOS window has been observed"""
+        return self.started is not None and self.timestamp - self.started >= self.perclos_window
+
+    def perclos(self):
+        """Share of the window the eyes were closed (0-1), None before any face was seen"""
+        if self.timestamp is None:
+            return None
+        observed = self.observed_ms.value(self.timestamp)
+        if not observed:
+            return None
+        return self.closed_ms.value(self.timestamp) / observed
+
+    def blink_rate(self):
+        """Blinks per minute over the blink window"""
+        if self.timestamp is None:
+            return None
+        observed = self.blink_observed_ms.value(self.timestamp)
+        if observed < 1000:
+            return None
+        return self.blinks.value(self.timestamp) * 60000 / observed
+
+    def blink_duration_ms(self):
+        """Mean blink duration over the blink window"""
+        if self.timestamp is None:
+            return None
+        blinks = self.blinks.value(self.timestamp)
+        if not blinks:
+            return None
+        return self.blink_ms.value(self.timestamp) / blinks
+
+    def yawns_per_10_min(self):
+        """Yawn episodes started during the yawn window, scaled to 10 minutes"""
+        if self.timestamp is None:
+            return None
+        return self.yawns.value(self.timestamp) * 600 / self.yawn_window
+
+    def summary(self):
+        """All metrics as a dict; values are None while they are unknown"""
+        return {
+            "perclos": self.perclos(),
+            "blink_rate": self.blink_rate(),
+            "blink_duration_ms": self.blink_duration_ms(),
+            "yawns_per_10_min": self.yawns_per_10_min(),
+        }
+
+
+def format_lines(summary):
+    """Label lines for a FatigueMetrics.summary(), '-' for unknown values"""
+    perclos = summary["perclos"]
+    blink_rate = summary["blink_rate"]
+    blink_duration = summary["blink_duration_ms"]
+    yawns = summary["yawns_per_10_min"]
+
+    blinks = "Blink Rate: -" if blink_rate is None else f"Blink Rate: {blink_rate:.0f}/min"
+    if blink_duration is not None:
+        blinks += f", {blink_duration:.0f} ms avg"
+    return [
+        "PERCLOS (1 min): -" if perclos is None else f"PERCLOS (1 min): {perclos:.0%}",
+        blinks,
+        "Yawns (10 min): -" if yawns is None else f"Yawns (10 min): {yawns:.0f}",
+    ]
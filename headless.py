@@ -0,0 +1,362 @@
+"""Run the drowsiness detection pipeline without a GUI
+
+Examples:
+    python headless.py --source 0
+    python headless.py --source recordings/shift.mp4 --max-frames 500
+    python headless.py --source recordings/shift.mp4 --record shift_metrics.npz
+    python headless.py --source 0 --clips alert_clips
+    python headless.py --source 0 --pipelined --landmark-workers 2
+    python headless.py --source 0 --reuse-buffers
+    python headless.py --source 0 --telemetry tcp://127.0.0.1:9500 --driver alice --fleet north
+    python headless.py --source recordings/shift.mp4 --compare-scales 1.0,0.75,0.5,0.33
+    python headless.py --source recordings/shift.mp4 --compare-detectors hog,haar
+"""
+import argparse
+import datetime
+import time
+
+import cv2
+
+from buffers import BufferPool
+from capture import FrameGrabber
+from clips import ClipRecorder
+from detectors import DETECTOR_BACKENDS, HOG
+from fatigue import format_lines
+from instrumentation import FACE_DETECTION
+from telemetry import SESSION_START, SESSION_STOP, TelemetryClient
+from pipeline import (AdaptiveScheduler, FramePipeline, FACE_SELECTIONS, LARGEST, overlap,
+                      DROWSY_ALARM_START, YAWN_ALARM_START, FATIGUE_ALARM_START, EMERGENCY)
+from recorder import MetricsRecorder
+from staged import StagedPipeline, frames_in_flight
+
+
+def parse_source(value):
+    """Treat numeric sources as camera indices and anything else as a file"""
+    return int(value) if value.isdigit() else value
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Headless drowsiness detection")
+    parser.add_argument("--source", default="0", help="camera index or video file (default: 0)")
+    parser.add_argument("--predictor", default="shape_predictor_68_face_landmarks.dat",
+                        help="path to the 68 point dlib shape predictor")
+    parser.add_argument("--ear-threshold", type=float, default=0.25)
+    parser.add_argument("--ear-frames", type=int, default=20)
+    parser.add_argument("--yawn-threshold", type=int, default=30)
+    parser.add_argument("--yawn-frames", type=int, default=15)
+    parser.add_argument("--time-windows", action="store_true",
+                        help="decide on how long eyes are closed or the mouth is open instead of frame counts")
+    parser.add_argument("--ear-ms", type=int, default=800,
+                        help="eyes closed duration that raises a drowsiness alarm with --time-windows (default: 800)")
+    parser.add_argument("--yawn-ms", type=int, default=500,
+                        help="mouth open duration that counts as a yawn with --time-windows (default: 500)")
+    parser.add_argument("--detector", choices=DETECTOR_BACKENDS, default=HOG,
+                        help="face detector backend (default: hog)")
+    parser.add_argument("--haar-cascade", default=None,
+                        help="cascade file for the haar detector (default: the frontal face cascade shipped with OpenCV)")
+    parser.add_argument("--detect-every", type=int, default=1,
+                        help="run full face detection every N frames and track faces in between (default: 1)")
+    parser.add_argument("--detection-scale", type=float, default=1.0,
+                        help="scale factor applied to frames before face detection (default: 1.0)")
+    parser.add_argument("--face-selection", choices=FACE_SELECTIONS, default=LARGEST,
+                        help="which face to monitor when several are in frame (default: largest)")
+    parser.add_argument("--multi-face", action="store_true",
+                        help="monitor every face with its own alert state instead of one face")
+    parser.add_argument("--adaptive-min-fps", type=float, default=None,
+                        help="analyse as few as this many frames/sec while the driver is clearly alert; "
+                             "alarms are delayed by at most 1/N seconds (default: analyse every frame)")
+    parser.add_argument("--adaptive-max-fps", type=float, default=None,
+                        help="analysis rate near a threshold with --adaptive-min-fps; every frame is "
+                             "analysed while a counter runs or an alarm is active (default: every frame)")
+    parser.add_argument("--perclos-alarm", type=float, default=None,
+                        help="raise a fatigue alarm when the eyes were closed this percentage of the last minute")
+    parser.add_argument("--yawn-rate-alarm", type=int, default=None,
+                        help="raise a fatigue alarm at this many yawns within 10 minutes")
+    parser.add_argument("--compare-scales", default=None,
+                        help="comma separated detection scales to measure fps and EAR accuracy for, then exit")
+    parser.add_argument("--compare-detectors", default=None,
+                        help="comma separated detector backends to measure fps and agreement with the first for, then exit")
+    parser.add_argument("--pipelined", action="store_true",
+                        help="overlap capture, face detection, landmarks and alert handling on separate threads")
+    parser.add_argument("--landmark-workers", type=int, default=1,
+                        help="landmark threads with --pipelined (default: 1)")
+    parser.add_argument("--reuse-buffers", action="store_true",
+                        help="read frames and compute grayscale images and landmarks in preallocated buffers")
+    parser.add_argument("--max-frames", type=int, default=0, help="stop after this many frames (0 = no limit)")
+    parser.add_argument("--record", default=None,
+                        help="save per-frame EAR, mouth distance, face count and alert flags to this .npz file")
+    parser.add_argument("--telemetry", default=None,
+                        help="stream events and fps/latency samples to a telemetry_collector.py at [tcp|udp://]host:port")
+    parser.add_argument("--driver", default="", help="driver name reported with telemetry")
+    parser.add_argument("--fleet", default="", help="fleet name reported with telemetry")
+    parser.add_argument("--clips", default=None,
+                        help="save a video clip from 5 seconds before to 5 seconds after every alert to this directory")
+    return parser
+
+
+def configure_pipeline(pipeline, args):
+    """Copy detection settings from parsed arguments onto a pipeline
+
+    Models that are not loaded yet are loaded afterwards, so pipelines
+    created with load=False only ever load the chosen detector backend.
+    """
+    pipeline.eye_aspect_ratio_threshold = args.ear_threshold
+    pipeline.eye_aspect_ratio_consecutive_frames = args.ear_frames
+    pipeline.yawn_threshold = args.yawn_threshold
+    pipeline.yawn_consecutive_frames = args.yawn_frames
+    pipeline.time_windows = args.time_windows
+    pipeline.eyes_closed_window_ms = args.ear_ms
+    pipeline.yawn_window_ms = args.yawn_ms
+    pipeline.detection_interval = max(1, args.detect_every)
+    pipeline.detection_scale = args.detection_scale
+    pipeline.face_selection = args.face_selection
+    pipeline.multi_face = args.multi_face
+    pipeline.perclos_threshold = None if args.perclos_alarm is None else args.perclos_alarm / 100
+    pipeline.yawn_rate_threshold = args.yawn_rate_alarm
+    if args.adaptive_min_fps:
+        pipeline.scheduler = AdaptiveScheduler(args.adaptive_min_fps, args.adaptive_max_fps)
+    if args.reuse_buffers:
+        slots = 8
+        if args.pipelined:
+            slots += frames_in_flight(args.landmark_workers)
+        pipeline.buffers = BufferPool(slots)
+    pipeline.haar_cascade_path = args.haar_cascade
+    if pipeline.detector is None:
+        pipeline.detector_backend = args.detector
+        pipeline.load_models()
+    elif pipeline.detector_backend != args.detector:
+        pipeline.set_detector(args.detector)
+    return pipeline
+
+
+def run(pipeline, source, max_frames=0, recorder=None, clips=None, telemetry=None, landmark_workers=0):
+    """Process frames from a source until it ends, returning its FrameGrabber
+
+    Every FrameResult is appended to recorder (a MetricsRecorder) if given.
+    With clips (a started ClipRecorder) footage around every alert is saved.
+    With telemetry (a started TelemetryClient) the session, its alarm
+    events and fps/latency samples are streamed to a collector. With
+    landmark_workers the stages run overlapped in a StagedPipeline with
+    that many landmark threads; 0 runs every frame through on this thread.
+    """
+    # Live cameras drop stale frames, video files are analysed completely
+    # and timed by their position in the recording
+    live = isinstance(source, int)
+    grabber = FrameGrabber(source, drop_frames=live, timings=pipeline.timings, media_time=not live,
+                           buffers=pipeline.buffers)
+    if not grabber.start():
+        raise SystemExit(f"Could not open video source: {source}")
+    if telemetry is not None:
+        telemetry.emit(SESSION_START)
+    stages = StagedPipeline(pipeline, grabber, landmark_workers).start() if landmark_workers else None
+
+    frames = 0
+    try:
+        while not max_frames or frames < max_frames:
+            if stages is not None:
+                item = stages.read(timeout=1.0)
+                if item is None:
+                    if stages.finished:
+                        break
+                    continue
+                frame, timestamp, result = item
+            else:
+                item = grabber.read(timeout=1.0)
+                if item is None:
+                    if grabber.finished:
+                        break
+                    continue
+                frame, timestamp = item
+                result = pipeline.process(frame, timestamp)
+            frames += 1
+
+            if recorder is not None:
+                recorder.record(result)
+            if clips is not None:
+                clips.feed(frame, timestamp)
+            if telemetry is not None:
+                telemetry.emit_events(result.events, result.timestamp)
+                telemetry.emit_timings(pipeline.timings, result.timestamp)
+
+            stamp = datetime.datetime.fromtimestamp(result.timestamp).strftime("%H:%M:%S")
+            if DROWSY_ALARM_START in result.events:
+                print(f"[{stamp}] DROWSINESS ALERT! (EAR {result.ear:.2f})")
+                if clips is not None:
+                    print(f"[{stamp}] Clip: {clips.trigger('drowsy', result.timestamp)}")
+            if YAWN_ALARM_START in result.events:
+                print(f"[{stamp}] YAWN DETECTED! (mouth distance {result.mouth_distance})")
+                if clips is not None:
+                    print(f"[{stamp}] Clip: {clips.trigger('yawn', result.timestamp)}")
+            if FATIGUE_ALARM_START in result.events:
+                print(f"[{stamp}] FATIGUE ALERT! ({', '.join(format_lines(pipeline.fatigue.summary()))})")
+            if EMERGENCY in result.events:
+                print(f"[{stamp}] EMERGENCY: drowsy for more than {pipeline.emergency_timeout} seconds")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if stages is not None:
+            stages.stop()
+        grabber.stop()
+        if telemetry is not None:
+            telemetry.emit(SESSION_STOP)
+    return grabber
+
+
+def read_frames(source, max_frames):
+    """Load up to max_frames frames from a source into memory"""
+    cap = cv2.VideoCapture(source)
+    frames = []
+    while len(frames) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def compare_scales(pipeline, frames, scales):
+    """Measure fps and EAR error against full resolution detection for each scale
+
+    Returns one dict per scale. EAR error is the mean absolute difference to
+    the full resolution EAR over frames where both runs found a face.
+    """
+    def measure(scale):
+        pipeline.reset_session()
+        pipeline.detection_scale = scale
+        ears = []
+        start = time.perf_counter()
+        for frame in frames:
+            ears.append(pipeline.process(frame).ear)
+        return ears, time.perf_counter() - start
+
+    reference, _ = measure(1.0)
+    rows = []
+    for scale in scales:
+        ears, elapsed = measure(scale)
+        errors = [abs(a - b) for a, b in zip(ears, reference) if a is not None and b is not None]
+        found = sum(1 for ear in ears if ear is not None)
+        rows.append({
+            "scale": scale,
+            "fps": len(frames) / elapsed if elapsed else 0.0,
+            "face_rate": found / len(frames) if frames else 0.0,
+            "ear_error": sum(errors) / len(errors) if errors else None,
+        })
+    return rows
+
+
+def compare_detectors(pipeline, frames, backends):
+    """Measure fps and agreement with the first backend for each detector backend
+
+    A frame agrees when both backends found no face, or both found one and
+    the monitored faces overlap by at least half (intersection over union).
+    EAR error is the mean absolute EAR difference on frames where both found
+    a face.
+    """
+    runs = []
+    for backend in backends:
+        pipeline.set_detector(backend)
+        pipeline.reset_session()
+        start = time.perf_counter()
+        results = [pipeline.process(frame) for frame in frames]
+        elapsed = time.perf_counter() - start
+        detection = pipeline.timings.summary()["stages"].get(FACE_DETECTION, {})
+        runs.append((backend, results, elapsed, detection.get("p50_ms")))
+
+    reference = runs[0][1]
+    rows = []
+    for backend, results, elapsed, detect_ms in runs:
+        agreed = 0
+        errors = []
+        for result, expected in zip(results, reference):
+            if not result.faces and not expected.faces:
+                agreed += 1
+            elif result.faces and expected.faces:
+                if overlap(result.faces[0].rect, expected.faces[0].rect) >= 0.5:
+                    agreed += 1
+                errors.append(abs(result.ear - expected.ear))
+        rows.append({
+            "backend": backend,
+            "fps": len(frames) / elapsed if elapsed else 0.0,
+            "detect_ms": detect_ms,
+            "face_rate": sum(1 for result in results if result.faces) / len(frames) if frames else 0.0,
+            "agreement": agreed / len(frames) if frames else 0.0,
+            "ear_error": sum(errors) / len(errors) if errors else None,
+        })
+    return rows
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        pipeline = configure_pipeline(FramePipeline(args.predictor, load=False), args)
+    except RuntimeError as e:
+        raise SystemExit(str(e))
+
+    if args.compare_scales:
+        scales = [float(scale) for scale in args.compare_scales.split(",")]
+        frames = read_frames(parse_source(args.source), args.max_frames or 300)
+        print(f"Compared on {len(frames)} frames")
+        print(f"{'Scale':>6} {'FPS':>8} {'Faces':>7} {'EAR error':>10}")
+        for row in compare_scales(pipeline, frames, scales):
+            error = "-" if row["ear_error"] is None else f"{row['ear_error']:.4f}"
+            print(f"{row['scale']:>6.2f} {row['fps']:>8.1f} {row['face_rate']:>7.0%} {error:>10}")
+        return
+
+    if args.compare_detectors:
+        backends = args.compare_detectors.split(",")
+        frames = read_frames(parse_source(args.source), args.max_frames or 300)
+        print(f"Compared on {len(frames)} frames against {backends[0]}")
+        print(f"{'Detector':>8} {'FPS':>8} {'Detect ms':>10} {'Faces':>7} {'Agreement':>10} {'EAR error':>10}")
+        for row in compare_detectors(pipeline, frames, backends):
+            detect = "-" if row["detect_ms"] is None else f"{row['detect_ms']:.1f}"
+            error = "-" if row["ear_error"] is None else f"{row['ear_error']:.4f}"
+            print(f"{row['backend']:>8} {row['fps']:>8.1f} {detect:>10} {row['face_rate']:>7.0%} "
+                  f"{row['agreement']:>10.0%} {error:>10}")
+        return
+
+    start = time.perf_counter()
+    recorder = MetricsRecorder() if args.record else None
+    clips = ClipRecorder(args.clips).start() if args.clips else None
+    telemetry = TelemetryClient(args.telemetry, args.driver, args.fleet).start() if args.telemetry else None
+    grabber = run(pipeline, parse_source(args.source), args.max_frames, recorder, clips, telemetry,
+                  args.landmark_workers if args.pipelined else 0)
+    elapsed = time.perf_counter() - start
+    if clips is not None:
+        clips.stop()
+    if telemetry is not None:
+        telemetry.stop()
+    frames = grabber.frames_processed
+
+    print(f"Frames captured: {grabber.frames_captured}")
+    print(f"Frames processed: {frames}")
+    print(f"Frames dropped: {grabber.frames_dropped}")
+    if pipeline.scheduler is not None:
+        print(f"Frames skipped while alert: {pipeline.frames_skipped} "
+              f"(alarms delayed by at most {pipeline.scheduler.max_delay() * 1000:.0f} ms)")
+    print(f"Average FPS: {frames / elapsed if elapsed else 0:.1f}")
+    print(f"Full detections: {pipeline.detections_run}")
+    print(f"Drowsy Episodes: {pipeline.drowsy_episodes}")
+    print(f"Yawn Episodes: {pipeline.yawn_episodes}")
+    if pipeline.perclos_threshold is not None or pipeline.yawn_rate_threshold is not None:
+        print(f"Fatigue Alerts: {pipeline.fatigue_episodes}")
+    for line in format_lines(pipeline.fatigue.summary()):
+        print(line)
+    print("Stage Latency:")
+    for line in pipeline.timings.format_lines():
+        print(f"  {line}")
+
+    if recorder is not None:
+        path = recorder.save(args.record)
+        print(f"Recorded {len(recorder)} frames to {path}")
+    if clips is not None:
+        metrics = clips.metrics()
+        print(f"Alert clips: {metrics['clips_written']} written, {metrics['clips_dropped']} dropped, "
+              f"{metrics['clips_failed']} failed")
+    if telemetry is not None:
+        metrics = telemetry.metrics()
+        print(f"Telemetry: {metrics['records_sent']} records sent, {metrics['records_dropped']} dropped")
+
+
+if __name__ == "__main__":
+    main()
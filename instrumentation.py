@@ -0,0 +1,135 @@
+import collections
+import math
+import time
+
+# Stage names recorded by the frame loop, in pipeline order
+CAPTURE = "capture"
+GRAYSCALE = "grayscale"
+FACE_DETECTION = "face_detection"
+LANDMARKS = "landmarks"
+METRICS = "metrics"
+DRAWING = "drawing"
+DISPLAY = "display"
+STAGES = (CAPTURE, GRAYSCALE, FACE_DETECTION, LANDMARKS, METRICS, DRAWING, DISPLAY)
+
+
+class LatencyHistogram:
+    """Rolling histogram of durations over the last `window` samples
+
+    Durations fall into log-spaced buckets between min_seconds and
+    max_seconds. Each bucket is about 5% wide. Recording a sample is O(1);
+    the bucket of the evicted sample is decremented. Percentiles walk the
+    bucket counts, so they never sort the samples.
+    """
+
+    def __init__(self, window=1000, min_seconds=1e-5, max_seconds=10.0, growth=1.05):
+        self.min_seconds = min_seconds
+        self.log_growth = math.log(growth)
+        self.bucket_count = int(math.log(max_seconds / min_seconds) / self.log_growth) + 2
+        self.counts = [0] * self.bucket_count
+        self.samples = collections.deque(maxlen=window)
+        self.total = 0
+
+    def bucket(self, seconds):
+        if seconds <= self.min_seconds:
+            return 0
+        index = int(math.log(seconds / self.min_seconds) / self.log_growth) + 1
+        return min(index, self.bucket_count - 1)
+
+    def upper_bound(self, index):
+        return self.min_seconds * math.exp(self.log_growth * index)
+
+    def record(self, seconds):
+        if len(self.samples) == self.samples.maxlen:
+            self.counts[self.samples[0]] -= 1
+        index = self.bucket(seconds)
+        self.samples.append(index)
+        self.counts[index] += 1
+        self.total += 1
+
+    def percentile(self, q):
+        """Approximate q-th percentile in seconds, None without samples"""
+        count = len(self.samples)
+        if not count:
+            return None
+        rank = max(1, math.ceil(q / 100.0 * count))
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return self.upper_bound(index)
+        return self.upper_bound(self.bucket_count - 1)
+
+
+class StageTimings:
+    """Per-stage latency histograms and effective fps of the frame loop"""
+
+    def __init__(self, window=1000):
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        self.histograms = {stage: LatencyHistogram(self.window) for stage in STAGES}
+        self.frame_times = collections.deque(maxlen=self.window)
+        # Input queue depth per stage of a StagedPipeline: last, peak, sum and
+        # samples. Every stage has its entry from the start, as the stage
+        # threads record while the UI and telemetry threads read the summary.
+        self.queue_depths = {stage: [0, 0, 0, 0] for stage in STAGES}
+
+    def record_queue(self, stage, depth):
+        """Record how many frames were waiting for a stage when it took one"""
+        depths = self.queue_depths[stage]
+        depths[0] = depth
+        depths[1] = max(depths[1], depth)
+        depths[2] += depth
+        depths[3] += 1
+
+    def record(self, stage, seconds):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = LatencyHistogram(self.window)
+        histogram.record(seconds)
+
+    def frame_done(self, now=None):
+        """Mark the end of one processed frame for the fps estimate"""
+        self.frame_times.append(time.perf_counter() if now is None else now)
+
+    def fps(self):
+        if len(self.frame_times) < 2:
+            return 0.0
+        elapsed = self.frame_times[-1] - self.frame_times[0]
+        return (len(self.frame_times) - 1) / elapsed if elapsed > 0 else 0.0
+
+    def summary(self):
+        """p50/p95/p99 in milliseconds per stage plus effective fps"""
+        stages = {}
+        for stage, histogram in self.histograms.items():
+            if not histogram.samples:
+                continue
+            stages[stage] = {
+                "p50_ms": round(histogram.percentile(50) * 1000, 3),
+                "p95_ms": round(histogram.percentile(95) * 1000, 3),
+                "p99_ms": round(histogram.percentile(99) * 1000, 3),
+                "samples": histogram.total,
+            }
+        summary = {"fps": round(self.fps(), 2), "stages": stages}
+        queues = {
+            stage: {"depth": depth, "mean": round(total / samples, 2), "max": peak}
+            for stage, (depth, peak, total, samples) in self.queue_depths.items() if samples
+        }
+        if queues:
+            summary["queues"] = queues
+        return summary
+
+    def format_lines(self):
+        """Human readable summary lines for labels and reports"""
+        summary = self.summary()
+        lines = [f"Effective FPS: {summary['fps']:.1f}"]
+        for stage, values in summary["stages"].items():
+            name = stage.replace("_", " ").title()
+            lines.append(f"{name}: p50 {values['p50_ms']:.1f} / p95 {values['p95_ms']:.1f} / "
+                         f"p99 {values['p99_ms']:.1f} ms")
+        for stage, values in summary.get("queues", {}).items():
+            name = stage.replace("_", " ").title()
+            lines.append(f"{name} Queue: {values['depth']} waiting (mean {values['mean']:.1f}, max {values['max']})")
+        return lines
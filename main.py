@@ -1,22 +1,30 @@
-import cv2
-import dlib
-import numpy as np
-import pygame
 import threading
 import time
 import tkinter as tk
-from tkinter import ttk, Frame, Label, Button, Scale, HORIZONTAL, Entry, StringVar, messagebox
-from PIL import Image, ImageTk
-from scipy.spatial import distance
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+from tkinter import ttk, Frame, Label, Button, Scale, HORIZONTAL, Entry, StringVar, BooleanVar, Checkbutton, messagebox
 import os
 import datetime
-from twilio.rest import Client
 
-# Initialize pygame for alert sound
-pygame.mixer.init()
+from alerts import AlertDispatcher, default_transports
+from audio import AlarmSound
+from buffers import BufferPool
+from capture import FrameGrabber
+from clips import ClipRecorder
+from detectors import DETECTOR_BACKENDS
+from fatigue import format_lines
+from instrumentation import DISPLAY
+from preview import PreviewRenderer
+from recorder import MetricsRecorder
+from session_store import SessionStore
+from staged import StagedPipeline, frames_in_flight
+from telemetry import SESSION_START, SESSION_STOP, TelemetryClient
+from ui_state import LatestValue, UISnapshot
+from pipeline import (AdaptiveScheduler, FramePipeline, FACE_SELECTIONS, DROWSY_ALARM_START, DROWSY_ALARM_STOP,
+                      YAWN_ALARM_START, YAWN_ALARM_STOP, FATIGUE_ALARM_START, FATIGUE_ALARM_STOP, EMERGENCY)
+
+# Resources loaded in the background after the window appears:
+# alarm sound, face detector and facial landmark model
+LOADING_STEPS = 3
 
 class DrowsinessDetector:
     def __init__(self, root):
@@ -28,54 +36,72 @@ class DrowsinessDetector:
         
         # Initialize variables
         self.is_running = False
-        self.frame = None
-        self.eye_aspect_ratio_threshold = 0.25
-        self.eye_aspect_ratio_consecutive_frames = 20
-        self.counter = 0
+        self.grabber = None
+        
+        # Latest UI state published by the video thread and applied by refresh_ui
+        self.ui_state = LatestValue()
+        self.ui_refresh_rate = 15  # Hz
+        self.show_preview = True
+        self.record_metrics = False
+        self.recorder = None
+        self.save_clips = False
+        self.clips = None
+        self.pipelined = False
+        self.reuse_buffers = False
+        self.video_thread = None
+        self.video_stop = None
+        self.ui_refresh_job = None
+        self.applied_widget_state = {}
+        self.eye_status = None
+        self.yawn_status = None
+        self.last_ear = None
+        self.last_mouth_distance = None
         self.alarm_on = False
-        
-        # Yawn detection variables
-        self.yawn_threshold = 30  # Distance threshold for yawn detection
-        self.yawn_counter = 0
-        self.yawn_consecutive_frames = 15
         self.yawn_alarm_on = False
+        self.fatigue_alarm_on = False
         
         # Emergency contact variables
-        self.drowsy_start_time = None
-        self.emergency_timeout = 15  # seconds
-        self.emergency_triggered = False
         self.emergency_contact_name = StringVar()
         self.emergency_contact_phone = StringVar()
         self.emergency_contact_email = StringVar()
         
+        # Emergency alerts are delivered in the background with retries
+        self.alerts = AlertDispatcher(default_transports()).start()
+        
+        # Optional fleet telemetry streamed to a telemetry_collector.py,
+        # e.g. DROWSINESS_TELEMETRY=tcp://127.0.0.1:9500
+        self.telemetry = None
+        if os.environ.get("DROWSINESS_TELEMETRY"):
+            self.telemetry = TelemetryClient(os.environ["DROWSINESS_TELEMETRY"], os.environ.get("DROWSINESS_USER", ""),
+                                             os.environ.get("DROWSINESS_FLEET", "")).start()
+        
         # Statistics variables
-        self.drowsy_episodes = 0
-        self.yawn_episodes = 0
         self.last_alert_time = None
         self.total_monitoring_time = 0
         self.monitoring_start_time = None
         
-        # Load face detector and shape predictor
-        self.detector = dlib.get_frontal_face_detector()
-        # You need to download shape_predictor_68_face_landmarks.dat from:
-        # http://dlib.net/files/shape_predictor_68_face_landmarks.dat.bz2
-        self.predictor = dlib.shape_predictor("shape_predictor_68_face_landmarks.dat")
+        # Detection engine holding the face detector, shape predictor and alert state.
+        # The models are loaded in the background by load_resources.
+        self.pipeline = FramePipeline(load=False)
+        # Face detector picked in the settings; the pipeline switches to it
+        # once the models have loaded, until then it loads its default
+        self.detector_backend = self.pipeline.detector_backend
         
-        # Define eye landmarks indices
-        self.left_eye_start = 42
-        self.left_eye_end = 48
-        self.right_eye_start = 36
-        self.right_eye_end = 42
+        # Analysis rate control, attached to the pipeline while enabled
+        self.adaptive_scheduler = AdaptiveScheduler(min_rate=5, max_rate=30)
         
-        # Define mouth landmarks indices
-        self.mouth_start = 48
-        self.mouth_end = 68
+        # Alarm sound, loaded in the background together with the models
+        self.alarm_sound = AlarmSound("alarm.wav")
         
-        # Load alarm sounds
-        pygame.mixer.music.load("alarm.wav")  # Create an alarm.wav file or use any sound file
+        # Loading progress written by the loader thread and shown by poll_loading
+        self.loading_step = 0
+        self.loading_message = "Loading alarm sound..."
+        self.loading_error = None
+        self.loading_done = False
         
         # Create UI components
         self.create_ui()
+        self.start_loading()
         
         # Initialize session data
         self.session_data = {
@@ -108,6 +134,7 @@ class DrowsinessDetector:
         # Video label
         self.video_label = Label(self.video_panel)
         self.video_label.pack(padx=10, pady=10, fill="both", expand=True)
+        self.preview = PreviewRenderer(self.video_label)
         
         # Create right panel for controls
         control_panel = Frame(main_frame, bg="#ffffff", width=350, highlightbackground="#ddd", highlightthickness=1)
@@ -139,6 +166,11 @@ class DrowsinessDetector:
         self.status_label = Label(status_frame, text="Not Monitoring", font=("Helvetica", 14), bg="#ffffff", fg="#f44336")
         self.status_label.pack(anchor="w", pady=5)
         
+        self.loading_label = Label(status_frame, text="", font=("Helvetica", 10), bg="#ffffff", fg="#555")
+        self.loading_label.pack(anchor="w")
+        self.loading_bar = ttk.Progressbar(status_frame, maximum=LOADING_STEPS, length=250, mode="determinate")
+        self.loading_bar.pack(anchor="w", pady=(0, 5))
+        
         self.eye_status_label = Label(status_frame, text="Eye Status: -", font=("Helvetica", 12), bg="#ffffff")
         self.eye_status_label.pack(anchor="w", pady=2)
         
@@ -151,6 +183,16 @@ class DrowsinessDetector:
         self.mouth_distance_label = Label(status_frame, text="Mouth Distance: -", font=("Helvetica", 12), bg="#ffffff")
         self.mouth_distance_label.pack(anchor="w", pady=2)
         
+        # Rolling fatigue metrics
+        self.perclos_label = Label(status_frame, text="PERCLOS (1 min): -", font=("Helvetica", 12), bg="#ffffff")
+        self.perclos_label.pack(anchor="w", pady=2)
+        
+        self.blink_rate_label = Label(status_frame, text="Blink Rate: -", font=("Helvetica", 12), bg="#ffffff")
+        self.blink_rate_label.pack(anchor="w", pady=2)
+        
+        self.yawn_rate_label = Label(status_frame, text="Yawns (10 min): -", font=("Helvetica", 12), bg="#ffffff")
+        self.yawn_rate_label.pack(anchor="w", pady=2)
+        
         self.monitoring_time_label = Label(status_frame, text="Monitoring Time: 00:00:00", font=("Helvetica", 12), bg="#ffffff")
         self.monitoring_time_label.pack(anchor="w", pady=10)
         
@@ -168,7 +210,7 @@ class DrowsinessDetector:
         self.threshold_scale = Scale(settings_frame, from_=0.15, to=0.35, orient=HORIZONTAL, 
                                      resolution=0.01, length=250, bg="#ffffff", highlightthickness=0,
                                      command=self.update_threshold)
-        self.threshold_scale.set(self.eye_aspect_ratio_threshold)
+        self.threshold_scale.set(self.pipeline.eye_aspect_ratio_threshold)
         self.threshold_scale.pack(anchor="w")
         
         Label(settings_frame, text="Consecutive Frames:", font=("Helvetica", 12), bg="#ffffff").pack(anchor="w", pady=2)
@@ -176,9 +218,17 @@ class DrowsinessDetector:
         self.frames_scale = Scale(settings_frame, from_=5, to=50, orient=HORIZONTAL, 
                                   resolution=1, length=250, bg="#ffffff", highlightthickness=0,
                                   command=self.update_frames)
-        self.frames_scale.set(self.eye_aspect_ratio_consecutive_frames)
+        self.frames_scale.set(self.pipeline.eye_aspect_ratio_consecutive_frames)
         self.frames_scale.pack(anchor="w")
         
+        Label(settings_frame, text="Eyes Closed Duration (ms):", font=("Helvetica", 12), bg="#ffffff").pack(anchor="w", pady=2)
+        
+        self.eyes_closed_ms_scale = Scale(settings_frame, from_=200, to=3000, orient=HORIZONTAL, 
+                                          resolution=100, length=250, bg="#ffffff", highlightthickness=0,
+                                          command=self.update_eyes_closed_ms)
+        self.eyes_closed_ms_scale.set(self.pipeline.eyes_closed_window_ms)
+        self.eyes_closed_ms_scale.pack(anchor="w")
+        
         # Yawn detection settings
         Label(settings_frame, text="Yawn Detection", font=("Helvetica", 14), bg="#ffffff", fg="#2e4057").pack(anchor="w", pady=5)
         
@@ -187,7 +237,7 @@ class DrowsinessDetector:
         self.yawn_threshold_scale = Scale(settings_frame, from_=20, to=40, orient=HORIZONTAL, 
                                      resolution=1, length=250, bg="#ffffff", highlightthickness=0,
                                      command=self.update_yawn_threshold)
-        self.yawn_threshold_scale.set(self.yawn_threshold)
+        self.yawn_threshold_scale.set(self.pipeline.yawn_threshold)
         self.yawn_threshold_scale.pack(anchor="w")
         
         Label(settings_frame, text="Consecutive Frames:", font=("Helvetica", 12), bg="#ffffff").pack(anchor="w", pady=2)
@@ -195,9 +245,133 @@ class DrowsinessDetector:
         self.yawn_frames_scale = Scale(settings_frame, from_=5, to=30, orient=HORIZONTAL, 
                                   resolution=1, length=250, bg="#ffffff", highlightthickness=0,
                                   command=self.update_yawn_frames)
-        self.yawn_frames_scale.set(self.yawn_consecutive_frames)
+        self.yawn_frames_scale.set(self.pipeline.yawn_consecutive_frames)
         self.yawn_frames_scale.pack(anchor="w")
         
+        Label(settings_frame, text="Yawn Duration (ms):", font=("Helvetica", 12), bg="#ffffff").pack(anchor="w", pady=2)
+        
+        self.yawn_ms_scale = Scale(settings_frame, from_=200, to=3000, orient=HORIZONTAL, 
+                                   resolution=100, length=250, bg="#ffffff", highlightthickness=0,
+                                   command=self.update_yawn_ms)
+        self.yawn_ms_scale.set(self.pipeline.yawn_window_ms)
+        self.yawn_ms_scale.pack(anchor="w")
+        
+        self.time_windows_var = BooleanVar(value=self.pipeline.time_windows)
+        Checkbutton(settings_frame, text="Use Durations Instead of Frame Counts", variable=self.time_windows_var,
+                    font=("Helvetica", 12), bg="#ffffff", command=self.update_time_windows).pack(anchor="w", pady=5)
+        
+        # Face detector backend
+        Label(settings_frame, text="Face Detector:", font=("Helvetica", 12), bg="#ffffff").pack(anchor="w", pady=2)
+        
+        self.detector_backend_var = StringVar(value=self.pipeline.detector_backend)
+        detector_box = ttk.Combobox(settings_frame, textvariable=self.detector_backend_var,
+                                    values=DETECTOR_BACKENDS, state="readonly", width=12)
+        detector_box.bind("<<ComboboxSelected>>", self.update_detector_backend)
+        detector_box.pack(anchor="w")
+        
+        # Face selection settings
+        Label(settings_frame, text="Monitored Face:", font=("Helvetica", 12), bg="#ffffff").pack(anchor="w", pady=2)
+        
+        self.face_selection_var = StringVar(value=self.pipeline.face_selection)
+        face_selection_box = ttk.Combobox(settings_frame, textvariable=self.face_selection_var,
+                                          values=FACE_SELECTIONS, state="readonly", width=12)
+        face_selection_box.bind("<<ComboboxSelected>>", self.update_face_selection)
+        face_selection_box.pack(anchor="w")
+        
+        self.multi_face_var = BooleanVar(value=self.pipeline.multi_face)
+        Checkbutton(settings_frame, text="Monitor All Faces Separately", variable=self.multi_face_var,
+                    font=("Helvetica", 12), bg="#ffffff", command=self.update_multi_face).pack(anchor="w")
+        
+        # Optional alarms on the rolling fatigue metrics
+        Label(settings_frame, text="Fatigue Alarms", font=("Helvetica", 14), bg="#ffffff", fg="#2e4057").pack(anchor="w", pady=5)
+        
+        Label(settings_frame, text="PERCLOS Alarm (%, 0 = off):", font=("Helvetica", 12), bg="#ffffff").pack(anchor="w", pady=2)
+        
+        self.perclos_scale = Scale(settings_frame, from_=0, to=50, orient=HORIZONTAL, 
+                                   resolution=1, length=250, bg="#ffffff", highlightthickness=0,
+                                   command=self.update_perclos_threshold)
+        self.perclos_scale.set(0)
+        self.perclos_scale.pack(anchor="w")
+        
+        Label(settings_frame, text="Yawns per 10 min Alarm (0 = off):", font=("Helvetica", 12), bg="#ffffff").pack(anchor="w", pady=2)
+        
+        self.yawn_rate_scale = Scale(settings_frame, from_=0, to=10, orient=HORIZONTAL, 
+                                     resolution=1, length=250, bg="#ffffff", highlightthickness=0,
+                                     command=self.update_yawn_rate_threshold)
+        self.yawn_rate_scale.set(0)
+        self.yawn_rate_scale.pack(anchor="w")
+        
+        # Performance settings
+        Label(settings_frame, text="Performance", font=("Helvetica", 14), bg="#ffffff", fg="#2e4057").pack(anchor="w", pady=5)
+        
+        Label(settings_frame, text="Detect Faces Every N Frames:", font=("Helvetica", 12), bg="#ffffff").pack(anchor="w", pady=2)
+        
+        self.detection_interval_scale = Scale(settings_frame, from_=1, to=15, orient=HORIZONTAL, 
+                                              resolution=1, length=250, bg="#ffffff", highlightthickness=0,
+                                              command=self.update_detection_interval)
+        self.detection_interval_scale.set(self.pipeline.detection_interval)
+        self.detection_interval_scale.pack(anchor="w")
+        
+        Label(settings_frame, text="Detection Scale:", font=("Helvetica", 12), bg="#ffffff").pack(anchor="w", pady=2)
+        
+        self.detection_scale_scale = Scale(settings_frame, from_=0.25, to=1.0, orient=HORIZONTAL, 
+                                           resolution=0.05, length=250, bg="#ffffff", highlightthickness=0,
+                                           command=self.update_detection_scale)
+        self.detection_scale_scale.set(self.pipeline.detection_scale)
+        self.detection_scale_scale.pack(anchor="w")
+        
+        Label(settings_frame, text="UI Refresh Rate (Hz):", font=("Helvetica", 12), bg="#ffffff").pack(anchor="w", pady=2)
+        
+        self.ui_refresh_scale = Scale(settings_frame, from_=5, to=30, orient=HORIZONTAL, 
+                                      resolution=1, length=250, bg="#ffffff", highlightthickness=0,
+                                      command=self.update_ui_refresh_rate)
+        self.ui_refresh_scale.set(self.ui_refresh_rate)
+        self.ui_refresh_scale.pack(anchor="w")
+        
+        self.show_preview_var = BooleanVar(value=self.show_preview)
+        Checkbutton(settings_frame, text="Show Video Preview", variable=self.show_preview_var,
+                    font=("Helvetica", 12), bg="#ffffff", command=self.update_show_preview).pack(anchor="w", pady=5)
+        
+        self.adaptive_rate_var = BooleanVar(value=False)
+        Checkbutton(settings_frame, text="Adaptive Analysis Rate", variable=self.adaptive_rate_var,
+                    font=("Helvetica", 12), bg="#ffffff", command=self.update_adaptive_rate).pack(anchor="w", pady=(5, 0))
+        
+        Label(settings_frame, text="Minimum Analysis Rate (fps):", font=("Helvetica", 12), bg="#ffffff").pack(anchor="w", pady=2)
+        
+        self.min_rate_scale = Scale(settings_frame, from_=1, to=15, orient=HORIZONTAL, 
+                                    resolution=1, length=250, bg="#ffffff", highlightthickness=0,
+                                    command=self.update_min_rate)
+        self.min_rate_scale.set(self.adaptive_scheduler.min_rate)
+        self.min_rate_scale.pack(anchor="w")
+        
+        Label(settings_frame, text="Maximum Analysis Rate (fps):", font=("Helvetica", 12), bg="#ffffff").pack(anchor="w", pady=2)
+        
+        self.max_rate_scale = Scale(settings_frame, from_=5, to=60, orient=HORIZONTAL, 
+                                    resolution=1, length=250, bg="#ffffff", highlightthickness=0,
+                                    command=self.update_max_rate)
+        self.max_rate_scale.set(self.adaptive_scheduler.max_rate)
+        self.max_rate_scale.pack(anchor="w")
+        
+        self.adaptive_delay_label = Label(settings_frame, text="", font=("Helvetica", 9), bg="#ffffff", fg="#555")
+        self.adaptive_delay_label.pack(anchor="w")
+        self.update_adaptive_delay_label()
+        
+        self.record_metrics_var = BooleanVar(value=self.record_metrics)
+        Checkbutton(settings_frame, text="Record Per-Frame Metrics", variable=self.record_metrics_var,
+                    font=("Helvetica", 12), bg="#ffffff", command=self.update_record_metrics).pack(anchor="w")
+        
+        self.save_clips_var = BooleanVar(value=self.save_clips)
+        Checkbutton(settings_frame, text="Save Alert Clips", variable=self.save_clips_var,
+                    font=("Helvetica", 12), bg="#ffffff", command=self.update_save_clips).pack(anchor="w")
+        
+        self.pipelined_var = BooleanVar(value=self.pipelined)
+        Checkbutton(settings_frame, text="Overlap Processing Stages", variable=self.pipelined_var,
+                    font=("Helvetica", 12), bg="#ffffff", command=self.update_pipelined).pack(anchor="w")
+        
+        self.reuse_buffers_var = BooleanVar(value=self.reuse_buffers)
+        Checkbutton(settings_frame, text="Reuse Frame Buffers", variable=self.reuse_buffers_var,
+                    font=("Helvetica", 12), bg="#ffffff", command=self.update_reuse_buffers).pack(anchor="w")
+        
         # Emergency contact tab
         emergency_frame = Frame(emergency_tab, bg="#ffffff")
         emergency_frame.pack(fill="x", padx=20, pady=20)
@@ -241,6 +415,20 @@ class DrowsinessDetector:
         self.last_alert_label = Label(stats_frame, text="Last Alert: -", font=("Helvetica", 12), bg="#ffffff")
         self.last_alert_label.pack(anchor="w", pady=2)
         
+        self.frames_label = Label(stats_frame, text="Frames Processed: 0 (0 dropped, 0 skipped)", font=("Helvetica", 12), bg="#ffffff")
+        self.frames_label.pack(anchor="w", pady=2)
+        
+        Label(stats_frame, text="Performance", font=("Helvetica", 14), bg="#ffffff", fg="#2e4057").pack(anchor="w", pady=(10, 2))
+        
+        self.latency_label = Label(stats_frame, text="Effective FPS: -", font=("Helvetica", 9), bg="#ffffff", justify="left")
+        self.latency_label.pack(anchor="w", pady=2)
+        
+        self.alert_delivery_label = Label(stats_frame, text="Alert Delivery: -", font=("Helvetica", 9), bg="#ffffff", justify="left")
+        self.alert_delivery_label.pack(anchor="w", pady=2)
+        
+        self.clips_label = Label(stats_frame, text="Alert Clips: -", font=("Helvetica", 9), bg="#ffffff", justify="left")
+        self.clips_label.pack(anchor="w", pady=2)
+        
         Button(stats_frame, text="Export Statistics", font=("Helvetica", 12), 
               bg="#2196f3", fg="white", width=15,
               command=self.export_statistics).pack(anchor="w", pady=10)
@@ -260,16 +448,101 @@ class DrowsinessDetector:
         self.stop_button.pack(side="right", padx=5)
     
     def update_threshold(self, val):
-        self.eye_aspect_ratio_threshold = float(val)
+        self.pipeline.eye_aspect_ratio_threshold = float(val)
     
     def update_frames(self, val):
-        self.eye_aspect_ratio_consecutive_frames = int(val)
+        self.pipeline.eye_aspect_ratio_consecutive_frames = int(val)
     
     def update_yawn_threshold(self, val):
-        self.yawn_threshold = int(val)
+        self.pipeline.yawn_threshold = int(val)
     
     def update_yawn_frames(self, val):
-        self.yawn_consecutive_frames = int(val)
+        self.pipeline.yawn_consecutive_frames = int(val)
+    
+    def update_eyes_closed_ms(self, val):
+        self.pipeline.eyes_closed_window_ms = int(val)
+    
+    def update_yawn_ms(self, val):
+        self.pipeline.yawn_window_ms = int(val)
+    
+    def update_time_windows(self):
+        self.pipeline.time_windows = self.time_windows_var.get()
+    
+    def update_detector_backend(self, event=None):
+        self.detector_backend = self.detector_backend_var.get()
+        # While loading, poll_loading applies it when the models are ready
+        if self.pipeline.ready:
+            self.apply_detector_backend()
+    
+    def apply_detector_backend(self):
+        """Switch the pipeline to the face detector picked in the settings"""
+        if self.detector_backend == self.pipeline.detector_backend:
+            return
+        try:
+            self.pipeline.set_detector(self.detector_backend)
+        except Exception as e:
+            messagebox.showerror("Error", f"Could not switch face detector: {str(e)}")
+            self.detector_backend = self.pipeline.detector_backend
+            self.detector_backend_var.set(self.detector_backend)
+    
+    def update_face_selection(self, event=None):
+        self.pipeline.face_selection = self.face_selection_var.get()
+    
+    def update_multi_face(self):
+        # Switching modes changes which faces have alert state, so restart tracking
+        self.pipeline.multi_face = self.multi_face_var.get()
+        self.pipeline.reset_tracking()
+    
+    def update_perclos_threshold(self, val):
+        self.pipeline.perclos_threshold = int(val) / 100 if int(val) else None
+    
+    def update_yawn_rate_threshold(self, val):
+        self.pipeline.yawn_rate_threshold = int(val) or None
+    
+    def update_detection_interval(self, val):
+        self.pipeline.detection_interval = int(val)
+    
+    def update_detection_scale(self, val):
+        self.pipeline.detection_scale = float(val)
+    
+    def update_ui_refresh_rate(self, val):
+        self.ui_refresh_rate = int(val)
+    
+    def update_show_preview(self):
+        self.show_preview = self.show_preview_var.get()
+        if not self.show_preview:
+            self.preview.clear()
+    
+    def update_adaptive_rate(self):
+        self.pipeline.scheduler = self.adaptive_scheduler if self.adaptive_rate_var.get() else None
+        self.adaptive_scheduler.reset()
+    
+    def update_min_rate(self, val):
+        self.adaptive_scheduler.min_rate = int(val)
+        self.update_adaptive_delay_label()
+    
+    def update_max_rate(self, val):
+        self.adaptive_scheduler.max_rate = int(val)
+    
+    def update_adaptive_delay_label(self):
+        delay_ms = self.adaptive_scheduler.max_delay() * 1000
+        self.adaptive_delay_label.config(text=f"Alarms are delayed by at most {delay_ms:.0f} ms")
+    
+    def update_record_metrics(self):
+        # Takes effect when the next monitoring session starts
+        self.record_metrics = self.record_metrics_var.get()
+    
+    def update_save_clips(self):
+        # Takes effect when the next monitoring session starts
+        self.save_clips = self.save_clips_var.get()
+    
+    def update_pipelined(self):
+        # Takes effect when the next monitoring session starts
+        self.pipelined = self.pipelined_var.get()
+    
+    def update_reuse_buffers(self):
+        # Takes effect when the next monitoring session starts
+        self.reuse_buffers = self.reuse_buffers_var.get()
     
     def save_emergency_contact(self):
         if not self.emergency_contact_name.get() or not (self.emergency_contact_phone.get() or self.emergency_contact_email.get()):
@@ -285,10 +558,46 @@ class DrowsinessDetector:
         
         try:
             self.send_emergency_alert(test=True)
-            messagebox.showinfo("Success", "Test alert sent successfully!")
+            messagebox.showinfo("Success", "Test alert queued for delivery. Delivery results are shown in the Statistics tab.")
         except Exception as e:
             messagebox.showerror("Error", f"Failed to send test alert: {str(e)}")
     
+    def start_loading(self):
+        """Load the alarm sound and models on a background thread"""
+        self.start_button.config(state="disabled")
+        threading.Thread(target=self.load_resources, daemon=True).start()
+        self.poll_loading()
+    
+    def load_resources(self):
+        def progress(message):
+            self.loading_step += 1
+            self.loading_message = message
+        
+        try:
+            self.alarm_sound.load()
+            self.pipeline.load_models(progress)
+        except Exception as e:
+            self.loading_error = e
+            print(f"Failed to load models: {e}")
+        self.loading_step = LOADING_STEPS
+        self.loading_done = True
+    
+    def poll_loading(self):
+        """Show loading progress on the Tk thread until loading has finished"""
+        if not self.loading_done:
+            self.loading_label.config(text=self.loading_message)
+            self.loading_bar.config(value=self.loading_step)
+            self.root.after(100, self.poll_loading)
+            return
+        
+        self.loading_bar.pack_forget()
+        if self.loading_error is not None:
+            self.loading_label.config(text=f"Failed to load face model: {self.loading_error}", fg="#f44336")
+            return
+        self.loading_label.pack_forget()
+        self.apply_detector_backend()
+        self.start_button.config(state="normal")
+    
     def toggle_monitoring(self):
         if not self.is_running:
             self.is_running = True
@@ -296,19 +605,49 @@ class DrowsinessDetector:
             self.status_label.config(text="Monitoring Active", fg="#4caf50")
             
             # Reset statistics for new session
-            self.drowsy_episodes = 0
-            self.yawn_episodes = 0
+            self.pipeline.reset_session()
+            self.session_data["drowsy_episodes"] = 0
+            self.session_data["yawn_episodes"] = 0
             self.session_data["emergency_contacts"] = 0
+            self.session_data["metrics_file"] = None
+            self.session_data["fatigue"] = None
+            self.session_data["fatigue_alerts"] = 0
+            self.recorder = MetricsRecorder() if self.record_metrics else None
+            self.session_data["clips"] = []
+            self.clips = ClipRecorder("reports/clips").start() if self.save_clips else None
+            # Frames, grayscale images and landmarks from preallocated buffers,
+            # with room for every frame the stages and the preview hold at once
+            self.pipeline.buffers = None
+            if self.reuse_buffers:
+                self.pipeline.buffers = BufferPool(8 + (frames_in_flight() if self.pipelined else 0))
             self.monitoring_start_time = time.time()
             self.session_data["start_time"] = datetime.datetime.now()
+            if self.telemetry is not None:
+                self.telemetry.emit(SESSION_START)
+            self.eye_status = None
+            self.yawn_status = None
+            self.last_ear = None
+            self.last_mouth_distance = None
             
-            # Start timer update
+            # Start timer and UI refresh updates
             self.update_monitoring_time()
+            self.ui_state.clear()
+            self.applied_widget_state.clear()
+            self.refresh_ui()
             
-            # Start video stream in a separate thread
-            threading.Thread(target=self.start_video_stream, daemon=True).start()
+            # Start video stream in a separate thread, which has its own stop
+            # signal so a quick restart cannot keep the previous one running
+            self.video_stop = threading.Event()
+            self.video_thread = threading.Thread(target=self.start_video_stream, args=(self.video_stop,),
+                                                 daemon=True)
+            self.video_thread.start()
         else:
             self.is_running = False
+            self.video_stop.set()
+            if self.ui_refresh_job is not None:
+                self.root.after_cancel(self.ui_refresh_job)
+                self.ui_refresh_job = None
+            self.applied_widget_state.clear()
             self.start_button.config(text="Start Monitoring", bg="#4caf50")
             self.status_label.config(text="Not Monitoring", fg="#f44336")
             self.eye_status_label.config(text="Eye Status: -")
@@ -316,13 +655,24 @@ class DrowsinessDetector:
             self.yawn_status_label.config(text="Yawn Status: -")
             self.mouth_distance_label.config(text="Mouth Distance: -")
             
-            # Save session end time
+            # Wait for the video thread to leave its loop, so it no longer
+            # records metrics or raises alarms for this session
+            self.video_thread.join(timeout=5)
+            
+            # Save session end time and performance figures
             self.session_data["end_time"] = datetime.datetime.now()
+            self.session_data["performance"] = self.pipeline.timings.summary()
+            self.session_data["alert_delivery"] = self.alerts.metrics()
+            self.save_recording()
+            if self.telemetry is not None:
+                self.telemetry.emit(SESSION_STOP)
             
             if self.alarm_on:
                 self.stop_alarm()
             if self.yawn_alarm_on:
                 self.stop_yawn_alarm()
+            if self.fatigue_alarm_on:
+                self.stop_fatigue_alarm()
     
     def update_monitoring_time(self):
         if self.is_running and self.monitoring_start_time:
@@ -332,216 +682,250 @@ class DrowsinessDetector:
             time_str = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
             self.monitoring_time_label.config(text=f"Monitoring Time: {time_str}")
             
+            if self.grabber is not None:
+                self.frames_label.config(text=f"Frames Processed: {self.grabber.frames_processed} "
+                                              f"({self.grabber.frames_dropped} dropped, {self.pipeline.frames_skipped} skipped)")
+            self.latency_label.config(text="\n".join(self.pipeline.timings.format_lines()))
+            self.alert_delivery_label.config(text="\n".join(self.format_alert_metrics()))
+            self.clips_label.config(text=self.format_clip_metrics())
+            
             # Schedule next update
             self.root.after(1000, self.update_monitoring_time)
     
-    def start_video_stream(self):
-        cap = cv2.VideoCapture(0)  # Use 0 for default camera
-        
-        while self.is_running:
-            ret, frame = cap.read()
-            if not ret:
-                print("Failed to grab frame")
-                break
-                
-            # Convert to grayscale for face detection
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            
-            # Detect faces
-            faces = self.detector(gray, 0)
-            
-            # Process each face
-            for face in faces:
-                # Get facial landmarks
-                landmarks = self.predictor(gray, face)
-                
-                # Calculate eye aspect ratio
-                left_eye = []
-                right_eye = []
-                
-                for n in range(self.left_eye_start, self.left_eye_end):
-                    x = landmarks.part(n).x
-                    y = landmarks.part(n).y
-                    left_eye.append((x, y))
-                    cv2.circle(frame, (x, y), 1, (0, 255, 0), -1)
-                
-                for n in range(self.right_eye_start, self.right_eye_end):
-                    x = landmarks.part(n).x
-                    y = landmarks.part(n).y
-                    right_eye.append((x, y))
-                    cv2.circle(frame, (x, y), 1, (0, 255, 0), -1)
-                
-                # Calculate EAR for both eyes
-                left_ear = self.eye_aspect_ratio(left_eye)
-                right_ear = self.eye_aspect_ratio(right_eye)
-                
-                # Average the EAR
-                ear = (left_ear + right_ear) / 2.0
-                
-                # Update UI with current EAR value
-                self.root.after(1, lambda e=ear: self.ear_value_label.config(text=f"EAR: {e:.2f}"))
-                
-                # Draw eye contours
-                leftEyeHull = cv2.convexHull(np.array(left_eye))
-                rightEyeHull = cv2.convexHull(np.array(right_eye))
-                cv2.drawContours(frame, [leftEyeHull], -1, (0, 255, 0), 1)
-                cv2.drawContours(frame, [rightEyeHull], -1, (0, 255, 0), 1)
-                
-                # Get mouth landmarks for yawn detection
-                mouth = []
-                for n in range(self.mouth_start, self.mouth_end):
-                    x = landmarks.part(n).x
-                    y = landmarks.part(n).y
-                    mouth.append((x, y))
-                    cv2.circle(frame, (x, y), 1, (0, 255, 0), -1)
-                
-                # Calculate mouth aspect ratio or vertical distance
-                mouth_top = landmarks.part(62).y  # Top of the mouth
-                mouth_bottom = landmarks.part(66).y  # Bottom of the mouth
-                mouth_distance = abs(mouth_top - mouth_bottom)
-                
-                # Update UI with current mouth distance
-                self.root.after(1, lambda d=mouth_distance: self.mouth_distance_label.config(text=f"Mouth Distance: {d}"))
-                
-                # Draw mouth contour
-                mouthHull = cv2.convexHull(np.array(mouth))
-                cv2.drawContours(frame, [mouthHull], -1, (0, 255, 0), 1)
-                
-                # Process yawn detection
-                if mouth_distance > self.yawn_threshold:
-                    self.yawn_counter += 1
-                    if self.yawn_counter >= self.yawn_consecutive_frames:
-                        # Alert for yawn
-                        if not self.yawn_alarm_on:
-                            self.yawn_alarm_on = True
-                            threading.Thread(target=self.start_yawn_alarm, daemon=True).start()
-                            
-                            # Increment yawn counter
-                            self.yawn_episodes += 1
-                            self.session_data["yawn_episodes"] = self.yawn_episodes
-                            self.root.after(1, lambda: self.yawn_count_label.config(text=f"Yawn Episodes: {self.yawn_episodes}"))
-                        
-                        cv2.putText(frame, "YAWN DETECTED!", (10, 90),
-                                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-                        self.root.after(1, lambda: self.yawn_status_label.config(text="Yawn Status: YAWNING", fg="#f44336"))
-                else:
-                    self.yawn_counter = 0
-                    if self.yawn_alarm_on:
-                        self.stop_yawn_alarm()
-                    self.root.after(1, lambda: self.yawn_status_label.config(text="Yawn Status: NORMAL", fg="#4caf50"))
-                
-                # Check if eyes are closed based on EAR
-                if ear < self.eye_aspect_ratio_threshold:
-                    self.counter += 1
-                    
-                    if self.counter >= self.eye_aspect_ratio_consecutive_frames:
-                        # Start timing for emergency contact
-                        if self.drowsy_start_time is None:
-                            self.drowsy_start_time = time.time()
-                            # Increment drowsy episode counter
-                            self.drowsy_episodes += 1
-                            self.session_data["drowsy_episodes"] = self.drowsy_episodes
-                            self.root.after(1, lambda: self.drowsy_count_label.config(text=f"Drowsy Episodes: {self.drowsy_episodes}"))
-                        
-                        # Check if drowsy for more than emergency timeout
-                        if not self.emergency_triggered and self.drowsy_start_time is not None:
-                            drowsy_duration = time.time() - self.drowsy_start_time
-                            if drowsy_duration > self.emergency_timeout:
-                                self.emergency_triggered = True
-                                threading.Thread(target=self.send_emergency_alert, daemon=True).start()
-                        
-                        # Alert the user
-                        if not self.alarm_on:
-                            self.alarm_on = True
-                            threading.Thread(target=self.start_alarm, daemon=True).start()
-                        
-                        # Draw alert on frame
-                        cv2.putText(frame, "DROWSINESS ALERT!", (10, 30),
-                                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-                        
-                        # Update UI
-                        self.root.after(1, lambda: self.eye_status_label.config(text="Eye Status: CLOSED", fg="#f44336"))
-                else:
-                    self.counter = 0
-                    self.drowsy_start_time = None
-                    self.emergency_triggered = False
-                    
-                    if self.alarm_on:
-                        self.stop_alarm()
-                    
-                    # Update UI
-                    self.root.after(1, lambda: self.eye_status_label.config(text="Eye Status: OPEN", fg="#4caf50"))
-            
-            # Convert frame to display in UI
-            self.frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            self.display_frame()
-            
-        cap.release()
-    
-    def eye_aspect_ratio(self, eye):
-        # Compute the euclidean distances between the two sets of
-        # vertical eye landmarks (x, y)-coordinates
-        A = distance.euclidean(eye[1], eye[5])
-        B = distance.euclidean(eye[2], eye[4])
-        
-        # Compute the euclidean distance between the horizontal
-        # eye landmark (x, y)-coordinates
-        C = distance.euclidean(eye[0], eye[3])
-        
-        # Compute the eye aspect ratio
-        ear = (A + B) / (2.0 * C)
-        
-        return ear
-    
-    def display_frame(self):
-        if self.frame is not None:
-            # Resize frame for display if needed
-            h, w = self.frame.shape[:2]
-            max_w = 800  # Maximum width for display
-            if w > max_w:
-                ratio = max_w / w
-                new_h = int(h * ratio)
-                self.frame = cv2.resize(self.frame, (max_w, new_h))
+    def start_video_stream(self, stopped):
+        # Alert clips and the grabber of this session are finished by this
+        # thread when it ends, whatever session runs by then
+        clips = self.clips
+        
+        # Capture runs on its own thread so detection always gets the newest frame
+        grabber = FrameGrabber(0, timings=self.pipeline.timings,  # Use 0 for default camera
+                               buffers=self.pipeline.buffers)
+        self.grabber = grabber
+        if not grabber.start():
+            print("Failed to open camera")
+            if clips is not None:
+                clips.stop()
+            return
+        
+        # Detection and landmarks of the next frames run on their own
+        # threads while this one draws and publishes the current frame
+        stages = StagedPipeline(self.pipeline, grabber).start() if self.pipelined else None
+        
+        while not stopped.is_set():
+            source = grabber if stages is None else stages
+            item = source.read(timeout=1.0)
+            if item is None:
+                if source.finished:
+                    print("Failed to grab frame")
+                    break
+                continue
             
-            img = Image.fromarray(self.frame)
-            img = ImageTk.PhotoImage(image=img)
+            # Run detection and draw landmarks and alerts onto the frame,
+            # the drawing is only needed while the preview is shown
+            if stages is None:
+                frame, timestamp = item
+                result = self.pipeline.process(frame, timestamp)
+            else:
+                frame, timestamp, result = item
+            recorder = self.recorder
+            if recorder is not None:
+                recorder.record(result)
+            if clips is not None:
+                # Buffered before the landmarks are drawn on the frame
+                clips.feed(frame, timestamp)
+            if self.show_preview:
+                self.pipeline.annotate(frame, result)
             
-            self.video_label.config(image=img)
-            self.video_label.image = img
+            self.handle_result(result, frame if self.show_preview else None)
+        
+        if stages is not None:
+            stages.stop()
+        grabber.stop()
+        if clips is not None:
+            # Writes the clip still being collected and any queued clips
+            clips.stop()
     
-    def start_alarm(self):
-        pygame.mixer.music.play(-1)  # -1 loops the sound
+    def save_recording(self):
+        """Write the per-frame metrics of the session to the reports directory"""
+        recorder, self.recorder = self.recorder, None
+        if recorder is None or not len(recorder):
+            return
+        
+        try:
+            if not os.path.exists("reports"):
+                os.makedirs("reports")
+            timestamp = self.session_data["start_time"].strftime("%Y%m%d_%H%M%S")
+            self.session_data["metrics_file"] = recorder.save(f"reports/metrics_{timestamp}.npz")
+            print(f"Recorded {len(recorder)} frames to {self.session_data['metrics_file']}")
+        except Exception as e:
+            print(f"Error saving metrics recording: {e}")
+    
+    def save_clip(self, kind, timestamp):
+        """Have the clip recorder capture footage around an alert"""
+        if self.clips is None:
+            return
+        path = self.clips.trigger(kind, timestamp)
+        if path is not None and path not in self.session_data["clips"]:
+            self.session_data["clips"].append(path)
+    
+    def handle_result(self, result, frame):
+        """Start or stop alarms for a pipeline result and publish the UI state"""
+        for event in result.events:
+            if event == YAWN_ALARM_START:
+                self.yawn_alarm_on = True
+                self.save_clip("yawn", result.timestamp)
+                threading.Thread(target=self.start_yawn_alarm, daemon=True).start()
+            elif event == YAWN_ALARM_STOP:
+                if self.yawn_alarm_on:
+                    self.stop_yawn_alarm()
+            elif event == EMERGENCY:
+                self.send_emergency_alert()
+            elif event == DROWSY_ALARM_START:
+                self.alarm_on = True
+                self.save_clip("drowsy", result.timestamp)
+                self.last_alert_time = datetime.datetime.now().strftime("%H:%M:%S")
+                threading.Thread(target=self.start_alarm, daemon=True).start()
+            elif event == DROWSY_ALARM_STOP:
+                if self.alarm_on:
+                    self.stop_alarm()
+            elif event == FATIGUE_ALARM_START:
+                self.fatigue_alarm_on = True
+                self.last_alert_time = datetime.datetime.now().strftime("%H:%M:%S")
+                threading.Thread(target=self.start_alarm, daemon=True).start()
+            elif event == FATIGUE_ALARM_STOP:
+                if self.fatigue_alarm_on:
+                    self.stop_fatigue_alarm()
+        
+        if self.telemetry is not None:
+            self.telemetry.emit_events(result.events, result.timestamp)
+            self.telemetry.emit_timings(self.pipeline.timings, result.timestamp)
+        
+        # Statuses only change on frames that report them
+        if result.eye_status is not None:
+            self.eye_status = result.eye_status
+        if result.yawn_status is not None:
+            self.yawn_status = result.yawn_status
+        if result.ear is not None:
+            self.last_ear = result.ear
+            self.last_mouth_distance = result.mouth_distance
+        
+        # Update episode statistics
+        self.session_data["drowsy_episodes"] = result.drowsy_episodes
+        self.session_data["yawn_episodes"] = result.yawn_episodes
+        self.session_data["fatigue_alerts"] = self.pipeline.fatigue_episodes
+        # Read here on the video thread, which is the only one updating the metrics
+        self.session_data["fatigue"] = self.pipeline.fatigue.summary()
+        
+        self.ui_state.publish(UISnapshot(
+            frame=frame,
+            ear=self.last_ear,
+            mouth_distance=self.last_mouth_distance,
+            eye_status=self.eye_status,
+            yawn_status=self.yawn_status,
+            alarm_on=self.alarm_on,
+            yawn_alarm_on=self.yawn_alarm_on,
+            fatigue_alarm_on=self.fatigue_alarm_on,
+            fatigue=self.session_data["fatigue"],
+            drowsy_episodes=result.drowsy_episodes,
+            yawn_episodes=result.yawn_episodes,
+            emergency_alerts=self.session_data["emergency_contacts"],
+            last_alert_time=self.last_alert_time,
+        ))
+    
+    def refresh_ui(self):
+        """Apply the latest published UI state, then reschedule on the Tk thread"""
+        snapshot = self.ui_state.take()
+        if snapshot is not None:
+            self.apply_snapshot(snapshot)
+        
+        if self.is_running:
+            self.ui_refresh_job = self.root.after(int(1000 / self.ui_refresh_rate), self.refresh_ui)
+    
+    def apply_snapshot(self, snapshot):
+        """Update only the widgets whose contents changed since the last refresh"""
+        if snapshot.frame is not None and self.preview_visible():
+            start = time.perf_counter()
+            self.preview.render(snapshot.frame)
+            self.pipeline.timings.record(DISPLAY, time.perf_counter() - start)
+        
+        if snapshot.alarm_on:
+            status = {"text": "DROWSINESS DETECTED!", "fg": "#f44336"}
+        elif snapshot.fatigue_alarm_on:
+            status = {"text": "FATIGUE DETECTED!", "fg": "#f44336"}
+        elif snapshot.yawn_alarm_on:
+            status = {"text": "YAWN DETECTED!", "fg": "#ff9800"}
+        else:
+            status = {"text": "Monitoring Active", "fg": "#4caf50"}
+        
+        if snapshot.eye_status == "CLOSED":
+            eye_status = {"text": "Eye Status: CLOSED", "fg": "#f44336"}
+        elif snapshot.eye_status == "OPEN":
+            eye_status = {"text": "Eye Status: OPEN", "fg": "#4caf50"}
+        else:
+            eye_status = {"text": "Eye Status: -"}
         
-        # Change UI elements to alert state
-        self.root.after(1, lambda: self.status_label.config(text="DROWSINESS DETECTED!", fg="#f44336"))
-        self.last_alert_time = datetime.datetime.now().strftime("%H:%M:%S")
-        self.root.after(1, lambda: self.last_alert_label.config(text=f"Last Alert: {self.last_alert_time}"))
+        if snapshot.yawn_status == "YAWNING":
+            yawn_status = {"text": "Yawn Status: YAWNING", "fg": "#f44336"}
+        elif snapshot.yawn_status == "NORMAL":
+            yawn_status = {"text": "Yawn Status: NORMAL", "fg": "#4caf50"}
+        else:
+            yawn_status = {"text": "Yawn Status: -"}
+        
+        ear_text = "EAR: -" if snapshot.ear is None else f"EAR: {snapshot.ear:.2f}"
+        mouth_text = "Mouth Distance: -" if snapshot.mouth_distance is None else f"Mouth Distance: {snapshot.mouth_distance}"
+        perclos_text, blink_text, yawn_rate_text = format_lines(snapshot.fatigue)
+        
+        updates = [
+            (self.status_label, status),
+            (self.eye_status_label, eye_status),
+            (self.yawn_status_label, yawn_status),
+            (self.ear_value_label, {"text": ear_text}),
+            (self.mouth_distance_label, {"text": mouth_text}),
+            (self.perclos_label, {"text": perclos_text}),
+            (self.blink_rate_label, {"text": blink_text}),
+            (self.yawn_rate_label, {"text": yawn_rate_text}),
+            (self.drowsy_count_label, {"text": f"Drowsy Episodes: {snapshot.drowsy_episodes}"}),
+            (self.yawn_count_label, {"text": f"Yawn Episodes: {snapshot.yawn_episodes}"}),
+            (self.alert_sent_label, {"text": f"Emergency Alerts Sent: {snapshot.emergency_alerts}"}),
+            (self.last_alert_label, {"text": f"Last Alert: {snapshot.last_alert_time or '-'}"}),
+        ]
+        for widget, options in updates:
+            key = str(widget)
+            if self.applied_widget_state.get(key) != options:
+                widget.config(**options)
+                self.applied_widget_state[key] = options
+    
+    def preview_visible(self):
+        """Whether rendering the video preview would be seen at all"""
+        return self.show_preview and self.root.state() != "iconic" and self.video_label.winfo_viewable()
+    
+    def start_alarm(self):
+        self.alarm_sound.play()
     
     def stop_alarm(self):
-        pygame.mixer.music.stop()
+        # The sound keeps playing while the other alarm is still on
         self.alarm_on = False
-        
-        # Reset UI elements to normal state
-        self.root.after(1, lambda: self.status_label.config(text="Monitoring Active", fg="#4caf50"))
+        if not self.fatigue_alarm_on:
+            self.alarm_sound.stop()
     
     def start_yawn_alarm(self):
         # We could use a different sound for yawn alert
-        # For now, just update the UI
-        self.root.after(1, lambda: self.status_label.config(text="YAWN DETECTED!", fg="#ff9800"))
+        # For now the status label shows it on the next UI refresh
+        pass
     
     def stop_yawn_alarm(self):
         self.yawn_alarm_on = False
-        
-        # Reset UI elements to normal state if no other alarms are active
+    
+    def stop_fatigue_alarm(self):
+        self.fatigue_alarm_on = False
         if not self.alarm_on:
-            self.root.after(1, lambda: self.status_label.config(text="Monitoring Active", fg="#4caf50"))
+            self.alarm_sound.stop()
     
     def send_emergency_alert(self, test=False):
         """Send emergency alert to the designated contact via email and/or SMS"""
         # Update statistics
         if not test:
             self.session_data["emergency_contacts"] += 1
-            self.root.after(1, lambda: self.alert_sent_label.config(text=f"Emergency Alerts Sent: {self.session_data['emergency_contacts']}"))
         
         name = self.emergency_contact_name.get()
         email = self.emergency_contact_email.get()
@@ -551,40 +935,28 @@ class DrowsinessDetector:
         if test:
             alert_message += " This is a TEST alert."
         
-        # Send email if provided
+        # Queue one alert per channel; delivery, retries and timeouts are handled by the dispatcher
         if email:
-            try:
-                self.send_email(email, "DROWSINESS ALERT - Urgent!", alert_message)
-            except:
-                print("Failed to send email alert")
-        
-        # Send SMS if phone number provided
+            self.alerts.submit("email", email, "DROWSINESS ALERT - Urgent!", alert_message, dedup=not test)
         if phone:
-            try:
-                self.send_sms(phone, alert_message)
-            except:
-                print("Failed to send SMS alert")
-    
-    def send_email(self, recipient, subject, body):
-        """Send email using SMTP - For demonstration purposes only"""
-        # NOTE: In a real application, you would use proper authentication
-        try:
-            # This is just a demonstration - in a real app you would use a real SMTP server
-            print(f"Simulating sending email to {recipient}")
-            print(f"Subject: {subject}")
-            print(f"Body: {body}")
-        except Exception as e:
-            print(f"Email sending error: {e}")
-
-    def send_sms(self, recipient, body):
-        """Send SMS using Twilio - For demonstration purposes only"""
-        # NOTE: In a real application, you would use proper authentication
-        try:
-            # This is just a demonstration - in a real app you would use actual Twilio credentials
-            print(f"Simulating sending SMS to {recipient}")
-            print(f"Message: {body}")
-        except Exception as e:
-            print(f"SMS sending error: {e}")
+            self.alerts.submit("sms", phone, None, alert_message, dedup=not test)
+    
+    def format_alert_metrics(self):
+        """Alert delivery counts and latency per channel as label lines"""
+        lines = []
+        for channel, stats in self.alerts.metrics().items():
+            latency = "-" if stats["latency_p50_ms"] is None else f"{stats['latency_p50_ms']:.0f} ms"
+            lines.append(f"Alert Delivery ({channel}): {stats['sent']} sent, {stats['failed']} failed, "
+                         f"{stats['retries']} retries, p50 {latency}")
+        return lines or ["Alert Delivery: -"]
+    
+    def format_clip_metrics(self):
+        """Alert clip counts, writer queue depth and buffer memory as a label line"""
+        if self.clips is None:
+            return "Alert Clips: -"
+        metrics = self.clips.metrics()
+        return (f"Alert Clips: {metrics['clips_written']} written, {metrics['queue_depth']} queued, "
+                f"{metrics['clips_dropped']} dropped, {metrics['memory_bytes'] / 1e6:.1f} MB buffered")
     
     def export_statistics(self):
         """Export session statistics to a text file"""
@@ -618,12 +990,63 @@ class DrowsinessDetector:
                 f.write(f"Drowsy Episodes Detected: {self.session_data['drowsy_episodes']}\n")
                 f.write(f"Yawn Episodes Detected: {self.session_data['yawn_episodes']}\n")
                 f.write(f"Emergency Alerts Sent: {self.session_data['emergency_contacts']}\n\n")
+                if self.session_data.get("fatigue"):
+                    f.write("Fatigue Metrics (latest):\n")
+                    for line in format_lines(self.session_data["fatigue"]):
+                        f.write(f"- {line}\n")
+                    if self.pipeline.perclos_threshold is not None or self.pipeline.yawn_rate_threshold is not None:
+                        f.write(f"- Fatigue Alerts: {self.session_data['fatigue_alerts']}\n")
+                    f.write("\n")
+                if self.grabber is not None:
+                    f.write(f"Frames Captured: {self.grabber.frames_captured}\n")
+                    f.write(f"Frames Processed: {self.grabber.frames_processed}\n")
+                    f.write(f"Frames Dropped: {self.grabber.frames_dropped}\n")
+                    f.write(f"Frames Skipped (adaptive rate): {self.pipeline.frames_skipped}\n\n")
+                if self.session_data.get("metrics_file"):
+                    f.write(f"Per-Frame Metrics: {self.session_data['metrics_file']}\n\n")
+                if self.session_data.get("clips"):
+                    f.write(f"{self.format_clip_metrics()}\n")
+                    for path in self.session_data["clips"]:
+                        f.write(f"- {path}\n")
+                    f.write("\n")
+                f.write("Performance (p50 / p95 / p99 per stage):\n")
+                for line in self.pipeline.timings.format_lines():
+                    f.write(f"- {line}\n")
+                f.write("\n")
+                f.write("Alert Delivery:\n")
+                for line in self.format_alert_metrics():
+                    f.write(f"- {line}\n")
+                f.write("\n")
+                if self.telemetry is not None:
+                    metrics = self.telemetry.metrics()
+                    f.write(f"Telemetry: {metrics['records_sent']} records sent to {self.telemetry.host}:{self.telemetry.port}, "
+                            f"{metrics['records_dropped']} dropped\n\n")
                 f.write("Settings Used:\n")
-                f.write(f"- Eye Aspect Ratio Threshold: {self.eye_aspect_ratio_threshold}\n")
-                f.write(f"- Consecutive Frames for Drowsiness: {self.eye_aspect_ratio_consecutive_frames}\n")
-                f.write(f"- Yawn Threshold: {self.yawn_threshold}\n")
-                f.write(f"- Consecutive Frames for Yawn: {self.yawn_consecutive_frames}\n")
-                f.write(f"- Emergency Contact Timeout: {self.emergency_timeout} seconds\n\n")
+                f.write(f"- Eye Aspect Ratio Threshold: {self.pipeline.eye_aspect_ratio_threshold}\n")
+                if self.pipeline.time_windows:
+                    f.write(f"- Eyes Closed Duration for Drowsiness: {self.pipeline.eyes_closed_window_ms} ms\n")
+                else:
+                    f.write(f"- Consecutive Frames for Drowsiness: {self.pipeline.eye_aspect_ratio_consecutive_frames}\n")
+                f.write(f"- Yawn Threshold: {self.pipeline.yawn_threshold}\n")
+                if self.pipeline.time_windows:
+                    f.write(f"- Mouth Open Duration for Yawn: {self.pipeline.yawn_window_ms} ms\n")
+                else:
+                    f.write(f"- Consecutive Frames for Yawn: {self.pipeline.yawn_consecutive_frames}\n")
+                f.write(f"- Face Detection Interval: every {self.pipeline.detection_interval} frames\n")
+                f.write(f"- Face Detection Scale: {self.pipeline.detection_scale}\n")
+                f.write(f"- Face Detector: {self.pipeline.detector_backend}\n")
+                if self.pipeline.multi_face:
+                    f.write("- Monitored Faces: all, with separate alert state\n")
+                else:
+                    f.write(f"- Monitored Face: {self.pipeline.face_selection}\n")
+                if self.pipeline.scheduler is not None:
+                    f.write(f"- Adaptive Analysis Rate: {self.adaptive_scheduler.min_rate}-{self.adaptive_scheduler.max_rate} fps "
+                            f"(alarms delayed by at most {self.adaptive_scheduler.max_delay() * 1000:.0f} ms)\n")
+                if self.pipeline.perclos_threshold is not None:
+                    f.write(f"- PERCLOS Alarm: {self.pipeline.perclos_threshold:.0%}\n")
+                if self.pipeline.yawn_rate_threshold is not None:
+                    f.write(f"- Yawns per 10 Minutes Alarm: {self.pipeline.yawn_rate_threshold}\n")
+                f.write(f"- Emergency Contact Timeout: {self.pipeline.emergency_timeout} seconds\n\n")
                 f.write("===== END OF REPORT =====\n")
             
             messagebox.showinfo("Export Successful", f"Statistics exported successfully to {filename}")
@@ -640,6 +1063,14 @@ class DrowsinessDetector:
             if messagebox.askyesno("Save Statistics", "Would you like to export statistics before exiting?"):
                 self.export_statistics()
         
+        # Let the video thread finish writing alert clips
+        if self.video_thread is not None:
+            self.video_thread.join(timeout=15)
+        
+        # Give queued alerts and telemetry a moment to go out
+        self.alerts.stop()
+        if self.telemetry is not None:
+            self.telemetry.stop()
         self.root.destroy()
     
     def run(self):
@@ -649,75 +1080,81 @@ class DrowsinessDetector:
 class FatigueLogger:
     """A class to log and analyze fatigue patterns over time"""
     
-    def __init__(self, log_file="fatigue_log.json"):
-        self.log_file = log_file
-        self.log_data = self.load_log()
-    
-    def load_log(self):
-        """Load existing log data or create new"""
-        try:
-            if os.path.exists(self.log_file):
-                with open(self.log_file, "r") as f:
-                    return json.load(f)
-            else:
-                return {"sessions": []}
-        except Exception:
-            return {"sessions": []}
-    
-    def save_log(self):
-        """Save log data to file"""
-        with open(self.log_file, "w") as f:
-            json.dump(self.log_data, f, indent=4, default=str)
+    def __init__(self, db_file="fatigue_log.db", legacy_log_file="fatigue_log.json", user=None):
+        self.store = SessionStore(db_file)
+        # Driver the sessions are logged for, so a shared log can be filtered per user
+        self.user = user if user is not None else os.environ.get("DROWSINESS_USER", "")
+        # Sessions logged by older versions are moved into the store once
+        self.store.import_json_log(legacy_log_file)
     
     def add_session(self, session_data):
         """Add a new session to the log"""
-        self.log_data["sessions"].append({
+        self.store.add({
             "date": datetime.datetime.now().strftime("%Y-%m-%d"),
             "time": datetime.datetime.now().strftime("%H:%M:%S"),
             "duration": str(session_data["end_time"] - session_data["start_time"]),
+            "user": self.user,
             "drowsy_episodes": session_data["drowsy_episodes"],
             "yawn_episodes": session_data["yawn_episodes"],
-            "emergency_alerts": session_data["emergency_contacts"]
+            "emergency_alerts": session_data["emergency_contacts"],
+            "performance": session_data.get("performance"),
+            "alert_delivery": session_data.get("alert_delivery"),
+            "metrics_file": session_data.get("metrics_file"),
+            "clips": session_data.get("clips"),
+            "fatigue": session_data.get("fatigue"),
+            "fatigue_alerts": session_data.get("fatigue_alerts", 0)
         })
-        self.save_log()
     
-    def get_weekly_summary(self):
+    def get_weekly_summary(self, user=None):
         """Return a summary of fatigue patterns for the past week"""
         today = datetime.datetime.now().date()
         week_ago = today - datetime.timedelta(days=7)
         
-        weekly_sessions = []
-        for session in self.log_data["sessions"]:
-            session_date = datetime.datetime.strptime(session["date"], "%Y-%m-%d").date()
-            if week_ago <= session_date <= today:
-                weekly_sessions.append(session)
-        
-        if not weekly_sessions:
+        summary = self.get_summary(week_ago, today, user)
+        if summary is None:
             return "No sessions recorded in the past week."
+        return summary
+    
+    def get_summary(self, start_date=None, end_date=None, user=None):
+        """Summary of an inclusive date range from the daily rollups, None without sessions"""
+        totals = self.store.totals(start_date, end_date, user)
+        session_count = totals["session_count"]
         
-        total_drowsy = sum(s["drowsy_episodes"] for s in weekly_sessions)
-        total_yawns = sum(s["yawn_episodes"] for s in weekly_sessions)
-        total_alerts = sum(s["emergency_alerts"] for s in weekly_sessions)
+        if not session_count:
+            return None
         
         return {
-            "session_count": len(weekly_sessions),
-            "total_drowsy_episodes": total_drowsy,
-            "total_yawn_episodes": total_yawns,
-            "total_emergency_alerts": total_alerts,
-            "avg_drowsy_per_session": total_drowsy / len(weekly_sessions),
-            "avg_yawns_per_session": total_yawns / len(weekly_sessions)
+            "session_count": session_count,
+            "total_drowsy_episodes": totals["drowsy_episodes"],
+            "total_yawn_episodes": totals["yawn_episodes"],
+            "total_emergency_alerts": totals["emergency_alerts"],
+            "total_hours": totals["duration_seconds"] / 3600,
+            "avg_drowsy_per_session": totals["drowsy_episodes"] / session_count,
+            "avg_yawns_per_session": totals["yawn_episodes"] / session_count
         }
     
-    def generate_report(self, filename="fatigue_analysis_report.txt"):
-        """Generate a comprehensive fatigue analysis report"""
-        if not self.log_data["sessions"]:
+    def generate_report(self, filename="fatigue_analysis_report.txt", start_date=None, end_date=None,
+                        user=None, include_sessions=True):
+        """Generate a comprehensive fatigue analysis report
+        
+        Summaries come from the daily and weekly rollups. start_date, end_date
+        and user restrict the report, e.g. to one month of a fleet; without
+        include_sessions the individual sessions are not listed, so the
+        report never reads the session history.
+        """
+        summary = self.get_summary(start_date, end_date, user)
+        if summary is None:
             return "No session data available for analysis."
         
-        weekly_summary = self.get_weekly_summary()
+        weekly_summary = self.get_weekly_summary(user)
         
         with open(filename, "w") as f:
             f.write("===== FATIGUE ANALYSIS REPORT =====\n\n")
-            f.write(f"Report Generated: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
+            f.write(f"Report Generated: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+            f.write(f"Period: {start_date or 'first session'} to {end_date or 'today'}\n")
+            if user is not None:
+                f.write(f"User: {user or '-'}\n")
+            f.write("\n")
             
             f.write("WEEKLY SUMMARY:\n")
             if isinstance(weekly_summary, dict):
@@ -730,22 +1167,43 @@ class FatigueLogger:
             else:
                 f.write(f"{weekly_summary}\n\n")
             
-            f.write("ALL SESSIONS:\n")
-            for idx, session in enumerate(self.log_data["sessions"], 1):
-                f.write(f"Session {idx} - {session['date']} {session['time']}\n")
-                f.write(f"  Duration: {session['duration']}\n")
-                f.write(f"  Drowsy Episodes: {session['drowsy_episodes']}\n")
-                f.write(f"  Yawn Episodes: {session['yawn_episodes']}\n")
-                f.write(f"  Emergency Alerts: {session['emergency_alerts']}\n\n")
+            f.write("PERIOD SUMMARY:\n")
+            f.write(f"Sessions: {summary['session_count']} ({summary['total_hours']:.1f} hours monitored)\n")
+            f.write(f"Total drowsy episodes: {summary['total_drowsy_episodes']}\n")
+            f.write(f"Total yawn episodes: {summary['total_yawn_episodes']}\n")
+            f.write(f"Total emergency alerts: {summary['total_emergency_alerts']}\n\n")
+            
+            f.write("BY WEEK:\n")
+            for week in self.store.weekly(start_date, end_date, user):
+                f.write(f"Week of {week['week']}: {week['session_count']} sessions, "
+                        f"{week['drowsy_episodes']} drowsy, {week['yawn_episodes']} yawns, "
+                        f"{week['emergency_alerts']} emergency alerts\n")
+            f.write("\n")
+            
+            if user is None:
+                by_user = self.store.totals_by_user(start_date, end_date)
+                if len(by_user) > 1:
+                    f.write("BY USER:\n")
+                    for name, totals in by_user.items():
+                        f.write(f"{name or '-'}: {totals['session_count']} sessions, "
+                                f"{totals['drowsy_episodes']} drowsy, {totals['yawn_episodes']} yawns, "
+                                f"{totals['emergency_alerts']} emergency alerts\n")
+                    f.write("\n")
+            
+            if include_sessions:
+                f.write("ALL SESSIONS:\n")
+                for idx, session in enumerate(self.store.sessions(start_date, end_date, user), 1):
+                    f.write(f"Session {idx} - {session['date']} {session['time']}\n")
+                    f.write(f"  Duration: {session['duration']}\n")
+                    f.write(f"  Drowsy Episodes: {session['drowsy_episodes']}\n")
+                    f.write(f"  Yawn Episodes: {session['yawn_episodes']}\n")
+                    f.write(f"  Emergency Alerts: {session['emergency_alerts']}\n\n")
             
             f.write("RECOMMENDATIONS:\n")
             # Add some simple recommendations based on the data
-            total_sessions = len(self.log_data["sessions"])
-            total_drowsy = sum(s["drowsy_episodes"] for s in self.log_data["sessions"])
-            
-            if total_drowsy / total_sessions > 5:
+            if summary["avg_drowsy_per_session"] > 5:
                 f.write("- You appear to experience significant drowsiness. Consider improving your sleep schedule.\n")
-            if total_drowsy / total_sessions > 10:
+            if summary["avg_drowsy_per_session"] > 10:
                 f.write("- High frequency of drowsiness detected. Please consult with a healthcare professional.\n")
             
             f.write("\n===== END OF REPORT =====\n")
@@ -778,6 +1236,9 @@ def main():
         if app.session_data["start_time"] is not None:
             if app.session_data["end_time"] is None:
                 app.session_data["end_time"] = datetime.datetime.now()
+                app.session_data["performance"] = app.pipeline.timings.summary()
+                app.session_data["alert_delivery"] = app.alerts.metrics()
+                app.save_recording()
             app.logger.add_session(app.session_data)
         original_exit()
     
@@ -787,6 +1248,4 @@ def main():
     app.run()
 
 if __name__ == "__main__":
-    # Import json here as it was missing in the original imports
-    import json
-    main()
\ No newline at end of file
+    main()
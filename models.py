@@ -0,0 +1,49 @@
+"""Process-wide cache of the dlib face detector and shape predictor
+
+The 68 point shape predictor is a ~100 MB file that takes about a second to
+deserialize. Every FramePipeline in a process gets the same loaded objects
+from here, so the file is read once per process. Worker processes created
+with the "fork" start method inherit the cache: call preload_for_workers()
+in the parent before starting them and they never read the file at all.
+"""
+import multiprocessing
+import threading
+
+import dlib
+
+_lock = threading.Lock()
+_detector = None
+_predictors = {}
+
+
+def face_detector():
+    """The HOG frontal face detector, created on first use"""
+    global _detector
+    with _lock:
+        if _detector is None:
+            _detector = dlib.get_frontal_face_detector()
+        return _detector
+
+
+def shape_predictor(path):
+    """The shape predictor stored at path, loaded on first use"""
+    with _lock:
+        predictor = _predictors.get(path)
+        if predictor is None:
+            predictor = _predictors[path] = dlib.shape_predictor(path)
+        return predictor
+
+
+def preload_for_workers(predictor_path, hog_detector=True):
+    """Load the models before forking workers so they share the parent's copy
+
+    The HOG face detector is only loaded with hog_detector set. Returns
+    False without loading anything when workers are not forked (spawn or
+    forkserver), where a preloaded model would not be inherited.
+    """
+    if multiprocessing.get_start_method(allow_none=False) != "fork":
+        return False
+    if hog_detector:
+        face_detector()
+    shape_predictor(predictor_path)
+    return True
@@ -0,0 +1,277 @@
+"""Run one detection worker process per camera and aggregate their results
+
+Each source gets its own process with its own pipeline and alert state, so
+streams scale across CPU cores. Where workers are forked, the models are
+loaded once in the parent and shared with every worker. Sources are given as
+NAME=SOURCE pairs, where SOURCE is a camera index or a video file.
+
+With --telemetry every worker streams its events to a telemetry collector,
+reporting the stream name as the driver.
+
+Example:
+    python multistream.py --stream driver=0 --stream codriver=1 --stream cabin=2
+"""
+import datetime
+import multiprocessing
+import queue
+import time
+
+import models
+from capture import FrameGrabber
+from detectors import HOG
+from headless import build_parser, configure_pipeline, parse_source
+from pipeline import FramePipeline
+from telemetry import SESSION_START, SESSION_STOP, TelemetryClient
+
+# Message kinds sent from workers to the parent
+EVENT = "event"
+STATS = "stats"
+DONE = "done"
+ERROR = "error"
+
+
+def stream_worker(name, source, args, results, stop_event, report_interval=1.0):
+    """Process one video source and report events and fps to the parent"""
+    try:
+        pipeline = configure_pipeline(FramePipeline(args.predictor, load=False), args)
+    except Exception as e:
+        results.put((ERROR, name, f"Failed to load models: {e}"))
+        return
+
+    live = isinstance(source, int)
+    grabber = FrameGrabber(source, drop_frames=live, timings=pipeline.timings, media_time=not live,
+                           buffers=pipeline.buffers)
+    if not grabber.start():
+        results.put((ERROR, name, f"Could not open video source: {source}"))
+        return
+
+    telemetry = None
+    if args.telemetry:
+        telemetry = TelemetryClient(args.telemetry, name, args.fleet).start()
+        telemetry.emit(SESSION_START)
+
+    frames = 0
+    start = window_start = time.perf_counter()
+    window_frames = 0
+    try:
+        while not stop_event.is_set():
+            if args.max_frames and frames >= args.max_frames:
+                break
+            item = grabber.read(timeout=1.0)
+            if item is None:
+                if grabber.finished:
+                    break
+                continue
+
+            frame, timestamp = item
+            result = pipeline.process(frame, timestamp)
+            frames += 1
+            window_frames += 1
+
+            if telemetry is not None:
+                telemetry.emit_events(result.events, result.timestamp)
+                telemetry.emit_timings(pipeline.timings, result.timestamp)
+            for event in result.events:
+                results.put((EVENT, name, {
+                    "event": event,
+                    "timestamp": result.timestamp,
+                    "ear": result.ear,
+                    "mouth_distance": result.mouth_distance,
+                }))
+
+            now = time.perf_counter()
+            if now - window_start >= report_interval:
+                results.put((STATS, name, {
+                    "fps": window_frames / (now - window_start),
+                    "frames": frames,
+                    "frames_dropped": grabber.frames_dropped,
+                    "drowsy_episodes": pipeline.drowsy_episodes,
+                    "yawn_episodes": pipeline.yawn_episodes,
+                }))
+                window_frames = 0
+                window_start = now
+    finally:
+        grabber.stop()
+        if telemetry is not None:
+            telemetry.emit(SESSION_STOP)
+            telemetry.stop()
+        elapsed = time.perf_counter() - start
+        results.put((DONE, name, {
+            "fps": frames / elapsed if elapsed else 0.0,
+            "frames": frames,
+            "frames_dropped": grabber.frames_dropped,
+            "drowsy_episodes": pipeline.drowsy_episodes,
+            "yawn_episodes": pipeline.yawn_episodes,
+            "latency": pipeline.timings.summary(),
+        }))
+
+
+class StreamStatus:
+    """Latest known state of one worker stream"""
+
+    def __init__(self, name, source):
+        self.name = name
+        self.source = source
+        self.fps = 0.0
+        self.frames = 0
+        self.frames_dropped = 0
+        self.drowsy_episodes = 0
+        self.yawn_episodes = 0
+        self.events = []
+        self.latency = None
+        self.error = None
+        self.finished = False
+
+
+class MultiStreamServer:
+    """Start a worker process per source and collect their results"""
+
+    def __init__(self, streams, args, report_interval=1.0):
+        self.args = args
+        self.report_interval = report_interval
+        self.status = {name: StreamStatus(name, source) for name, source in streams}
+        self.results = multiprocessing.Queue()
+        self.stop_event = multiprocessing.Event()
+        self.workers = []
+
+    def start(self):
+        try:
+            models.preload_for_workers(self.args.predictor, self.args.detector == HOG)
+        except Exception:
+            # Each worker reports the load failure for its stream
+            pass
+        for status in self.status.values():
+            worker = multiprocessing.Process(
+                target=stream_worker,
+                args=(status.name, status.source, self.args, self.results,
+                      self.stop_event, self.report_interval),
+                name=f"stream-{status.name}", daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def stop(self, timeout=5.0):
+        self.stop_event.set()
+        # Keep draining results so workers can flush their queues and exit
+        deadline = time.perf_counter() + timeout
+        while any(worker.is_alive() for worker in self.workers) and time.perf_counter() < deadline:
+            self.poll(timeout=0.1)
+        for worker in self.workers:
+            worker.join(timeout=0.1)
+
+    def running(self):
+        return not all(status.finished for status in self.status.values())
+
+    def poll(self, timeout=0.5):
+        """Apply one message from the workers, returning it or None"""
+        try:
+            kind, name, payload = self.results.get(timeout=timeout)
+        except queue.Empty:
+            # A worker that died without reporting counts as finished
+            for worker, status in zip(self.workers, self.status.values()):
+                if not worker.is_alive() and not status.finished:
+                    status.finished = True
+                    status.error = status.error or f"Worker exited with code {worker.exitcode}"
+            return None
+
+        status = self.status[name]
+        if kind == EVENT:
+            status.events.append(payload)
+        elif kind == STATS:
+            status.fps = payload["fps"]
+            status.frames = payload["frames"]
+            status.frames_dropped = payload["frames_dropped"]
+            status.drowsy_episodes = payload["drowsy_episodes"]
+            status.yawn_episodes = payload["yawn_episodes"]
+        elif kind == DONE:
+            status.fps = payload["fps"]
+            status.frames = payload["frames"]
+            status.frames_dropped = payload["frames_dropped"]
+            status.drowsy_episodes = payload["drowsy_episodes"]
+            status.yawn_episodes = payload["yawn_episodes"]
+            status.latency = payload["latency"]
+            status.finished = True
+        elif kind == ERROR:
+            status.error = payload
+            status.finished = True
+        return kind, name, payload
+
+    def summary(self):
+        """Per-stream and total counters as a dict"""
+        streams = {
+            name: {
+                "fps": status.fps,
+                "frames": status.frames,
+                "frames_dropped": status.frames_dropped,
+                "drowsy_episodes": status.drowsy_episodes,
+                "yawn_episodes": status.yawn_episodes,
+                "latency": status.latency,
+                "error": status.error,
+            }
+            for name, status in self.status.items()
+        }
+        return {
+            "streams": streams,
+            "total_fps": sum(s["fps"] for s in streams.values()),
+            "total_drowsy_episodes": sum(s["drowsy_episodes"] for s in streams.values()),
+            "total_yawn_episodes": sum(s["yawn_episodes"] for s in streams.values()),
+        }
+
+
+def parse_stream(value):
+    """Split a NAME=SOURCE argument, naming bare sources after themselves"""
+    name, sep, source = value.partition("=")
+    if not sep:
+        name, source = value, value
+    return name, parse_source(source)
+
+
+def print_status(server):
+    summary = server.summary()
+    parts = [f"{name}: {s['fps']:.1f} fps" for name, s in summary["streams"].items()]
+    print(" | ".join(parts) + f" | total: {summary['total_fps']:.1f} fps")
+
+
+def main(argv=None):
+    parser = build_parser()
+    parser.description = "Multi-camera drowsiness detection"
+    parser.add_argument("--stream", action="append", default=[],
+                        help="NAME=SOURCE camera index or video file, may be repeated")
+    parser.add_argument("--report-interval", type=float, default=5.0,
+                        help="seconds between fps reports (default: 5)")
+    args = parser.parse_args(argv)
+
+    streams = [parse_stream(value) for value in args.stream] or [parse_stream(args.source)]
+    server = MultiStreamServer(streams, args)
+    server.start()
+
+    last_report = time.perf_counter()
+    try:
+        while server.running():
+            message = server.poll()
+            if message and message[0] in (EVENT, ERROR):
+                kind, name, payload = message
+                if kind == ERROR:
+                    print(f"[{name}] ERROR: {payload}")
+                else:
+                    stamp = datetime.datetime.fromtimestamp(payload["timestamp"]).strftime("%H:%M:%S")
+                    print(f"[{stamp}] [{name}] {payload['event']}")
+
+            if time.perf_counter() - last_report >= args.report_interval:
+                print_status(server)
+                last_report = time.perf_counter()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+    summary = server.summary()
+    for name, stream in summary["streams"].items():
+        print(f"{name}: {stream['frames']} frames ({stream['frames_dropped']} dropped), "
+              f"{stream['drowsy_episodes']} drowsy, "
+              f"{stream['yawn_episodes']} yawn episodes")
+    print(f"Total Drowsy Episodes: {summary['total_drowsy_episodes']}")
+    print(f"Total Yawn Episodes: {summary['total_yawn_episodes']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,742 @@
+import time
+
+import cv2
+import dlib
+import numpy as np
+
+import models
+from detectors import HOG, create_detector
+from fatigue import FatigueMetrics
+from instrumentation import StageTimings, GRAYSCALE, FACE_DETECTION, LANDMARKS, METRICS, DRAWING
+
+# Landmark index ranges of the 68 point dlib model
+LEFT_EYE_START, LEFT_EYE_END = 42, 48
+RIGHT_EYE_START, RIGHT_EYE_END = 36, 42
+MOUTH_START, MOUTH_END = 48, 68
+MOUTH_OUTER_END = 60  # points 48-59 outline the outer lips
+MOUTH_TOP, MOUTH_BOTTOM = 62, 66
+
+# Event names reported in FrameResult.events
+DROWSY_ALARM_START = "drowsy_alarm_start"
+DROWSY_ALARM_STOP = "drowsy_alarm_stop"
+YAWN_ALARM_START = "yawn_alarm_start"
+YAWN_ALARM_STOP = "yawn_alarm_stop"
+FATIGUE_ALARM_START = "fatigue_alarm_start"
+FATIGUE_ALARM_STOP = "fatigue_alarm_stop"
+EMERGENCY = "emergency"
+
+# Policies for choosing the monitored face when several are in frame
+LARGEST = "largest"
+CENTRAL = "central"
+TRACKED = "tracked"
+FACE_SELECTIONS = (LARGEST, CENTRAL, TRACKED)
+
+
+def shape_to_array(shape, out=None):
+    """Convert a dlib full_object_detection into a (68, 2) int32 array
+
+    With out, the points are written into that array instead of a new one.
+    """
+    if out is None:
+        out = np.empty((shape.num_parts, 2), dtype=np.int32)
+    for index in range(shape.num_parts):
+        point = shape.part(index)
+        out[index, 0] = point.x
+        out[index, 1] = point.y
+    return out
+
+
+def eye_aspect_ratio(eye):
+    """Compute the eye aspect ratio of (..., 6, 2) eye landmarks
+
+    Accepts a single eye or any batch of eyes and returns a matching float or
+    array of ratios.
+    """
+    eye = np.asarray(eye, dtype=np.float64)
+
+    # Distances between landmark pairs (1, 5) and (2, 4) across the eyelids
+    # and (0, 3) between the eye corners
+    diff = eye[..., (1, 2, 0), :] - eye[..., (5, 4, 3), :]
+    dist = np.sqrt((diff * diff).sum(axis=-1))
+
+    return (dist[..., 0] + dist[..., 1]) / (2.0 * dist[..., 2])
+
+
+def overlap(a, b):
+    """Intersection over union of two dlib rectangles"""
+    intersection = a.intersect(b).area()
+    union = a.area() + b.area() - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def face_metrics(landmarks):
+    """Return the mean EAR of both eyes and the inner lip distance
+
+    landmarks is a (68, 2) array for one face or (N, 68, 2) for a batch of
+    faces or frames; the results are scalars or (N,) arrays respectively.
+    """
+    landmarks = np.asarray(landmarks)
+    left_ear = eye_aspect_ratio(landmarks[..., LEFT_EYE_START:LEFT_EYE_END, :])
+    right_ear = eye_aspect_ratio(landmarks[..., RIGHT_EYE_START:RIGHT_EYE_END, :])
+    mouth_distance = np.abs(landmarks[..., MOUTH_TOP, 1] - landmarks[..., MOUTH_BOTTOM, 1])
+    return (left_ear + right_ear) / 2.0, mouth_distance
+
+
+class FaceResult:
+    """Landmarks and metrics of one detected face"""
+
+    def __init__(self, rect, landmarks, ear, mouth_distance, face_id=None):
+        self.rect = rect
+        # Track ID in multi-face mode, None for the single monitored face
+        self.face_id = face_id
+        self.landmarks = landmarks
+        self.ear = ear
+        self.mouth_distance = mouth_distance
+        self.drowsy = False
+        self.yawning = False
+
+    @property
+    def left_eye(self):
+        return self.landmarks[LEFT_EYE_START:LEFT_EYE_END]
+
+    @property
+    def right_eye(self):
+        return self.landmarks[RIGHT_EYE_START:RIGHT_EYE_END]
+
+    @property
+    def mouth(self):
+        return self.landmarks[MOUTH_START:MOUTH_END]
+
+
+class FrameResult:
+    """Outcome of running the pipeline on one frame"""
+
+    def __init__(self, timestamp):
+        self.timestamp = timestamp
+        self.faces = []
+        # Faces the detector found, including those not monitored
+        self.detected_count = 0
+        self.events = []
+        # Last reported status, None when the frame did not change it
+        self.eye_status = None
+        self.yawn_status = None
+        self.drowsy_episodes = 0
+        self.yawn_episodes = 0
+        # True when the frame was not analysed; faces are then those of the
+        # last analysed frame
+        self.skipped = False
+
+    @property
+    def ear(self):
+        return self.faces[-1].ear if self.faces else None
+
+    @property
+    def mouth_distance(self):
+        return self.faces[-1].mouth_distance if self.faces else None
+
+    @property
+    def drowsy(self):
+        return any(face.drowsy for face in self.faces)
+
+    @property
+    def yawning(self):
+        return any(face.yawning for face in self.faces)
+
+
+class AlertState:
+    """Consecutive-frame counters and alarm state of one monitored face"""
+
+    def __init__(self):
+        self.counter = 0
+        self.alarm_on = False
+        self.yawn_counter = 0
+        self.yawn_alarm_on = False
+        # Timestamps of the first frame of the current closed-eye and open-mouth runs
+        self.eyes_closed_since = None
+        self.yawn_since = None
+        self.drowsy_start_time = None
+        self.emergency_triggered = False
+        # Analysed frames since the face was last seen (multi-face mode)
+        self.missing = 0
+
+    @property
+    def active(self):
+        return bool(self.counter or self.yawn_counter or self.alarm_on or self.yawn_alarm_on)
+
+
+class AdaptiveScheduler:
+    """Lower the analysis rate while the driver is clearly alert
+
+    After each analysed frame the time until the next analysis is chosen
+    from how far the metrics are from their thresholds: EAR at least
+    ear_margin above the EAR threshold and mouth distance at least
+    mouth_margin below the yawn threshold count as far, and give the
+    longest interval of 1 / min_rate seconds. Closer metrics shorten the
+    interval linearly down to 1 / max_rate (every frame when max_rate is
+    None), as does a frame without a face. While a counter runs or an
+    alarm is active every frame is analysed, whatever max_rate is, so the
+    consecutive-frame counters advance at the camera's frame rate.
+
+    A change that happens right after an analysed frame is therefore seen
+    at most 1 / min_rate seconds later, and from then on every frame is
+    analysed. Alarms fire at most max_delay() seconds later than without
+    the scheduler.
+    """
+
+    def __init__(self, min_rate=5.0, max_rate=None, ear_margin=0.08, mouth_margin=15):
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.ear_margin = ear_margin
+        self.mouth_margin = mouth_margin
+        self.reset()
+
+    def reset(self):
+        self.next_time = None
+        self.interval = 0.0
+
+    def max_delay(self):
+        """Upper bound in seconds on the extra detection latency"""
+        return 1.0 / self.min_rate
+
+    def due(self, timestamp):
+        # Frames arriving slightly early still count, so camera timing jitter
+        # does not halve the rate when the interval matches the frame period
+        return self.next_time is None or timestamp >= self.next_time - 0.25 * self.interval
+
+    def schedule(self, pipeline, result):
+        """Choose when to analyse next from an analysed frame"""
+        shortest = 1.0 / self.max_rate if self.max_rate else 0.0
+        longest = max(shortest, 1.0 / self.min_rate)
+
+        if any(state.active for state in pipeline.face_states.values()):
+            # Counting frames towards an alarm: skipping any would stretch it
+            self.interval = 0.0
+            self.next_time = result.timestamp
+            return
+        if not result.faces:
+            calm = 0.0
+        else:
+            # 0 at a threshold, 1 at or beyond the margin, for the closest face
+            calm = min(min((face.ear - pipeline.eye_aspect_ratio_threshold) / self.ear_margin,
+                           (pipeline.yawn_threshold - face.mouth_distance) / self.mouth_margin)
+                       for face in result.faces)
+            calm = min(1.0, max(0.0, calm))
+
+        self.interval = shortest + calm * (longest - shortest)
+        self.next_time = result.timestamp + self.interval
+
+
+class FramePipeline:
+    """GUI-free drowsiness and yawn detection engine
+
+    Feed frames to process() and act on the returned FrameResult. The
+    pipeline owns the consecutive-frame counters and alarm state, so the
+    Tk application and the headless tools share the same logic.
+
+    Only one face is monitored by default: face_selection picks it from the
+    detected faces before landmarks are predicted, so passengers cost no
+    landmark or metric work and cannot disturb the driver's counters. With
+    multi_face enabled every face is measured and gets a track ID with its
+    own AlertState; the alarm events then report whether any face alarms.
+    """
+
+    def __init__(self, predictor_path="shape_predictor_68_face_landmarks.dat",
+                 detector=None, predictor=None, load=True):
+        # Detection settings
+        self.eye_aspect_ratio_threshold = 0.25
+        self.eye_aspect_ratio_consecutive_frames = 20
+        self.yawn_threshold = 30  # Distance threshold for yawn detection
+        self.yawn_consecutive_frames = 15
+        self.emergency_timeout = 15  # seconds
+
+        # Time windows replace the consecutive-frame counts when enabled:
+        # an alarm is raised once eyes have been closed (or the mouth open)
+        # for the window, measured with frame timestamps. The alarm then
+        # comes at most one analysed frame after the window has passed,
+        # however slowly frames are processed.
+        self.time_windows = False
+        self.eyes_closed_window_ms = 800
+        self.yawn_window_ms = 500
+
+        # Tracking settings: run the full detector every detection_interval
+        # frames and follow the faces with correlation trackers in between.
+        # An interval of 1 disables tracking.
+        self.detection_interval = 1
+        self.tracking_quality_threshold = 7.0
+
+        # Run the face detector on a copy of the grayscale frame scaled by
+        # this factor. Landmarks are still predicted at full resolution.
+        self.detection_scale = 1.0
+
+        # Face detector backend created by load_models(), see detectors.py
+        self.detector_backend = HOG
+        self.haar_cascade_path = None
+
+        # Face to monitor: the largest, the most central, or the one that
+        # overlaps the face monitored on the previous frame (falling back to
+        # the largest when it is lost)
+        self.face_selection = LARGEST
+        # Monitor every face with its own alert state instead
+        self.multi_face = False
+        # Analysed frames a face may be missing before its track and alert
+        # state are dropped in multi-face mode
+        self.face_track_timeout = 30
+
+        # Optional fatigue triggers on the rolling metrics, None disables them:
+        # PERCLOS (0-1) over the last minute, once a full minute has been
+        # observed, and yawn episodes per 10 minutes
+        self.perclos_threshold = None
+        self.yawn_rate_threshold = None
+        self.fatigue = FatigueMetrics()
+
+        # Optional AdaptiveScheduler that skips frames while the driver is
+        # clearly alert. None analyses every frame.
+        self.scheduler = None
+
+        # Optional BufferPool the grayscale images and landmark arrays are
+        # taken from instead of being allocated per frame. Landmarks of a
+        # result are then only valid until the pool comes round to them again.
+        self.buffers = None
+
+        # Face detector and shape predictor. You need to download
+        # shape_predictor_68_face_landmarks.dat from:
+        # http://dlib.net/files/shape_predictor_68_face_landmarks.dat.bz2
+        # Without a predictor path only update() can be used, e.g. to replay
+        # metrics that were measured in another process. With load=False the
+        # models are loaded later by load_models(), e.g. on a background thread.
+        self.predictor_path = predictor_path
+        self.detector = detector
+        self.predictor = predictor
+        if load:
+            self.load_models()
+
+        # Per-stage latency histograms, shared with the capture thread and UI
+        self.timings = StageTimings()
+
+        self.reset_session()
+
+    @property
+    def ready(self):
+        """Whether the models needed by process() are loaded"""
+        return self.detector is not None and self.predictor is not None
+
+    def load_models(self, progress=None):
+        """Load the detector and predictor from the shared model cache
+
+        progress, if given, is called with a description before each step.
+        """
+        if self.predictor is None and not self.predictor_path:
+            return
+        if self.detector is None:
+            if progress:
+                progress("Loading face detector...")
+            self.detector = create_detector(self.detector_backend, self.haar_cascade_path)
+        if self.predictor is None:
+            if progress:
+                progress("Loading facial landmark model...")
+            self.predictor = models.shape_predictor(self.predictor_path)
+
+    def set_detector(self, backend):
+        """Switch to another face detector backend"""
+        self.detector = create_detector(backend, self.haar_cascade_path)
+        self.detector_backend = backend
+        self.reset_tracking()
+
+    def reset_session(self):
+        """Clear counters, alarm state and episode statistics"""
+        # Alert state per face ID; the single monitored face uses None
+        self.face_states = {}
+        self.drowsy_episodes = 0
+        self.yawn_episodes = 0
+        self.fatigue_episodes = 0
+        self.fatigue_alarm_on = False
+        self.fatigue.reset()
+        self.frames_processed = 0
+        self.frames_skipped = 0
+        self.last_faces = []
+        self.last_detected_count = 0
+        if self.scheduler is not None:
+            self.scheduler.reset()
+        self.timings.reset()
+        self.reset_tracking()
+
+    def reset_tracking(self):
+        """Drop tracked faces so the next frame runs full detection"""
+        self.trackers = []
+        self.frames_since_detection = 0
+        self.detections_run = 0
+        # Faces found by the last full detection, before face selection
+        self.detected_count = 0
+        self.primary_rect = None
+        # Last rectangle and missed frames per face ID in multi-face mode
+        self.face_tracks = {}
+        self.next_face_id = 1
+
+    @property
+    def alarm_on(self):
+        return any(state.alarm_on for state in self.face_states.values())
+
+    @property
+    def yawn_alarm_on(self):
+        return any(state.yawn_alarm_on for state in self.face_states.values())
+
+    def process(self, frame, timestamp=None):
+        """Run detection on a BGR frame and update the alert state
+
+        With a scheduler set, frames that are not due are skipped: the
+        returned result has skipped set and carries the faces of the last
+        analysed frame, and the alert state is left untouched.
+        """
+        if timestamp is None:
+            timestamp = time.time()
+
+        if not self.due(timestamp):
+            return self.skip(timestamp)
+        return self.finish(self.measure(frame, timestamp))
+
+    def due(self, timestamp):
+        """Whether the scheduler wants the frame at timestamp analysed"""
+        return self.scheduler is None or self.scheduler.due(timestamp)
+
+    def skip(self, timestamp):
+        """Result for a frame that is not analysed, carrying the last analysed faces"""
+        self.frames_skipped += 1
+        result = FrameResult(timestamp)
+        result.skipped = True
+        result.faces = self.last_faces
+        result.detected_count = self.last_detected_count
+        result.drowsy_episodes = self.drowsy_episodes
+        result.yawn_episodes = self.yawn_episodes
+        return result
+
+    def finish(self, result):
+        """Update the alert state with a measured result and schedule the next frame"""
+        result = self.update(result)
+        self.last_faces = result.faces
+        self.last_detected_count = result.detected_count
+        if self.scheduler is not None:
+            self.scheduler.schedule(self, result)
+        self.timings.frame_done()
+        return result
+
+    def measure(self, frame, timestamp=None):
+        """Detect faces on a BGR frame and compute their metrics
+
+        Only the tracking state is touched; counters and alarms are left to
+        update().
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        return self.measure_faces(*self.detect(frame), timestamp)
+
+    def detect(self, frame):
+        """Convert a BGR frame to grayscale and locate the monitored faces
+
+        Returns the grayscale image, the face rectangles, their face IDs and
+        the number of faces the detector found, which includes faces that
+        are not monitored; on tracked frames it is that of the last full
+        detection. Calls must come in frame order, since they advance the
+        tracking state.
+        """
+        timings = self.timings
+        start = time.perf_counter()
+
+        # Convert to grayscale for face detection
+        buffers = self.buffers
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY,
+                            dst=None if buffers is None else buffers.take("gray", frame.shape[:2]))
+        converted = time.perf_counter()
+        timings.record(GRAYSCALE, converted - start)
+
+        rects = self.locate_faces(gray)
+        if self.multi_face:
+            face_ids = self.assign_face_ids(rects)
+        else:
+            face_ids = [None] * len(rects)
+            self.primary_rect = rects[0] if rects else None
+        timings.record(FACE_DETECTION, time.perf_counter() - converted)
+        return gray, rects, face_ids, self.detected_count
+
+    def measure_faces(self, gray, rects, face_ids, detected_count, timestamp):
+        """Predict landmarks and compute metrics of located faces
+
+        Touches no pipeline state, so frames can be measured concurrently.
+        """
+        result = FrameResult(timestamp)
+        result.detected_count = detected_count
+        timings = self.timings
+
+        if not rects:
+            return result
+
+        # One block of landmark arrays per frame, keyed by face count so
+        # faces coming and going do not reallocate the ring
+        shape = (len(rects), 68, 2)
+        if self.buffers is not None:
+            block = self.buffers.take(("landmarks", len(rects)), shape, np.int32)
+        else:
+            block = np.empty(shape, np.int32)
+
+        # Predict the landmarks of every face, then compute the EAR and
+        # mouth distance of all of them in one batch
+        start = time.perf_counter()
+        for index, rect in enumerate(rects):
+            shape_to_array(self.predictor(gray, rect), block[index])
+        predicted = time.perf_counter()
+        ears, mouth_distances = face_metrics(block)
+        for index, (rect, face_id) in enumerate(zip(rects, face_ids)):
+            result.faces.append(FaceResult(rect, block[index], float(ears[index]), int(mouth_distances[index]),
+                                           face_id))
+        timings.record(LANDMARKS, predicted - start)
+        timings.record(METRICS, time.perf_counter() - predicted)
+
+        return result
+
+    def update(self, result):
+        """Advance the counters and alarm state with the faces of a result
+
+        process() calls this after measuring a frame. It can also replay
+        metrics measured elsewhere, e.g. by offline analysis workers.
+        """
+        drowsy_before = self.alarm_on
+        yawning_before = self.yawn_alarm_on
+        yawn_episodes_before = self.yawn_episodes
+
+        for face in result.faces:
+            state = self.face_states.get(face.face_id)
+            if state is None:
+                state = self.face_states[face.face_id] = AlertState()
+            state.missing = 0
+            self.update_yawn_state(face, result, state)
+            self.update_eye_state(face, result, state)
+
+        self.expire_face_states(result)
+
+        # Alarm events describe all monitored faces together, so a second
+        # face alarming does not restart the alarm and one face recovering
+        # does not stop it while another still alarms
+        yawning = self.yawn_alarm_on
+        if yawning != yawning_before:
+            result.events.append(YAWN_ALARM_START if yawning else YAWN_ALARM_STOP)
+        drowsy = self.alarm_on
+        if drowsy != drowsy_before:
+            result.events.append(DROWSY_ALARM_START if drowsy else DROWSY_ALARM_STOP)
+
+        # Rolling metrics follow the face whose EAR the result reports
+        self.fatigue.update(result.timestamp, result.ear, self.eye_aspect_ratio_threshold,
+                            self.yawn_episodes - yawn_episodes_before)
+        self.update_fatigue_alarm(result)
+
+        self.frames_processed += 1
+        result.drowsy_episodes = self.drowsy_episodes
+        result.yawn_episodes = self.yawn_episodes
+        return result
+
+    def expire_face_states(self, result):
+        """Drop the alert state of faces missing for face_track_timeout frames
+
+        The single monitored face keeps its state while it is out of view.
+        State left over from the other mode after multi_face was switched
+        is dropped on the next analysed frame.
+        """
+        seen = {face.face_id for face in result.faces}
+        timeout = self.face_track_timeout if self.multi_face else 0
+        for face_id in list(self.face_states):
+            if face_id in seen or (face_id is None and not self.multi_face):
+                continue
+            state = self.face_states[face_id]
+            state.missing += 1
+            if state.missing > timeout:
+                del self.face_states[face_id]
+
+    def fatigued(self):
+        """Whether a rolling fatigue metric has reached its trigger"""
+        fatigue = self.fatigue
+        if self.perclos_threshold is not None and fatigue.warmed_up:
+            perclos = fatigue.perclos()
+            if perclos is not None and perclos >= self.perclos_threshold:
+                return True
+        if self.yawn_rate_threshold is not None:
+            if fatigue.yawns_per_10_min() >= self.yawn_rate_threshold:
+                return True
+        return False
+
+    def update_fatigue_alarm(self, result):
+        fatigued = self.fatigued()
+        if fatigued == self.fatigue_alarm_on:
+            return
+        self.fatigue_alarm_on = fatigued
+        if fatigued:
+            self.fatigue_episodes += 1
+            result.events.append(FATIGUE_ALARM_START)
+        else:
+            result.events.append(FATIGUE_ALARM_STOP)
+
+    def select_faces(self, rects, shape):
+        """Reduce detected faces to the monitored one unless in multi-face mode"""
+        if self.multi_face or len(rects) <= 1:
+            return rects
+
+        if self.face_selection == TRACKED and self.primary_rect is not None:
+            best = max(rects, key=lambda rect: overlap(rect, self.primary_rect))
+            if overlap(best, self.primary_rect) >= 0.3:
+                return [best]
+
+        if self.face_selection == CENTRAL:
+            height, width = shape[:2]
+            def distance(rect):
+                center = rect.center()
+                return (center.x - width / 2) ** 2 + (center.y - height / 2) ** 2
+            return [min(rects, key=distance)]
+
+        return [max(rects, key=lambda rect: rect.area())]
+
+    def assign_face_ids(self, rects):
+        """Match faces to the tracks of earlier frames by overlap
+
+        Faces without a matching track start a new one. Tracks that are not
+        matched for face_track_timeout frames are forgotten.
+        """
+        free = dict(self.face_tracks)
+        face_ids = []
+        for rect in rects:
+            match = max(free, key=lambda face_id: overlap(rect, free[face_id][0]), default=None)
+            if match is not None and overlap(rect, free[match][0]) >= 0.3:
+                del free[match]
+            else:
+                match = self.next_face_id
+                self.next_face_id += 1
+            face_ids.append(match)
+            self.face_tracks[match] = (rect, 0)
+
+        for face_id, (rect, missed) in free.items():
+            if missed >= self.face_track_timeout:
+                del self.face_tracks[face_id]
+            else:
+                self.face_tracks[face_id] = (rect, missed + 1)
+        return face_ids
+
+    def locate_faces(self, gray):
+        """Return face rectangles, from the detector or from the trackers"""
+        if self.detection_interval > 1 and self.trackers and self.frames_since_detection < self.detection_interval:
+            rects = []
+            for tracker in self.trackers:
+                # Re-acquire with the detector as soon as any face is lost
+                if tracker.update(gray) < self.tracking_quality_threshold:
+                    return self.detect_faces(gray)
+                pos = tracker.get_position()
+                rects.append(dlib.rectangle(int(pos.left()), int(pos.top()),
+                                            int(pos.right()), int(pos.bottom())))
+            self.frames_since_detection += 1
+            return rects
+        return self.detect_faces(gray)
+
+    def detect_faces(self, gray):
+        """Run the full face detector and restart tracking on the monitored faces"""
+        detected = self.run_detector(gray)
+        self.detected_count = len(detected)
+        rects = self.select_faces(detected, gray.shape)
+        self.detections_run += 1
+        self.frames_since_detection = 1
+        self.trackers = []
+        if self.detection_interval > 1:
+            for rect in rects:
+                tracker = dlib.correlation_tracker()
+                tracker.start_track(gray, rect)
+                self.trackers.append(tracker)
+        return rects
+
+    def run_detector(self, gray):
+        """Detect faces on a downscaled frame and map them to full resolution"""
+        scale = self.detection_scale
+        if scale >= 1.0:
+            return list(self.detector(gray, 0))
+
+        small = None
+        if self.buffers is not None:
+            # Same size as cv2.resize computes from the scale factors
+            height, width = gray.shape
+            small = self.buffers.take("small", (round(height * scale), round(width * scale)))
+        small = cv2.resize(gray, None, dst=small, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        return [dlib.rectangle(int(rect.left() / scale), int(rect.top() / scale),
+                               int(rect.right() / scale), int(rect.bottom() / scale))
+                for rect in self.detector(small, 0)]
+
+    def sustained(self, frames, since, frame_limit, window_ms, timestamp):
+        """Whether a condition seen on `frames` frames since `since` should alarm"""
+        if self.time_windows:
+            return (timestamp - since) * 1000 >= window_ms
+        return frames >= frame_limit
+
+    def update_yawn_state(self, face, result, state):
+        if face.mouth_distance > self.yawn_threshold:
+            state.yawn_counter += 1
+            if state.yawn_since is None:
+                state.yawn_since = result.timestamp
+            if self.sustained(state.yawn_counter, state.yawn_since, self.yawn_consecutive_frames,
+                              self.yawn_window_ms, result.timestamp):
+                if not state.yawn_alarm_on:
+                    state.yawn_alarm_on = True
+                    self.yawn_episodes += 1
+                face.yawning = True
+                result.yawn_status = "YAWNING"
+        else:
+            state.yawn_counter = 0
+            state.yawn_since = None
+            state.yawn_alarm_on = False
+            if result.yawn_status is None:
+                result.yawn_status = "NORMAL"
+
+    def update_eye_state(self, face, result, state):
+        if face.ear < self.eye_aspect_ratio_threshold:
+            state.counter += 1
+            if state.eyes_closed_since is None:
+                state.eyes_closed_since = result.timestamp
+            if self.sustained(state.counter, state.eyes_closed_since, self.eye_aspect_ratio_consecutive_frames,
+                              self.eyes_closed_window_ms, result.timestamp):
+                # Start timing for emergency contact
+                if state.drowsy_start_time is None:
+                    state.drowsy_start_time = result.timestamp
+                    self.drowsy_episodes += 1
+
+                # Check if drowsy for more than emergency timeout
+                if not state.emergency_triggered:
+                    if result.timestamp - state.drowsy_start_time > self.emergency_timeout:
+                        state.emergency_triggered = True
+                        result.events.append(EMERGENCY)
+
+                state.alarm_on = True
+                face.drowsy = True
+                result.eye_status = "CLOSED"
+        else:
+            state.counter = 0
+            state.eyes_closed_since = None
+            state.drowsy_start_time = None
+            state.emergency_triggered = False
+            state.alarm_on = False
+            if result.eye_status is None:
+                result.eye_status = "OPEN"
+
+    def annotate(self, frame, result):
+        """Draw landmarks, contours and alert messages onto a BGR frame"""
+        start = time.perf_counter()
+        for face in result.faces:
+            for points in (face.left_eye, face.right_eye, face.mouth):
+                for x, y in points:
+                    cv2.circle(frame, (int(x), int(y)), 1, (0, 255, 0), -1)
+            # The eye and outer lip points are already in outline order, so
+            # they are drawn as they are rather than through a convex hull
+            cv2.polylines(frame, [face.left_eye, face.right_eye, face.landmarks[MOUTH_START:MOUTH_OUTER_END]],
+                          True, (0, 255, 0), 1)
+
+            if face.face_id is not None and face.rect is not None:
+                cv2.putText(frame, f"ID {face.face_id}", (face.rect.left(), max(15, face.rect.top() - 5)),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+            if face.yawning:
+                cv2.putText(frame, "YAWN DETECTED!", (10, 90),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+            if face.drowsy:
+                cv2.putText(frame, "DROWSINESS ALERT!", (10, 30),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+        self.timings.record(DRAWING, time.perf_counter() - start)
+        return frame
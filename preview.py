@@ -0,0 +1,59 @@
+import cv2
+import numpy as np
+from PIL import Image, ImageTk
+
+
+class PreviewRenderer:
+    """Show BGR frames in a Tk label using reused buffers
+
+    Frames are resized first and then converted into preallocated buffers,
+    and a single PhotoImage is updated in place. Buffers are only
+    reallocated when the frame size changes.
+    """
+
+    def __init__(self, label, max_width=800):
+        self.label = label
+        self.max_width = max_width
+        self.size = None
+        self.resized = None
+        self.rgba = None
+        self.photo = None
+        self.image = None
+
+    def target_size(self, frame):
+        h, w = frame.shape[:2]
+        if w > self.max_width:
+            return self.max_width, int(h * self.max_width / w)
+        return w, h
+
+    def allocate(self, size):
+        width, height = size
+        self.size = size
+        self.resized = np.empty((height, width, 3), dtype=np.uint8)
+        # PIL only shares memory with 4 byte per pixel buffers, so convert
+        # straight to RGBA and wrap the buffer without copying
+        self.rgba = np.empty((height, width, 4), dtype=np.uint8)
+        self.image = Image.frombuffer("RGBA", size, self.rgba, "raw", "RGBA", 0, 1)
+        self.photo = ImageTk.PhotoImage("RGBA", size)
+        self.label.config(image=self.photo)
+        self.label.image = self.photo
+
+    def render(self, frame):
+        """Draw a BGR frame into the label's PhotoImage"""
+        size = self.target_size(frame)
+        if size != self.size:
+            self.allocate(size)
+
+        source = frame
+        if size != (frame.shape[1], frame.shape[0]):
+            cv2.resize(frame, size, dst=self.resized, interpolation=cv2.INTER_AREA)
+            source = self.resized
+        cv2.cvtColor(source, cv2.COLOR_BGR2RGBA, dst=self.rgba)
+
+        self.photo.paste(self.image)
+
+    def clear(self):
+        """Blank the label and release the buffers"""
+        self.label.config(image="")
+        self.label.image = None
+        self.size = self.resized = self.rgba = self.image = self.photo = None
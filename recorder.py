@@ -0,0 +1,91 @@
+import numpy as np
+
+from pipeline import EMERGENCY
+
+# Bits of the flags column
+FLAG_DROWSY = 1
+FLAG_YAWNING = 2
+FLAG_EMERGENCY = 4
+FLAG_SKIPPED = 8  # frame not analysed, metrics repeat the last analysed frame
+
+# Column name -> dtype. 18 bytes per frame, so an 8 hour shift at 30 fps
+# (864000 frames) takes about 15 MB.
+COLUMNS = {
+    "timestamp": np.float64,
+    "ear": np.float32,             # NaN when no face was found
+    "mouth_distance": np.float32,  # NaN when no face was found
+    "face_count": np.uint8,        # faces detected, monitored or not
+    "flags": np.uint8,
+}
+
+
+class MetricsRecorder:
+    """Per-frame time series of EAR, mouth distance, face count and alerts
+
+    Values go into preallocated NumPy column arrays rather than Python
+    objects. When the capacity is reached the columns double in size, so
+    recording stays amortised O(1) per frame.
+    """
+
+    def __init__(self, capacity=30 * 60 * 60):
+        self.size = 0
+        self.columns = {name: np.empty(capacity, dtype=dtype) for name, dtype in COLUMNS.items()}
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def capacity(self):
+        return len(self.columns["timestamp"])
+
+    @property
+    def nbytes(self):
+        return sum(column.nbytes for column in self.columns.values())
+
+    def clear(self):
+        self.size = 0
+
+    def _grow(self):
+        for name, column in self.columns.items():
+            grown = np.empty(max(1, len(column) * 2), dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            self.columns[name] = grown
+
+    def record(self, result):
+        """Append one FrameResult"""
+        if self.size == self.capacity:
+            self._grow()
+
+        flags = 0
+        if result.drowsy:
+            flags |= FLAG_DROWSY
+        if result.yawning:
+            flags |= FLAG_YAWNING
+        if EMERGENCY in result.events:
+            flags |= FLAG_EMERGENCY
+        if result.skipped:
+            flags |= FLAG_SKIPPED
+
+        i = self.size
+        columns = self.columns
+        columns["timestamp"][i] = result.timestamp
+        columns["ear"][i] = np.nan if result.ear is None else result.ear
+        columns["mouth_distance"][i] = np.nan if result.mouth_distance is None else result.mouth_distance
+        columns["face_count"][i] = min(result.detected_count, 255)
+        columns["flags"][i] = flags
+        self.size += 1
+
+    def arrays(self):
+        """Views of the recorded part of each column"""
+        return {name: column[:self.size] for name, column in self.columns.items()}
+
+    def save(self, path):
+        """Write the columns to a compressed .npz file and return its path"""
+        np.savez_compressed(path, **self.arrays())
+        return path if path.endswith(".npz") else path + ".npz"
+
+
+def load_metrics(path):
+    """Load a recording saved by MetricsRecorder.save as a dict of arrays"""
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
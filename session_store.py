@@ -0,0 +1,265 @@
+import datetime
+import json
+import os
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    date TEXT NOT NULL,
+    time TEXT NOT NULL,
+    duration TEXT,
+    user TEXT NOT NULL DEFAULT '',
+    drowsy_episodes INTEGER NOT NULL DEFAULT 0,
+    yawn_episodes INTEGER NOT NULL DEFAULT 0,
+    emergency_alerts INTEGER NOT NULL DEFAULT 0,
+    details TEXT
+);
+CREATE INDEX IF NOT EXISTS sessions_date ON sessions (date);
+"""
+
+# Per-day and per-week aggregates, updated in the same transaction as every
+# session insert. "period" is the day, or the Monday starting the week.
+ROLLUP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS {table} (
+    period TEXT NOT NULL,
+    user TEXT NOT NULL DEFAULT '',
+    session_count INTEGER NOT NULL DEFAULT 0,
+    drowsy_episodes INTEGER NOT NULL DEFAULT 0,
+    yawn_episodes INTEGER NOT NULL DEFAULT 0,
+    emergency_alerts INTEGER NOT NULL DEFAULT 0,
+    duration_seconds REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (period, user)
+);
+"""
+DAILY = "daily_rollups"
+WEEKLY = "weekly_rollups"
+
+# Schema version kept in PRAGMA user_version: 1 added the user column and rollups
+SCHEMA_VERSION = 1
+
+# Columns stored directly; anything else in a session goes into details as JSON
+COLUMNS = ("date", "time", "duration", "user", "drowsy_episodes", "yawn_episodes", "emergency_alerts")
+
+# Summed by the rollups
+COUNTERS = ("session_count", "drowsy_episodes", "yawn_episodes", "emergency_alerts", "duration_seconds")
+
+
+WEEK = datetime.timedelta(days=7)
+
+
+def week_start(date):
+    """Monday of the week containing a date or "YYYY-MM-DD" string"""
+    if isinstance(date, str):
+        date = datetime.date.fromisoformat(date)
+    return date - datetime.timedelta(days=date.weekday())
+
+
+def duration_seconds(duration):
+    """Seconds in a str(timedelta) such as "1 day, 2:03:04.5", 0 if unknown"""
+    if not duration:
+        return 0.0
+    try:
+        days = 0
+        if "day" in duration:
+            day_part, duration = duration.split(",")
+            days = int(day_part.split()[0])
+        hours, minutes, seconds = duration.strip().split(":")
+        return days * 86400 + int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    except ValueError:
+        return 0.0
+
+
+class SessionStore:
+    """Append-only SQLite store of monitoring sessions indexed by date
+
+    Adding a session is a single INSERT plus an update of its day and week
+    rollup rows, and opening the store never reads the history. Totals are
+    summed from the rollups, so they cost O(days in range) however many
+    sessions were logged, and can be filtered by user. SQLite's journal
+    keeps the file consistent if the process dies mid-write.
+    """
+
+    def __init__(self, path="fatigue_log.db"):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.conn:
+            self.conn.executescript(SCHEMA)
+            self.conn.executescript(ROLLUP_SCHEMA.format(table=DAILY) + ROLLUP_SCHEMA.format(table=WEEKLY))
+            if self.conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                self._migrate()
+
+    def _migrate(self):
+        """Add the user column and build the rollups of an older database once"""
+        columns = [row["name"] for row in self.conn.execute("PRAGMA table_info(sessions)")]
+        if "user" not in columns:
+            self.conn.execute("ALTER TABLE sessions ADD COLUMN user TEXT NOT NULL DEFAULT ''")
+        self.rebuild_rollups()
+        self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def add(self, session):
+        """Append a session dict with the keys in COLUMNS plus optional extras"""
+        with self.lock, self.conn:
+            self._insert(session)
+
+    def _insert(self, session):
+        details = {key: value for key, value in session.items() if key not in COLUMNS}
+        row = (session["date"], session["time"], session.get("duration"), session.get("user") or "",
+               session.get("drowsy_episodes", 0), session.get("yawn_episodes", 0),
+               session.get("emergency_alerts", 0))
+        self.conn.execute(
+            "INSERT INTO sessions (date, time, duration, user, drowsy_episodes, yawn_episodes, "
+            "emergency_alerts, details) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            row + (json.dumps(details, default=str) if details else None,))
+
+        self._roll_up(*row)
+
+    def _roll_up(self, date, time, duration, user, drowsy_episodes, yawn_episodes, emergency_alerts):
+        """Add one session to its day and week rollup rows"""
+        counts = (1, drowsy_episodes, yawn_episodes, emergency_alerts, duration_seconds(duration))
+        for table, period in ((DAILY, date), (WEEKLY, str(week_start(date)))):
+            self.conn.execute(
+                f"INSERT INTO {table} (period, user, {', '.join(COUNTERS)}) VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (period, user) DO UPDATE SET "
+                + ", ".join(f"{name} = {name} + excluded.{name}" for name in COUNTERS),
+                (period, user) + counts)
+
+    def rebuild_rollups(self):
+        """Recompute the rollups from the sessions table (a full scan)"""
+        self.conn.execute(f"DELETE FROM {DAILY}")
+        self.conn.execute(f"DELETE FROM {WEEKLY}")
+        for session in self.conn.execute(f"SELECT {', '.join(COLUMNS)} FROM sessions"):
+            self._roll_up(*session)
+
+    def count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def totals(self, start_date=None, end_date=None, user=None):
+        """Session count, episode and duration sums for an inclusive date range
+
+        Summed from the daily rollups. user limits them to one user's sessions.
+        """
+        where, params = self._date_filter(start_date, end_date, user, column="period")
+        sums = ", ".join(f"COALESCE(SUM({name}), 0) AS {name}" for name in COUNTERS)
+        with self.lock:
+            row = self.conn.execute(f"SELECT {sums} FROM {DAILY} {where}", params).fetchone()
+        return dict(row)
+
+    def totals_by_user(self, start_date=None, end_date=None):
+        """totals() for each user with sessions in the range, as a dict by user"""
+        where, params = self._date_filter(start_date, end_date, column="period")
+        sums = ", ".join(f"SUM({name}) AS {name}" for name in COUNTERS)
+        with self.lock:
+            rows = self.conn.execute(f"SELECT user, {sums} FROM {DAILY} {where} GROUP BY user ORDER BY user",
+                                     params).fetchall()
+        return {row["user"]: {name: row[name] for name in COUNTERS} for row in rows}
+
+    def daily(self, start_date=None, end_date=None, user=None):
+        """Per-day totals in date order, as a list of dicts with a "date" key"""
+        return self._periods(DAILY, "date", *self._date_filter(start_date, end_date, user, column="period"))
+
+    def weekly(self, start_date=None, end_date=None, user=None):
+        """Per-week totals of an inclusive date range, keyed by the Monday starting each week
+
+        Weeks wholly inside the range are read from the weekly rollups. A
+        week cut by either end of the range is summed from the daily
+        rollups of its days in the range, so it only counts sessions that
+        totals() counts as well.
+        """
+        start = None if start_date is None else datetime.date.fromisoformat(str(start_date))
+        end = None if end_date is None else datetime.date.fromisoformat(str(end_date))
+        # Whole weeks start on a Monday from first up to, but excluding, stop
+        first = None if start is None else week_start(start + datetime.timedelta(days=6))
+        stop = None if end is None else week_start(end + datetime.timedelta(days=1))
+
+        weeks = {}
+        where, params = self._date_filter(first, None if stop is None else stop - WEEK, user, column="period")
+        for row in self._periods(WEEKLY, "week", where, params):
+            weeks[row.pop("week")] = row
+
+        edges = []
+        if first is not None:
+            edges.append(("period < ?", str(first)))
+        if stop is not None:
+            edges.append(("period >= ?", str(stop)))
+        if edges:
+            where, params = self._date_filter(start, end, user, column="period")
+            clause = "(" + " OR ".join(edge for edge, _ in edges) + ")"
+            where = f"{where} AND {clause}" if where else f"WHERE {clause}"
+            for day in self._periods(DAILY, "date", where, params + [value for _, value in edges]):
+                totals = weeks.setdefault(str(week_start(day.pop("date"))), dict.fromkeys(COUNTERS, 0))
+                for name in COUNTERS:
+                    totals[name] += day[name]
+        return [dict({"week": week}, **weeks[week]) for week in sorted(weeks)]
+
+    def _periods(self, table, key, where, params):
+        sums = ", ".join(f"SUM({name}) AS {name}" for name in COUNTERS)
+        with self.lock:
+            rows = self.conn.execute(f"SELECT period, {sums} FROM {table} {where} "
+                                     "GROUP BY period ORDER BY period", params).fetchall()
+        return [dict({key: row["period"]}, **{name: row[name] for name in COUNTERS}) for row in rows]
+
+    def sessions(self, start_date=None, end_date=None, user=None, batch_size=500):
+        """Yield sessions as dicts in insertion order, optionally by date range and user
+
+        Rows are fetched in batches so large histories are streamed rather
+        than loaded at once.
+        """
+        where, params = self._date_filter(start_date, end_date, user)
+        where = f"{where} AND id > ?" if where else "WHERE id > ?"
+        last_id = 0
+        while True:
+            with self.lock:
+                rows = self.conn.execute(f"SELECT * FROM sessions {where} ORDER BY id LIMIT ?",
+                                         params + [last_id, batch_size]).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                session = {key: row[key] for key in COLUMNS}
+                if row["details"]:
+                    session.update(json.loads(row["details"]))
+                yield session
+            last_id = rows[-1]["id"]
+
+    def _date_filter(self, start_date, end_date, user=None, column="date"):
+        clauses, params = [], []
+        if start_date is not None:
+            clauses.append(f"{column} >= ?")
+            params.append(str(start_date))
+        if end_date is not None:
+            clauses.append(f"{column} <= ?")
+            params.append(str(end_date))
+        if user is not None:
+            clauses.append("user = ?")
+            params.append(user)
+        return ("WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def import_json_log(self, json_path):
+        """Import sessions from the old whole-file JSON log once
+
+        The JSON file is renamed afterwards so it is not imported again.
+        Returns the number of imported sessions.
+        """
+        if not os.path.exists(json_path):
+            return 0
+        try:
+            with open(json_path, "r") as f:
+                sessions = json.load(f).get("sessions", [])
+        except Exception:
+            return 0
+
+        # One transaction, so an interrupted import leaves nothing behind
+        with self.lock, self.conn:
+            for session in sessions:
+                self._insert(session)
+        os.replace(json_path, json_path + ".imported")
+        return len(sessions)
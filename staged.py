@@ -0,0 +1,205 @@
+"""Overlap capture, face detection, landmarks and rendering on separate threads
+
+Run sequentially, every frame pays for all stages one after another. dlib
+and OpenCV release the GIL while they work, so the stages can run at the
+same time on consecutive frames: while frame N+1 is being detected, the
+landmarks of frame N are predicted and frame N-1 is drawn and shown. The
+throughput then approaches that of the slowest stage instead of the sum of
+all stages, at the cost of up to a few frames of extra latency.
+"""
+import queue
+import threading
+import time
+
+from instrumentation import FACE_DETECTION, LANDMARKS, DRAWING
+
+# Passed down the queues when the source has ended
+END = None
+
+# Passed on in place of the result of a frame a landmark worker failed on
+FAILED = object()
+
+
+def frames_in_flight(landmark_workers=1, queue_size=2):
+    """Most frames a StagedPipeline holds at once, e.g. to size a BufferPool
+
+    Frames in the grabber's buffer and the one returned by read() are not
+    included.
+    """
+    workers = max(1, landmark_workers)
+    # One being detected, the detection queue, one per landmark worker, the
+    # measured queue and as many again held back for ordering
+    return 1 + queue_size + workers + 2 * (queue_size + workers)
+
+
+class StagedPipeline:
+    """Run a FramePipeline as detection and landmark stages on their own threads
+
+    Frames are read from a started FrameGrabber (the capture stage) and
+    numbered. The detection thread converts them to grayscale and locates
+    faces, which has to happen in frame order because it advances the
+    tracking state. landmark_workers threads predict landmarks and compute
+    metrics. read() is the last stage: it puts the measured frames back in
+    sequence order, updates the alert state and returns them for rendering
+    on the caller's thread.
+
+    Stages are connected by queues of at most queue_size frames, so a slow
+    stage holds up the ones before it rather than letting frames pile up;
+    live cameras then drop stale frames in the grabber as usual. The depth
+    of each stage's input queue is recorded in the pipeline's StageTimings.
+
+    With an AdaptiveScheduler the detection thread decides whether a frame
+    is due before the results of the frames still in flight are known, so a
+    few extra frames may be analysed after the driver has calmed down.
+
+    A landmark worker that fails reports the frame it was working on and
+    ends, and read() moves past that frame. read() also gives up on a frame
+    that falls further behind than the measured queue can hold, so frames
+    waiting for their turn never pile up.
+    """
+
+    def __init__(self, pipeline, grabber, landmark_workers=1, queue_size=2):
+        self.pipeline = pipeline
+        self.grabber = grabber
+        self.landmark_workers = max(1, landmark_workers)
+        self.detected = queue.Queue(maxsize=queue_size)
+        self.measured = queue.Queue(maxsize=queue_size + self.landmark_workers)
+        # Measured frames that arrived ahead of their turn, by sequence number
+        self.pending = {}
+        self.max_pending = self.measured.maxsize
+        self.next_sequence = 0
+        self.ended_workers = 0
+        self.threads = []
+        self.running = False
+        self.finished = False
+
+    def start(self):
+        self.running = True
+        self.threads = [threading.Thread(target=self._detect_loop, daemon=True)]
+        self.threads += [threading.Thread(target=self._landmark_loop, daemon=True)
+                         for _ in range(self.landmark_workers)]
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        """Stop the stage threads; frames still in flight are discarded"""
+        self.running = False
+        for thread in self.threads:
+            thread.join(timeout=2)
+        self.threads = []
+
+    def queue_depths(self):
+        """Frames currently waiting for each stage"""
+        return {
+            FACE_DETECTION: len(self.grabber.buffer),
+            LANDMARKS: self.detected.qsize(),
+            DRAWING: self.measured.qsize() + len(self.pending),
+        }
+
+    def read(self, timeout=None):
+        """Return the next (frame, timestamp, FrameResult) in order, or None
+
+        Returns None at the end of the source, when finished is set, or when
+        no frame was ready within timeout seconds.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            while self.next_sequence not in self.pending:
+                if self.ended_workers == self.landmark_workers or len(self.pending) > self.max_pending:
+                    if not self.pending:
+                        self.finished = True
+                        return None
+                    # A frame was lost to a stage error or is too far behind,
+                    # carry on with the next one
+                    self.next_sequence = min(self.pending)
+                    continue
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                try:
+                    item = self.measured.get(timeout=remaining)
+                except queue.Empty:
+                    return None
+                if item is END:
+                    # Each worker passes on everything it took before it ends
+                    self.ended_workers += 1
+                    continue
+                if item[0] >= self.next_sequence:
+                    self.pending[item[0]] = item
+
+            self.pipeline.timings.record_queue(DRAWING, self.measured.qsize() + len(self.pending) - 1)
+            _, frame, timestamp, result = self.pending.pop(self.next_sequence)
+            self.next_sequence += 1
+            if result is not FAILED:
+                break
+
+        pipeline = self.pipeline
+        result = pipeline.skip(timestamp) if result is None else pipeline.finish(result)
+        return frame, timestamp, result
+
+    def _put(self, target, item):
+        """Put an item on a stage queue, giving up when stopped"""
+        while self.running:
+            try:
+                target.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _detect_loop(self):
+        pipeline = self.pipeline
+        timings = pipeline.timings
+        sequence = 0
+        try:
+            while self.running:
+                waiting = len(self.grabber.buffer)
+                item = self.grabber.read(timeout=0.1)
+                if item is None:
+                    if self.grabber.finished:
+                        break
+                    continue
+                timings.record_queue(FACE_DETECTION, waiting)
+                frame, timestamp = item
+
+                # Frames the scheduler skips go through without analysis,
+                # so they still come out in order
+                faces = pipeline.detect(frame) if pipeline.due(timestamp) else None
+                if not self._put(self.detected, (sequence, frame, timestamp, faces)):
+                    return
+                sequence += 1
+        except Exception as e:
+            print(f"Error in face detection stage: {e}")
+        finally:
+            for _ in range(self.landmark_workers):
+                self._put(self.detected, END)
+
+    def _landmark_loop(self):
+        pipeline = self.pipeline
+        timings = pipeline.timings
+        item = None
+        try:
+            while self.running:
+                try:
+                    item = self.detected.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if item is END:
+                    break
+                timings.record_queue(LANDMARKS, self.detected.qsize())
+                sequence, frame, timestamp, faces = item
+                result = None
+                if faces is not None:
+                    result = pipeline.measure_faces(*faces, timestamp)
+                if not self._put(self.measured, (sequence, frame, timestamp, result)):
+                    return
+                item = None
+        except Exception as e:
+            print(f"Error in landmark stage: {e}")
+            if item is not None:
+                # Lets read() move past the frame instead of waiting for it
+                sequence, frame, timestamp, _ = item
+                self._put(self.measured, (sequence, frame, timestamp, FAILED))
+        finally:
+            self._put(self.measured, END)
@@ -0,0 +1,267 @@
+"""Compact binary telemetry sent from detectors to telemetry_collector.py
+
+Records are batched into frames. A frame is a header naming the driver and
+fleet once, followed by fixed-size 17 byte records:
+
+    header: magic b"DT", version (u8), driver length (u8), fleet length (u8),
+            record count (u16), driver and fleet as UTF-8
+    record: kind (u8), timestamp (f64), count (u32), value (f32)
+
+Over TCP every frame is preceded by its length (u32); over UDP every
+datagram holds one frame. All integers are little-endian.
+"""
+import collections
+import socket
+import struct
+import threading
+import time
+
+MAGIC = b"DT"
+VERSION = 1
+HEADER = struct.Struct("<2sBBBH")
+RECORD = struct.Struct("<BdIf")
+LENGTH = struct.Struct("<I")
+
+# Largest UDP payload that avoids IP fragmentation on typical links
+MAX_DATAGRAM = 1400
+
+# Record kinds. Alarm kinds are named after the FramePipeline events they carry.
+SESSION_START = 1
+SESSION_STOP = 2
+DROWSY_START = 3
+DROWSY_STOP = 4
+YAWN_START = 5
+YAWN_STOP = 6
+EMERGENCY = 7
+FATIGUE_START = 8
+FATIGUE_STOP = 9
+FPS_SAMPLE = 10      # value: effective fps
+LATENCY_SAMPLE = 11  # value: milliseconds per analysed frame
+
+KIND_NAMES = {
+    SESSION_START: "session_start",
+    SESSION_STOP: "session_stop",
+    DROWSY_START: "drowsy_alarm_start",
+    DROWSY_STOP: "drowsy_alarm_stop",
+    YAWN_START: "yawn_alarm_start",
+    YAWN_STOP: "yawn_alarm_stop",
+    EMERGENCY: "emergency",
+    FATIGUE_START: "fatigue_alarm_start",
+    FATIGUE_STOP: "fatigue_alarm_stop",
+    FPS_SAMPLE: "fps_sample",
+    LATENCY_SAMPLE: "latency_sample",
+}
+KINDS = {name: kind for kind, name in KIND_NAMES.items()}
+SAMPLE_KINDS = (FPS_SAMPLE, LATENCY_SAMPLE)
+
+
+def encode_frame(driver, fleet, records):
+    """Pack already packed records into a frame"""
+    driver = driver.encode("utf-8")[:255]
+    fleet = fleet.encode("utf-8")[:255]
+    return HEADER.pack(MAGIC, VERSION, len(driver), len(fleet), len(records)) + driver + fleet + b"".join(records)
+
+
+def decode_frame(data):
+    """Return (driver, fleet, [(kind, timestamp, count, value), ...]) of a frame
+
+    Raises ValueError for anything that is not a valid frame.
+    """
+    if len(data) < HEADER.size:
+        raise ValueError("frame too short")
+    magic, version, driver_length, fleet_length, count = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("not a telemetry frame")
+    offset = HEADER.size + driver_length + fleet_length
+    if len(data) != offset + count * RECORD.size:
+        raise ValueError("frame length does not match its record count")
+    driver = data[HEADER.size:HEADER.size + driver_length].decode("utf-8", "replace")
+    fleet = data[HEADER.size + driver_length:offset].decode("utf-8", "replace")
+    return driver, fleet, list(RECORD.iter_unpack(data[offset:]))
+
+
+def parse_address(value):
+    """Split "[tcp|udp://]host:port" into (protocol, host, port)"""
+    protocol = "tcp"
+    if "://" in value:
+        protocol, value = value.split("://", 1)
+        if protocol not in ("tcp", "udp"):
+            raise ValueError(f"Unknown telemetry protocol: {protocol}")
+    host, _, port = value.rpartition(":")
+    return protocol, host or "127.0.0.1", int(port)
+
+
+class TelemetryClient:
+    """Send records to a collector from a background thread
+
+    emit() never blocks the caller: records are packed into a bounded
+    queue and sent in batches of up to batch_size records, or whatever is
+    queued every flush_interval seconds. When the collector is slow or
+    unreachable the queue fills up (TCP flow control pushes back on the
+    sender thread) and new records are dropped and counted. fps and
+    latency samples are dropped once the queue is half full, so alarm and
+    session records keep the remaining room. Over TCP a failed batch is
+    retried after reconnecting; over UDP it is lost.
+    """
+
+    def __init__(self, address, driver, fleet="", batch_size=64, flush_interval=0.5,
+                 queue_size=10000, timeout=5.0, max_backoff=10.0, sample_interval=5.0):
+        self.protocol, self.host, self.port = parse_address(address)
+        self.driver = driver
+        self.fleet = fleet
+        if self.protocol == "udp":
+            batch_size = min(batch_size, (MAX_DATAGRAM - HEADER.size - 510) // RECORD.size)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.max_backoff = max_backoff
+        self.sample_interval = sample_interval
+        self.last_sample_time = None
+        self.records = collections.deque()
+        self.condition = threading.Condition()
+        self.sock = None
+        self.thread = None
+        self.running = False
+        self.stop_deadline = None
+
+        # Counters
+        self.records_sent = 0
+        self.records_dropped = 0
+        self.batches_sent = 0
+        self.send_errors = 0
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._sender, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self, timeout=2.0):
+        """Send what is queued for up to timeout seconds, then stop"""
+        with self.condition:
+            self.running = False
+            # Leave the sender a moment to count what it gives up on before the join ends
+            self.stop_deadline = time.monotonic() + timeout * 0.9
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+        self._close()
+
+    def pending(self):
+        return len(self.records)
+
+    def metrics(self):
+        return {
+            "records_sent": self.records_sent,
+            "records_dropped": self.records_dropped,
+            "batches_sent": self.batches_sent,
+            "send_errors": self.send_errors,
+            "queue_depth": self.pending(),
+        }
+
+    def emit(self, kind, value=0.0, count=0, timestamp=None):
+        """Queue one record, returning False if it was dropped"""
+        if timestamp is None:
+            timestamp = time.time()
+        limit = self.queue_size // 2 if kind in SAMPLE_KINDS else self.queue_size
+        with self.condition:
+            if len(self.records) >= limit:
+                self.records_dropped += 1
+                return False
+            self.records.append(RECORD.pack(kind, timestamp, count, value))
+            if len(self.records) >= self.batch_size:
+                self.condition.notify()
+        return True
+
+    def emit_events(self, events, timestamp=None, count=0):
+        """Queue a record per FramePipeline event name that has a record kind"""
+        for event in events:
+            kind = KINDS.get(event)
+            if kind is not None:
+                self.emit(kind, count=count, timestamp=timestamp)
+
+    def emit_timings(self, timings, timestamp=None):
+        """Queue fps and per-frame latency samples from a StageTimings
+
+        Can be called on every frame: samples are taken at most once per
+        sample_interval seconds.
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        if self.last_sample_time is not None and timestamp - self.last_sample_time < self.sample_interval:
+            return
+        self.last_sample_time = timestamp
+        summary = timings.summary()
+        latency = sum(stage["p50_ms"] for stage in summary["stages"].values())
+        self.emit(FPS_SAMPLE, summary["fps"], timestamp=timestamp)
+        self.emit(LATENCY_SAMPLE, latency, timestamp=timestamp)
+
+    def _next_batch(self):
+        with self.condition:
+            deadline = time.monotonic() + self.flush_interval
+            while self.running and len(self.records) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            count = min(len(self.records), self.batch_size)
+            return [self.records.popleft() for _ in range(count)]
+
+    def _sender(self):
+        backoff = 0.5
+        batch = []
+        while True:
+            if not batch:
+                if not self.running and not self.records:
+                    return
+                batch = self._next_batch()
+                if not batch:
+                    continue
+            try:
+                self._send(encode_frame(self.driver, self.fleet, batch))
+            except OSError as e:
+                self.send_errors += 1
+                self._close()
+                if self.protocol == "udp":
+                    self.records_dropped += len(batch)
+                    batch = []
+                    continue
+                remaining = None if self.running else self.stop_deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    # Stopping: give up on what is left
+                    with self.condition:
+                        print(f"Telemetry collector unreachable, dropped {len(batch) + len(self.records)} "
+                              f"queued records: {e}")
+                        self.records_dropped += len(batch) + len(self.records)
+                        self.records.clear()
+                    return
+                with self.condition:
+                    self.condition.wait(backoff if remaining is None else min(backoff, remaining))
+                backoff = min(self.max_backoff, backoff * 2)
+                continue
+            self.records_sent += len(batch)
+            self.batches_sent += 1
+            batch = []
+            backoff = 0.5
+
+    def _send(self, frame):
+        if self.protocol == "udp":
+            if self.sock is None:
+                self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.sock.sendto(frame, (self.host, self.port))
+            return
+        if self.sock is None:
+            # Blocks for up to timeout while the collector is not reading,
+            # which is what pushes back on the queue
+            self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self.sock.sendall(LENGTH.pack(len(frame)) + frame)
+
+    def _close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
@@ -0,0 +1,280 @@
+"""Collect telemetry from many detectors and serve per-driver and per-fleet counters
+
+Detectors stream binary record frames (see telemetry.py) over TCP or UDP.
+The collector aggregates them into counters that can be read as JSON over
+HTTP:
+
+    GET /            everything below
+    GET /drivers     counters per driver
+    GET /drivers/ID  counters of one driver
+    GET /fleets      counters per fleet
+    GET /fleets/ID   counters of one fleet
+    GET /stats       records and frames received by the collector
+
+Example:
+    python telemetry_collector.py --port 9500 --http-port 9501
+    python headless.py --source 0 --telemetry tcp://127.0.0.1:9500 --driver alice --fleet north
+    curl http://127.0.0.1:9501/fleets
+"""
+import argparse
+import collections
+import http.server
+import json
+import socketserver
+import threading
+import time
+import urllib.parse
+
+from telemetry import (KIND_NAMES, LENGTH, SESSION_START, SESSION_STOP, DROWSY_START, YAWN_START,
+                       EMERGENCY, FATIGUE_START, FPS_SAMPLE, LATENCY_SAMPLE, decode_frame)
+
+# Frames larger than this are rejected, which bounds what one connection can allocate
+MAX_FRAME = 1 << 20
+
+
+class DriverCounters:
+    """Aggregated records of one driver"""
+
+    def __init__(self, fleet):
+        self.fleet = fleet
+        self.events = collections.Counter()
+        self.sessions_active = 0
+        self.last_seen = None
+        self.fps = None
+        self.latency_ms = None
+        self.latency_sum = 0.0
+        self.latency_samples = 0
+        self.latency_max = 0.0
+
+    def add(self, records):
+        for kind, timestamp, count, value in records:
+            self.events[kind] += 1
+            if kind == SESSION_START:
+                self.sessions_active += 1
+            elif kind == SESSION_STOP:
+                self.sessions_active = max(0, self.sessions_active - 1)
+            elif kind == FPS_SAMPLE:
+                self.fps = value
+            elif kind == LATENCY_SAMPLE:
+                self.latency_ms = value
+                self.latency_sum += value
+                self.latency_samples += 1
+                self.latency_max = max(self.latency_max, value)
+            if self.last_seen is None or timestamp > self.last_seen:
+                self.last_seen = timestamp
+
+    def summary(self):
+        return {
+            "fleet": self.fleet,
+            "sessions_active": self.sessions_active,
+            "sessions": self.events[SESSION_START],
+            "drowsy_episodes": self.events[DROWSY_START],
+            "yawn_episodes": self.events[YAWN_START],
+            "fatigue_alerts": self.events[FATIGUE_START],
+            "emergency_alerts": self.events[EMERGENCY],
+            "fps": None if self.fps is None else round(self.fps, 2),
+            "latency_ms": None if self.latency_ms is None else round(self.latency_ms, 3),
+            "latency_mean_ms": round(self.latency_sum / self.latency_samples, 3) if self.latency_samples else None,
+            "latency_max_ms": round(self.latency_max, 3),
+            "last_seen": self.last_seen,
+            "events": {KIND_NAMES.get(kind, str(kind)): total for kind, total in sorted(self.events.items())},
+        }
+
+
+class TelemetryAggregator:
+    """Thread-safe per-driver counters fed with decoded frames
+
+    Each frame is applied under the lock in one go, so the lock is taken
+    once per batch rather than once per record.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.drivers = {}
+        self.started = time.time()
+        self.frames = 0
+        self.records = 0
+        self.bad_frames = 0
+
+    def add_frame(self, data):
+        try:
+            driver, fleet, records = decode_frame(data)
+        except ValueError:
+            with self.lock:
+                self.bad_frames += 1
+            return
+        with self.lock:
+            counters = self.drivers.get(driver)
+            if counters is None:
+                counters = self.drivers[driver] = DriverCounters(fleet)
+            counters.fleet = fleet
+            counters.add(records)
+            self.frames += 1
+            self.records += len(records)
+
+    def driver_summaries(self):
+        with self.lock:
+            return {driver: counters.summary() for driver, counters in self.drivers.items()}
+
+    def fleet_summaries(self):
+        fleets = {}
+        for driver, summary in self.driver_summaries().items():
+            fleet = fleets.setdefault(summary["fleet"], {
+                "drivers": 0, "sessions_active": 0, "sessions": 0, "drowsy_episodes": 0,
+                "yawn_episodes": 0, "fatigue_alerts": 0, "emergency_alerts": 0, "fps": [],
+            })
+            fleet["drivers"] += 1
+            for key in ("sessions_active", "sessions", "drowsy_episodes", "yawn_episodes",
+                        "fatigue_alerts", "emergency_alerts"):
+                fleet[key] += summary[key]
+            if summary["fps"] is not None:
+                fleet["fps"].append(summary["fps"])
+        for fleet in fleets.values():
+            rates = fleet.pop("fps")
+            fleet["mean_fps"] = round(sum(rates) / len(rates), 2) if rates else None
+        return fleets
+
+    def stats(self):
+        with self.lock:
+            elapsed = time.time() - self.started
+            return {
+                "uptime_s": round(elapsed, 1),
+                "frames": self.frames,
+                "records": self.records,
+                "bad_frames": self.bad_frames,
+                "records_per_s": round(self.records / elapsed, 1) if elapsed else 0.0,
+                "drivers": len(self.drivers),
+            }
+
+
+class _TCPHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        aggregator = self.server.aggregator
+        while True:
+            header = self.rfile.read(LENGTH.size)
+            if len(header) < LENGTH.size:
+                return
+            (length,) = LENGTH.unpack(header)
+            if length > MAX_FRAME:
+                with aggregator.lock:
+                    aggregator.bad_frames += 1
+                return
+            data = self.rfile.read(length)
+            if len(data) < length:
+                return
+            aggregator.add_frame(data)
+
+
+class _UDPHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        self.server.aggregator.add_frame(self.request[0])
+
+
+class _HTTPHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        aggregator = self.server.aggregator
+        parts = [urllib.parse.unquote(part) for part in self.path.split("?")[0].strip("/").split("/") if part]
+        if not parts:
+            body = {"stats": aggregator.stats(), "fleets": aggregator.fleet_summaries(),
+                    "drivers": aggregator.driver_summaries()}
+        elif parts[0] == "stats" and len(parts) == 1:
+            body = aggregator.stats()
+        elif parts[0] in ("drivers", "fleets") and len(parts) <= 2:
+            items = aggregator.driver_summaries() if parts[0] == "drivers" else aggregator.fleet_summaries()
+            body = items if len(parts) == 1 else items.get(parts[1])
+        else:
+            body = None
+        if body is None:
+            self.send_error(404)
+            return
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _ThreadingTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    # Room for a fleet of detectors reconnecting at once
+    request_queue_size = 128
+
+
+class TelemetryCollector:
+    """TCP and UDP receivers plus the HTTP endpoint around one aggregator
+
+    Ports of 0 pick free ports, which are available from the *_port
+    properties after start(). A port of None disables that receiver.
+    """
+
+    def __init__(self, host="127.0.0.1", tcp_port=9500, udp_port=9500, http_port=9501):
+        self.aggregator = TelemetryAggregator()
+        self.servers = []
+        self.tcp = self.udp = self.http = None
+        if tcp_port is not None:
+            self.tcp = self._add(_ThreadingTCPServer((host, tcp_port), _TCPHandler))
+        if udp_port is not None:
+            self.udp = self._add(socketserver.UDPServer((host, udp_port), _UDPHandler))
+        if http_port is not None:
+            self.http = self._add(http.server.ThreadingHTTPServer((host, http_port), _HTTPHandler))
+
+    def _add(self, server):
+        server.aggregator = self.aggregator
+        self.servers.append(server)
+        return server
+
+    @property
+    def tcp_port(self):
+        return self.tcp.server_address[1]
+
+    @property
+    def udp_port(self):
+        return self.udp.server_address[1]
+
+    @property
+    def http_port(self):
+        return self.http.server_address[1]
+
+    def start(self):
+        for server in self.servers:
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Aggregate telemetry from drowsiness detectors")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=9500, help="TCP and UDP port for telemetry (default: 9500)")
+    parser.add_argument("--http-port", type=int, default=9501, help="port of the JSON counters endpoint (default: 9501)")
+    parser.add_argument("--report-interval", type=float, default=10.0,
+                        help="print collector stats every N seconds (0 = never)")
+    args = parser.parse_args(argv)
+
+    collector = TelemetryCollector(args.host, args.port, args.port, args.http_port).start()
+    print(f"Receiving telemetry on tcp/udp {args.host}:{collector.tcp_port}, "
+          f"counters at http://{args.host}:{collector.http_port}/")
+    try:
+        while True:
+            time.sleep(args.report_interval or 3600)
+            if args.report_interval:
+                stats = collector.aggregator.stats()
+                print(f"{stats['drivers']} drivers, {stats['records']} records "
+                      f"({stats['records_per_s']:.0f}/s), {stats['bad_frames']} bad frames")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        collector.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+import types
+
+import pytest
+
+from pipeline import AdaptiveScheduler, AlertState
+
+FPS = 30
+CONSECUTIVE_FRAMES = 20
+
+
+def alarm_delay(scheduler, closed_at):
+    """Seconds by which a frame-count alarm comes later than with every frame analysed"""
+    scheduler.reset()
+    state = AlertState()
+    pipeline = types.SimpleNamespace(face_states={0: state}, eye_aspect_ratio_threshold=0.25, yawn_threshold=30)
+    first_closed = None
+    for index in range(10 * FPS):
+        timestamp = index / FPS
+        closed = timestamp >= closed_at
+        if closed and first_closed is None:
+            first_closed = timestamp
+        if not scheduler.due(timestamp):
+            continue
+        state.counter = state.counter + 1 if closed else 0
+        if state.counter >= CONSECUTIVE_FRAMES:
+            return timestamp - (first_closed + (CONSECUTIVE_FRAMES - 1) / FPS)
+        face = types.SimpleNamespace(ear=0.15 if closed else 0.40, mouth_distance=10)
+        scheduler.schedule(pipeline, types.SimpleNamespace(timestamp=timestamp, faces=[face]))
+    raise AssertionError("no alarm")
+
+
+@pytest.mark.parametrize("min_rate, max_rate", [(5, None), (5, 10), (2, 10), (2, 30)])
+def test_alarm_delay_is_bounded_by_min_rate(min_rate, max_rate):
+    scheduler = AdaptiveScheduler(min_rate, max_rate)
+    # Eyes closing at every phase relative to the analysed frames
+    delays = [alarm_delay(scheduler, 3.0 + offset / 100) for offset in range(60)]
+    assert max(delays) <= scheduler.max_delay() + 1e-9
+
+
+def test_calm_driver_is_analysed_at_min_rate():
+    scheduler = AdaptiveScheduler(5, 30)
+    pipeline = types.SimpleNamespace(face_states={0: AlertState()}, eye_aspect_ratio_threshold=0.25,
+                                     yawn_threshold=30)
+    face = types.SimpleNamespace(ear=0.40, mouth_distance=10)
+    analysed = 0
+    for index in range(FPS * 4):
+        timestamp = index / FPS
+        if scheduler.due(timestamp):
+            analysed += 1
+            scheduler.schedule(pipeline, types.SimpleNamespace(timestamp=timestamp, faces=[face]))
+    # due() accepts frames up to a quarter interval early
+    assert analysed <= 4 * 5 / 0.75 + 1
@@ -0,0 +1,112 @@
+import pytest
+
+from alerts import AlertDispatcher, SMTPTransport, HTTPTransport, FakeSMTPServer, FakeHTTPServer
+
+
+@pytest.fixture
+def smtp_server():
+    server = FakeSMTPServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def http_server():
+    server = FakeHTTPServer().start()
+    yield server
+    server.stop()
+
+
+def dispatch(transports, submit, **options):
+    """Submit alerts, let stop() deliver them and return the metrics"""
+    options.setdefault("backoff", 0.01)
+    dispatcher = AlertDispatcher(transports, **options).start()
+    try:
+        submit(dispatcher)
+    finally:
+        dispatcher.stop(timeout=10)
+    return dispatcher.metrics()
+
+
+def test_email_delivered_over_smtp(smtp_server):
+    transport = SMTPTransport("127.0.0.1", smtp_server.port, sender="detector@localhost")
+    metrics = dispatch({"email": transport},
+                       lambda d: d.submit("email", "contact@example.com", "Drowsiness", "Driver asleep"))
+
+    assert metrics["email"]["sent"] == 1
+    assert metrics["email"]["failed"] == 0
+    [message] = smtp_server.received
+    assert message["from"] == "detector@localhost"
+    assert message["to"] == ["contact@example.com"]
+    assert "Subject: Drowsiness" in message["data"]
+    assert "Driver asleep" in message["data"]
+
+
+def test_webhook_delivered_over_http(http_server):
+    metrics = dispatch({"http": HTTPTransport(http_server.url)},
+                       lambda d: d.submit("http", "dispatch", "Drowsiness", "Driver asleep"))
+
+    assert metrics["http"]["sent"] == 1
+    assert http_server.received == [{"channel": "http", "recipient": "dispatch",
+                                     "subject": "Drowsiness", "body": "Driver asleep"}]
+
+
+def test_connections_are_reused(http_server):
+    def submit(dispatcher):
+        for i in range(5):
+            dispatcher.submit("http", "dispatch", f"Alert {i}", "body")
+
+    metrics = dispatch({"http": HTTPTransport(http_server.url, pool_size=1)}, submit, workers=1)
+
+    assert metrics["http"]["sent"] == 5
+    assert len(http_server.received) == 5
+    assert http_server.connections == 1
+
+
+def test_failed_delivery_is_retried(smtp_server, http_server):
+    smtp_server.fail_next = 2
+    http_server.fail_next = 2
+
+    def submit(dispatcher):
+        dispatcher.submit("email", "contact@example.com", "Drowsiness", "body")
+        dispatcher.submit("http", "dispatch", "Drowsiness", "body")
+
+    metrics = dispatch({"email": SMTPTransport("127.0.0.1", smtp_server.port),
+                        "http": HTTPTransport(http_server.url)}, submit)
+
+    for channel in ("email", "http"):
+        assert metrics[channel]["sent"] == 1
+        assert metrics[channel]["retries"] == 2
+        assert metrics[channel]["failed"] == 0
+    assert len(smtp_server.received) == 1
+    assert len(http_server.received) == 1
+
+
+def test_delivery_fails_after_last_retry(http_server):
+    http_server.fail_next = 3
+    metrics = dispatch({"http": HTTPTransport(http_server.url)},
+                       lambda d: d.submit("http", "dispatch", "Drowsiness", "body"), retries=2)
+
+    assert metrics["http"]["sent"] == 0
+    assert metrics["http"]["retries"] == 2
+    assert metrics["http"]["failed"] == 1
+    assert http_server.received == []
+
+
+def test_duplicate_alerts_are_sent_once(http_server):
+    def submit(dispatcher):
+        assert dispatcher.submit("http", "dispatch", "Drowsiness", "first")
+        assert not dispatcher.submit("http", "dispatch", "Drowsiness", "again")
+        assert dispatcher.submit("http", "dispatch", "Drowsiness", "forced", dedup=False)
+
+    metrics = dispatch({"http": HTTPTransport(http_server.url)}, submit)
+
+    assert metrics["http"]["sent"] == 2
+    assert metrics["http"]["deduplicated"] == 1
+    assert sorted(alert["body"] for alert in http_server.received) == ["first", "forced"]
+
+
+def test_unknown_channel_is_rejected():
+    dispatcher = AlertDispatcher({})
+    with pytest.raises(ValueError):
+        dispatcher.submit("sms", "+100", "Drowsiness", "body")
@@ -0,0 +1,73 @@
+import time
+
+import numpy as np
+import pytest
+
+import capture
+from buffers import BufferPool
+from capture import FrameGrabber
+
+
+class FakeCamera:
+    """30 fps camera whose frames are filled with their index"""
+
+    fps = 30.0
+
+    def __init__(self, source):
+        self.index = 0
+
+    def isOpened(self):
+        return True
+
+    def read(self, image=None):
+        time.sleep(1.0 / self.fps)
+        if image is None:
+            image = np.empty((48, 64, 3), np.uint8)
+        self.index += 1
+        image[...] = self.index % 256
+        return True, image
+
+    def get(self, prop):
+        return self.index * 1000.0 / self.fps
+
+    def release(self):
+        pass
+
+
+@pytest.fixture
+def camera(monkeypatch):
+    monkeypatch.setattr(capture.cv2, "VideoCapture", FakeCamera)
+
+
+@pytest.mark.parametrize("buffers", [None, BufferPool(8)])
+def test_frames_held_by_slow_consumer_stay_intact(camera, buffers):
+    grabber = FrameGrabber(0, buffers=buffers)
+    assert grabber.start()
+    held = []
+    try:
+        for _ in range(5):
+            frame, _ = grabber.read(timeout=1.0)
+            held.append((frame, int(frame[0, 0, 0])))
+            # Slower than the slots of the pool last at the camera's rate
+            time.sleep(0.35)
+    finally:
+        grabber.stop()
+
+    assert grabber.frames_dropped > 0
+    for frame, value in held:
+        assert frame.min() == frame.max() == value
+    if buffers is not None:
+        assert buffers.allocations == 1
+
+
+def test_every_frame_read_in_order_without_dropping(camera):
+    buffers = BufferPool(8)
+    grabber = FrameGrabber(0, drop_frames=False, buffers=buffers)
+    assert grabber.start()
+    try:
+        values = [int(grabber.read(timeout=1.0)[0][0, 0, 0]) for _ in range(20)]
+    finally:
+        grabber.stop()
+
+    assert values == list(range(values[0], values[0] + 20))
+    assert grabber.frames_dropped == 0
@@ -0,0 +1,44 @@
+import threading
+
+from instrumentation import StageTimings, STAGES, FACE_DETECTION, LANDMARKS
+
+
+def test_queues_only_summarised_once_recorded():
+    timings = StageTimings()
+    assert "queues" not in timings.summary()
+
+    timings.record_queue(LANDMARKS, 2)
+    timings.record_queue(LANDMARKS, 0)
+    assert timings.summary()["queues"] == {LANDMARKS: {"depth": 0, "mean": 1.0, "max": 2}}
+
+
+def test_summary_while_stages_record():
+    timings = StageTimings()
+    stop = threading.Event()
+    errors = []
+
+    def stage(name):
+        depth = 0
+        while not stop.is_set():
+            timings.record_queue(name, depth % 3)
+            depth += 1
+
+    def reader():
+        try:
+            for _ in range(2000):
+                timings.summary()
+                timings.format_lines()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=stage, args=(name,)) for name in STAGES]
+    for thread in threads:
+        thread.start()
+    reader()
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert set(timings.summary()["queues"]) == set(STAGES)
+    assert timings.summary()["queues"][FACE_DETECTION]["max"] == 2
@@ -0,0 +1,60 @@
+import types
+
+import dlib
+import numpy as np
+
+from pipeline import (FramePipeline, face_metrics, eye_aspect_ratio, LEFT_EYE_START, LEFT_EYE_END,
+                      RIGHT_EYE_START, RIGHT_EYE_END, MOUTH_TOP, MOUTH_BOTTOM)
+
+
+def random_faces(count, seed=3):
+    return np.random.default_rng(seed).integers(0, 200, (count, 68, 2)).astype(np.int32)
+
+
+class FakePredictor:
+    """Landmarks of the random face at the index given by each rectangle's left edge"""
+
+    def __init__(self, faces):
+        self.faces = faces
+
+    def __call__(self, gray, rect):
+        points = self.faces[rect.left()]
+        parts = [types.SimpleNamespace(x=int(x), y=int(y)) for x, y in points]
+        return types.SimpleNamespace(num_parts=68, part=parts.__getitem__)
+
+
+def test_single_face_metrics():
+    face = random_faces(1)[0]
+    ear, mouth_distance = face_metrics(face)
+
+    expected = (eye_aspect_ratio(face[LEFT_EYE_START:LEFT_EYE_END]) +
+                eye_aspect_ratio(face[RIGHT_EYE_START:RIGHT_EYE_END])) / 2
+    assert np.isclose(ear, expected)
+    assert mouth_distance == abs(face[MOUTH_TOP, 1] - face[MOUTH_BOTTOM, 1])
+
+
+def test_batch_metrics_match_single_faces():
+    faces = random_faces(5)
+    ears, mouth_distances = face_metrics(faces)
+
+    assert ears.shape == mouth_distances.shape == (5,)
+    for face, ear, mouth_distance in zip(faces, ears, mouth_distances):
+        single_ear, single_mouth_distance = face_metrics(face)
+        assert np.isclose(ear, single_ear)
+        assert mouth_distance == single_mouth_distance
+
+
+def test_every_face_measured_in_multi_face_mode():
+    faces = random_faces(3)
+    rects = [dlib.rectangle(index, 10, index + 50, 60) for index in range(3)]
+    pipeline = FramePipeline(detector=lambda gray, upsample: rects, predictor=FakePredictor(faces), load=False)
+    pipeline.multi_face = True
+
+    result = pipeline.measure(np.zeros((120, 160, 3), np.uint8), 0.0)
+
+    assert len(result.faces) == 3
+    for face, landmarks in zip(sorted(result.faces, key=lambda face: face.rect.left()), faces):
+        assert (face.landmarks == landmarks).all()
+        ear, mouth_distance = face_metrics(landmarks)
+        assert np.isclose(face.ear, ear)
+        assert face.mouth_distance == mouth_distance
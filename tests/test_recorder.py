@@ -0,0 +1,49 @@
+import types
+
+import dlib
+import numpy as np
+
+from pipeline import FramePipeline
+from recorder import MetricsRecorder, load_metrics
+
+
+class FakePredictor:
+    """Open eyes and a closed mouth at the same points for every face"""
+
+    def __init__(self):
+        points = np.zeros((68, 2), int)
+        points[36:48] = [(0, 5), (2, 3), (4, 3), (6, 5), (4, 7), (2, 7)] * 2
+        self.parts = [types.SimpleNamespace(x=int(x), y=int(y)) for x, y in points]
+
+    def __call__(self, gray, rect):
+        return types.SimpleNamespace(num_parts=68, part=self.parts.__getitem__)
+
+
+def two_face_pipeline():
+    faces = [dlib.rectangle(10, 10, 110, 110), dlib.rectangle(200, 20, 260, 80)]
+    return FramePipeline(detector=lambda gray, upsample: faces, predictor=FakePredictor(), load=False)
+
+
+def test_face_count_includes_faces_that_are_not_monitored(tmp_path):
+    pipeline = two_face_pipeline()
+    recorder = MetricsRecorder(capacity=2)
+    frame = np.zeros((240, 320, 3), np.uint8)
+    for timestamp in (0.0, 0.1, 0.2):
+        result = pipeline.process(frame, timestamp)
+        recorder.record(result)
+
+    # Only the largest face is measured in single-face mode
+    assert len(result.faces) == 1
+    assert result.detected_count == 2
+    recorded = load_metrics(recorder.save(str(tmp_path / "metrics.npz")))
+    assert recorded["face_count"].tolist() == [2, 2, 2]
+    assert np.allclose(recorded["ear"], result.ear)
+
+
+def test_skipped_frames_repeat_the_face_count():
+    pipeline = two_face_pipeline()
+    measured = pipeline.process(np.zeros((240, 320, 3), np.uint8), 0.0)
+    skipped = pipeline.skip(0.05)
+
+    assert skipped.skipped
+    assert skipped.detected_count == measured.detected_count == 2
@@ -0,0 +1,69 @@
+import datetime
+import random
+
+import pytest
+
+from session_store import SessionStore, week_start, COUNTERS
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SessionStore(str(tmp_path / "fatigue_log.db"))
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def sessions(store):
+    rng = random.Random(7)
+    first = datetime.date(2024, 1, 1)
+    sessions = []
+    for _ in range(300):
+        session = {
+            "date": str(first + datetime.timedelta(days=rng.randrange(90))),
+            "time": "08:00:00",
+            "duration": f"0:{rng.randrange(60):02d}:00",
+            "user": rng.choice(["alice", "bob"]),
+            "drowsy_episodes": rng.randrange(5),
+            "yawn_episodes": rng.randrange(5),
+            "emergency_alerts": rng.randrange(2),
+        }
+        store.add(session)
+        sessions.append(session)
+    return sessions
+
+
+def expected_weeks(sessions, start, end, user=None):
+    weeks = {}
+    for session in sessions:
+        if str(start) <= session["date"] <= str(end) and user in (None, session["user"]):
+            week = weeks.setdefault(str(week_start(session["date"])), [0, 0, 0, 0])
+            week[0] += 1
+            week[1] += session["drowsy_episodes"]
+            week[2] += session["yawn_episodes"]
+            week[3] += session["emergency_alerts"]
+    return weeks
+
+
+@pytest.mark.parametrize("start, end", [
+    ("2024-01-01", "2024-03-31"),  # Monday to Sunday: whole weeks only
+    ("2024-01-10", "2024-02-22"),  # cut weeks at both ends
+    ("2024-01-10", "2024-01-12"),  # within one week
+    ("2024-01-13", "2024-01-16"),  # across one week boundary
+])
+@pytest.mark.parametrize("user", [None, "alice"])
+def test_weekly_only_counts_sessions_in_range(store, sessions, start, end, user):
+    weeks = store.weekly(start, end, user)
+
+    assert {week["week"]: [week["session_count"], week["drowsy_episodes"], week["yawn_episodes"],
+                           week["emergency_alerts"]] for week in weeks} == expected_weeks(sessions, start, end, user)
+    totals = store.totals(start, end, user)
+    for name in COUNTERS:
+        assert sum(week[name] for week in weeks) == pytest.approx(totals[name])
+
+
+def test_weekly_without_range_matches_rollups(store, sessions):
+    weeks = store.weekly()
+
+    assert [week["week"] for week in weeks] == sorted({str(week_start(s["date"])) for s in sessions})
+    assert sum(week["session_count"] for week in weeks) == len(sessions)
@@ -0,0 +1,92 @@
+import itertools
+import threading
+import time
+
+from instrumentation import StageTimings
+from pipeline import FrameResult
+from staged import StagedPipeline
+
+
+class FakeGrabber:
+    """Hands out the numbers 0 to count - 1 as frames, or without end like a camera"""
+
+    def __init__(self, count=None):
+        self.frames = itertools.count() if count is None else iter(range(count))
+        self.buffer = ()
+        self.finished = False
+
+    def read(self, timeout=None):
+        frame = next(self.frames, None)
+        if frame is None:
+            self.finished = True
+            return None
+        return frame, float(frame)
+
+
+class FakePipeline:
+    """Measures every frame, failing on the ones in fail_on"""
+
+    def __init__(self, fail_on=(), delay=0.0):
+        self.timings = StageTimings()
+        self.fail_on = set(fail_on)
+        self.delay = delay
+        self.lock = threading.Lock()
+
+    def due(self, timestamp):
+        return True
+
+    def detect(self, frame):
+        return None, [frame], [None], 1
+
+    def measure_faces(self, gray, rects, face_ids, detected_count, timestamp):
+        time.sleep(self.delay)
+        with self.lock:
+            if timestamp in self.fail_on:
+                self.fail_on.discard(timestamp)
+                raise RuntimeError("predictor failed")
+        return FrameResult(timestamp)
+
+    def finish(self, result):
+        return result
+
+    def skip(self, timestamp):
+        return FrameResult(timestamp)
+
+
+def read_frames(stages, count=None, timeout=5.0):
+    """Frames read until the end, or the first count frames"""
+    frames = []
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and len(frames) != count:
+        item = stages.read(timeout=0.5)
+        if item is None:
+            if stages.finished:
+                return frames
+            continue
+        frames.append(item[0])
+        assert len(stages.pending) <= stages.max_pending
+    if len(frames) != count:
+        raise AssertionError(f"read() stalled after frames {frames[-5:]}")
+    return frames
+
+
+def test_frames_come_out_in_order():
+    stages = StagedPipeline(FakePipeline(delay=0.001), FakeGrabber(50), landmark_workers=3).start()
+    try:
+        assert read_frames(stages) == list(range(50))
+    finally:
+        stages.stop()
+
+
+def test_failed_landmark_worker_skips_its_frame():
+    # A camera does not end, so the frame cannot wait for all workers to end
+    stages = StagedPipeline(FakePipeline(fail_on={7.0}, delay=0.001), FakeGrabber(),
+                            landmark_workers=2).start()
+    try:
+        frames = read_frames(stages, count=40)
+    finally:
+        stages.stop()
+
+    # The other worker carries on with the rest of the frames
+    assert frames == [frame for frame in range(41) if frame != 7]
+
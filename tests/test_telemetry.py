@@ -0,0 +1,110 @@
+import json
+import socket
+import time
+import urllib.request
+
+import pytest
+
+from telemetry import (TelemetryClient, encode_frame, decode_frame, parse_address, RECORD,
+                       SESSION_START, SESSION_STOP, DROWSY_START, YAWN_START, FPS_SAMPLE)
+from telemetry_collector import TelemetryCollector
+
+
+@pytest.fixture
+def collector():
+    collector = TelemetryCollector(tcp_port=0, udp_port=0, http_port=0).start()
+    yield collector
+    collector.stop()
+
+
+def wait_for_records(collector, count, timeout=5.0):
+    """Wait until the collector has applied count records"""
+    deadline = time.monotonic() + timeout
+    while collector.aggregator.stats()["records"] < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return collector.aggregator.stats()["records"]
+
+
+def send_session(client, drowsy=3):
+    client.emit(SESSION_START, timestamp=100.0)
+    for i in range(drowsy):
+        client.emit(DROWSY_START, count=i + 1, timestamp=101.0 + i)
+    client.emit(YAWN_START, timestamp=110.0)
+    client.emit(FPS_SAMPLE, 29.5, timestamp=111.0)
+    client.emit(SESSION_STOP, timestamp=120.0)
+    return drowsy + 4
+
+
+def test_frame_round_trip():
+    records = [RECORD.pack(SESSION_START, 100.0, 0, 0.0), RECORD.pack(FPS_SAMPLE, 101.5, 3, 29.5)]
+    driver, fleet, decoded = decode_frame(encode_frame("alice", "north", records))
+
+    assert (driver, fleet) == ("alice", "north")
+    assert decoded == [(SESSION_START, 100.0, 0, 0.0), (FPS_SAMPLE, 101.5, 3, 29.5)]
+
+
+@pytest.mark.parametrize("data", [b"", b"XX\x01\x00\x00\x00\x00",
+                                  encode_frame("alice", "", [RECORD.pack(SESSION_START, 1.0, 0, 0.0)])[:-1]])
+def test_invalid_frames_are_rejected(data):
+    with pytest.raises(ValueError):
+        decode_frame(data)
+
+
+def test_parse_address():
+    assert parse_address("10.0.0.5:9500") == ("tcp", "10.0.0.5", 9500)
+    assert parse_address("udp://collector:9600") == ("udp", "collector", 9600)
+    with pytest.raises(ValueError):
+        parse_address("http://collector:9600")
+
+
+@pytest.mark.parametrize("protocol", ["tcp", "udp"])
+def test_records_reach_the_collector(collector, protocol):
+    port = collector.tcp_port if protocol == "tcp" else collector.udp_port
+    client = TelemetryClient(f"{protocol}://127.0.0.1:{port}", "alice", "north",
+                             batch_size=4, flush_interval=0.05).start()
+    sent = send_session(client)
+    client.stop()
+
+    assert client.metrics()["records_sent"] == sent
+    assert client.metrics()["records_dropped"] == 0
+    assert wait_for_records(collector, sent) == sent
+    summary = collector.aggregator.driver_summaries()["alice"]
+    assert summary["fleet"] == "north"
+    assert summary["sessions"] == 1
+    assert summary["sessions_active"] == 0
+    assert summary["drowsy_episodes"] == 3
+    assert summary["yawn_episodes"] == 1
+    assert summary["fps"] == 29.5
+
+
+def test_counters_served_over_http(collector):
+    for driver in ("alice", "bob"):
+        client = TelemetryClient(f"tcp://127.0.0.1:{collector.tcp_port}", driver, "north",
+                                 flush_interval=0.05).start()
+        send_session(client, drowsy=2)
+        client.stop()
+    wait_for_records(collector, 12)
+
+    base = f"http://127.0.0.1:{collector.http_port}"
+    with urllib.request.urlopen(f"{base}/fleets/north") as response:
+        fleet = json.load(response)
+    assert fleet["drivers"] == 2
+    assert fleet["drowsy_episodes"] == 4
+    with urllib.request.urlopen(f"{base}/drivers/bob") as response:
+        assert json.load(response)["sessions"] == 1
+
+
+def test_records_dropped_when_collector_is_down():
+    # A port nothing listens on
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    client = TelemetryClient(f"tcp://127.0.0.1:{port}", "alice", flush_interval=0.05).start()
+    sent = send_session(client)
+    client.stop(timeout=0.5)
+
+    metrics = client.metrics()
+    assert metrics["records_sent"] == 0
+    assert metrics["records_dropped"] == sent
+    assert metrics["send_errors"] >= 1
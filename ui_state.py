@@ -0,0 +1,52 @@
+import collections
+import threading
+
+# Everything the Tk widgets show about the running session, published by the
+# video thread once per frame and applied on the Tk thread by a refresher
+UISnapshot = collections.namedtuple("UISnapshot", [
+    "frame",
+    "ear",
+    "mouth_distance",
+    "eye_status",
+    "yawn_status",
+    "alarm_on",
+    "yawn_alarm_on",
+    "fatigue_alarm_on",
+    "fatigue",  # FatigueMetrics.summary()
+    "drowsy_episodes",
+    "yawn_episodes",
+    "emergency_alerts",
+    "last_alert_time",
+])
+
+
+class LatestValue:
+    """Thread-safe slot that only keeps the most recently published value
+
+    Publishers never block on the reader; a reader that falls behind simply
+    skips the intermediate values.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._value = None
+        self._version = 0
+        self._taken_version = 0
+
+    def publish(self, value):
+        with self._lock:
+            self._value = value
+            self._version += 1
+
+    def take(self):
+        """Return the latest value if it has not been taken yet, else None"""
+        with self._lock:
+            if self._version == self._taken_version:
+                return None
+            self._taken_version = self._version
+            return self._value
+
+    def clear(self):
+        with self._lock:
+            self._value = None
+            self._taken_version = self._version